@@ -4,10 +4,41 @@ from flask_batteries_included.config import is_production_environment
 from waitress import serve
 
 from .app import create_app
+from .helpers.mllp import MllpServer
+from .helpers.prefork import PreforkServer
 
 SERVER_PORT = os.getenv("SERVER_PORT", 5000)
+MLLP_SERVER_PORT = os.getenv("MLLP_SERVER_PORT", None)
 
 if __name__ == "__main__":
     app = create_app()
     app.config["USE_HL7_MSG_CONVERTER"] = os.getenv("USE_HL7_MSG_CONVERTER", None)
-    serve(app, host="0.0.0.0", port=SERVER_PORT)  # NOSONAR
+    if app.config["SERVER_WORKERS"] > 1:
+        # Fork several server processes, each with its own MLLP listener if enabled.
+        PreforkServer(
+            app,
+            host="0.0.0.0",  # NOSONAR
+            port=int(SERVER_PORT),
+            workers=app.config["SERVER_WORKERS"],
+            threads=app.config["SERVER_THREADS"],
+            max_requests=app.config["SERVER_MAX_REQUESTS"],
+            max_requests_jitter=app.config["SERVER_MAX_REQUESTS_JITTER"],
+            graceful_timeout=app.config["SERVER_GRACEFUL_TIMEOUT_SEC"],
+            mllp_port=int(MLLP_SERVER_PORT) if MLLP_SERVER_PORT else None,
+        ).run()
+    else:
+        if MLLP_SERVER_PORT:
+            # Optionally accept HL7 messages over MLLP alongside the HTTP API.
+            MllpServer(
+                app,
+                host="0.0.0.0",  # NOSONAR
+                port=int(MLLP_SERVER_PORT),
+                max_workers=app.config["MLLP_MAX_WORKERS"],
+                encoding=app.config["MLLP_ENCODING"],
+            ).start()
+        serve(
+            app,
+            host="0.0.0.0",  # NOSONAR
+            port=SERVER_PORT,
+            threads=app.config["SERVER_THREADS"],
+        )
@@ -10,6 +10,7 @@ from flask_batteries_included.sqldb import db, init_db
 
 from dhos_connector_api import blueprint_api, blueprint_development
 from dhos_connector_api.config import init_config
+from dhos_connector_api.helpers import trustomer
 from dhos_connector_api.helpers.cli import add_cli_command
 
 
@@ -35,6 +36,9 @@ def create_app(
 
     init_config(app)
 
+    # Use the trustomer config from the last run until it has been fetched.
+    trustomer.load_config_snapshot(app)
+
     # Initialise k-b-i library to allow publishing to RabbitMQ.
     kombu_batteries_included.init()
 
@@ -1,13 +1,15 @@
 import os
-from typing import Dict, Optional
+from typing import Dict, List, Optional
 
 from flask import Blueprint, Response, current_app, jsonify, make_response, request
 from flask_batteries_included.helpers import schema
 from flask_batteries_included.helpers.security import protected_route
 from flask_batteries_included.helpers.security.endpoint_security import scopes_present
+from flask_batteries_included.sqldb import db
 from she_logging import logger
 
 from dhos_connector_api.blueprint_api import receive_controller, transmit_controller
+from dhos_connector_api.helpers import failed_requests
 from dhos_connector_api.models.hl7_message import Hl7Message
 
 api_blueprint = Blueprint("api", __name__)
@@ -61,6 +63,50 @@ def create_and_process_message(message_details: dict) -> Response:
     )
 
 
+@api_blueprint.route("/dhos/v1/message/batch", methods=["POST"])
+@protected_route(
+    scopes_present(required_scopes="write:hl7_message"),
+    allowed_issuers=[EPR_SERVICE_ADAPTER_ISSUER, INTERNAL_ISSUER],
+)
+def create_and_process_message_batch(batch_details: dict) -> Response:
+    """---
+    post:
+      summary: Submit a batch of new messages
+      description: >-
+        Submit a batch of HL7 messages to the platform in a single request.
+        The messages are saved together and ACKed synchronously, with the
+        ACKs returned in the same order as the submitted messages.
+      tags: [message]
+      requestBody:
+          description: "JSON body containing a list of base64-encoded HL7 messages"
+          required: true
+          content:
+            application/json:
+                schema:
+                    $ref: '#/components/schemas/MessageBatchRequest'
+                    x-body-name: batch_details
+      responses:
+        '200':
+            description: "An array of message responses, one per submitted message"
+            content:
+              application/json:
+                schema:
+                  type: array
+                  items: MessageResponse
+        default:
+            description: >-
+                Error, e.g. 400 Bad Request, 503 Service Unavailable
+            content:
+              application/json:
+                schema: Error
+    """
+    message_bodies: List[str] = [m["body"] for m in batch_details["messages"]]
+
+    return jsonify(
+        receive_controller.create_and_process_hl7_messages(bodies_b64=message_bodies)
+    )
+
+
 @api_blueprint.route("/dhos/v1/message/<message_uuid>", methods=["PATCH"])
 @protected_route(
     scopes_present(required_scopes="write:hl7_message"), allowed_issuers=INTERNAL_ISSUER
@@ -310,11 +356,19 @@ def create_cda_message() -> Response:
     # We track failed requests to Mirth by message uuid.
     try:
         transmit_controller.post_hl7_message(hl7_message_uuid=message_uuid)
-    except OSError:
+    except OSError as e:
         # We pass over this error because if we return an error code, rabbit will retry :(
         logger.warning(
-            "Failed to send ORU message, will be handled by failed request queue",
+            "Failed to send CDA message, will be retried by failed request queue",
             extra={"hl7_message_uuid": message_uuid},
         )
+        failed_requests.add_failed_request(
+            request_type="cda_message",
+            identifier=message_uuid,
+            fn=transmit_controller.post_hl7_message,
+            call_args={"hl7_message_uuid": message_uuid},
+            reason=str(e),
+        )
+        db.session.commit()
 
     return make_response("", 201)
@@ -1,76 +1,267 @@
 import base64
 import binascii
+import multiprocessing
 import sqlite3
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
 from importlib import import_module
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
 
 import kombu_batteries_included
-from flask import current_app
+from flask import Flask, current_app
 from flask_batteries_included.sqldb import db, generate_uuid
 from she_logging import logger
 from sqlalchemy import cast
-from sqlalchemy.exc import IntegrityError
+from sqlalchemy import inspect as sa_inspect
+from sqlalchemy import tuple_
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import make_transient_to_detached
 
+from dhos_connector_api.helpers import outbox
+from dhos_connector_api.helpers.background import PartitionedExecutor
 from dhos_connector_api.helpers.errors import (
     Hl7ApplicationErrorException,
     Hl7ApplicationRejectException,
 )
 from dhos_connector_api.helpers.hl7_wrapper import Hl7Wrapper
 from dhos_connector_api.helpers.parser import (
+    ADMITTED_AT_PATH,
+    ADT_FIELD_PATHS,
     generate_encounter_action,
     generate_location_action,
     generate_patient_action,
     parse_hl7_message,
+    parse_stored_hl7_message,
     validate_hl7_message,
+    validate_hl7_message_header,
 )
 from dhos_connector_api.models.hl7_message import Hl7Message
 
+# SCTID: 24891000000101 - EDI message (record artifact)
+EDI_MESSAGE_ROUTING_KEY = "dhos.24891000000101"
+
+# Key in app.extensions under which the ACK-first processing executor is stored.
+PROCESSING_EXECUTOR_KEY = "hl7_processing_executor"
+_processing_executor_lock = threading.Lock()
+
 
 def create_and_process_hl7_message(body_b64: str) -> Dict:
     logger.info("Received base64 encoded HL7 message")
-    message = Hl7Message()
-    message.uuid = generate_uuid()
-    message.content = body_b64  # Save the base64 encoded content initially
-    message.src_description = "tie"
-    message.dst_description = "dhos"
-    message.is_processed = False
-    db.session.add(message)
+    message: Hl7Message = _receive_hl7_message(body_b64, is_b64_encoded=True)
+    return _generate_ack_response(message)
+
+
+def create_and_process_raw_hl7_message(content: str) -> str:
+    """
+    Processes an HL7 message that has not been base64 encoded, e.g. one received by the
+    MLLP listener. Returns the (N)ACK HL7 message.
+    """
+    logger.info("Received HL7 message")
+    message: Hl7Message = _receive_hl7_message(content, is_b64_encoded=False)
+    return message.ack
+
+
+def _receive_hl7_message(content: str, is_b64_encoded: bool) -> Hl7Message:
+    message = _create_received_message(content)
 
     # Try to parse the message. If parsing fails, write what we can do the database so we can investigate
     # the error - we don't respond with a (N)ACK as we can't even parse the message (so can't refer to
     # it in the (N)ACK).
-    # 1) Decode the content and overwrite the model field.
-    # 2) Transform the message with any trust-specific logic.
-    # 3) Parse the message into HL7 wrapper structure
     try:
-        message.content = _decode_b64_message(body_b64)
-        logger.debug("Decoded HL7 message", extra={"hl7_message": message.content})
-        message.content = _transform_hl7_message(message.content)
-        logger.debug("Transformed incoming HL7 message")
-        hl7_wrapper: Hl7Wrapper = parse_hl7_message(message.content)
-        logger.debug("Parsed HL7 message")
+        hl7_wrapper: Hl7Wrapper = _parse_received_message(
+            message, is_b64_encoded=is_b64_encoded
+        )
     except ValueError as e:
         logger.error("Failed to parse incoming HL7 message: %s", str(e))
+        db.session.add(message)
         db.session.commit()
         raise
 
-    # Try to validate the message. If validation fails, handle the resulting exception and generate
-    # a (N)ACK.
+    # In ACK-first mode only the message header is validated before we respond, and the
+    # actions are generated in the background once the message has been saved.
     processed_message: Optional[Dict] = None
-    is_message_valid = True
+    if current_app.config["ACK_FIRST_PROCESSING"]:
+        _validate_message_header(message, hl7_wrapper)
+    else:
+        processed_message = _validate_and_process_message(message, hl7_wrapper)
+
+    # The message is inserted in a single statement that skips the insert if the message
+    # control ID has already been used, so duplicates are rejected without a rollback.
+    if not _insert_unless_duplicate(message):
+        # Message is a duplicate. Save it with an AR (N)ACK and without its message control ID.
+        _reject_duplicate_message(message, hl7_wrapper)
+        db.session.add(message)
+        processed_message = None
+
+    # When publishing via the outbox, the message to be published is saved in the same
+    # transaction as the HL7 message.
+    use_outbox: bool = current_app.config["PUBLISH_VIA_OUTBOX"]
+    if processed_message is not None and use_outbox:
+        outbox.add_message(routing_key=EDI_MESSAGE_ROUTING_KEY, body=processed_message)
+    db.session.commit()
+
+    # If validation succeeded, publish the message internally.
+    if processed_message is not None and not use_outbox:
+        _publish_processed_message(processed_message)
+
+    if message.awaiting_processing:
+        _submit_for_processing(message, hl7_wrapper)
+
+    return message
+
+
+def create_and_process_hl7_messages(bodies_b64: List[str]) -> List[Dict]:
+    """
+    Processes a batch of messages in the same way as `create_and_process_hl7_message`, but
+    saves them all in a single transaction. A duplicate message control ID (including one
+    repeated within the batch) only affects that message. The (N)ACKs are returned in the
+    same order as the messages were received.
+    """
+    logger.info("Received batch of %d base64 encoded HL7 messages", len(bodies_b64))
+    messages: List[Hl7Message] = [_create_received_message(b) for b in bodies_b64]
+
+    # Parse every message before saving any of them. If any message can't be parsed we
+    # can't (N)ACK it, so the whole batch is rejected and only the unparseable messages
+    # are saved for investigation. This means the batch can safely be resent.
+    hl7_wrappers: List[Hl7Wrapper] = []
+    unparseable: List[Hl7Message] = []
+    for idx, message in enumerate(messages):
+        try:
+            hl7_wrappers.append(_parse_received_message(message, is_b64_encoded=True))
+        except ValueError as e:
+            logger.error("Failed to parse HL7 message %d in batch: %s", idx, str(e))
+            unparseable.append(message)
+    if unparseable:
+        db.session.add_all(unparseable)
+        db.session.commit()
+        raise ValueError(
+            f"{len(unparseable)} of {len(messages)} HL7 messages in batch could not be parsed"
+        )
+
+    use_outbox: bool = current_app.config["PUBLISH_VIA_OUTBOX"]
+    ack_first: bool = current_app.config["ACK_FIRST_PROCESSING"]
+    processed_messages: List[Dict] = []
+    for message, hl7_wrapper in zip(messages, hl7_wrappers):
+        processed_message: Optional[Dict] = None
+        if ack_first:
+            _validate_message_header(message, hl7_wrapper)
+        else:
+            processed_message = _validate_and_process_message(message, hl7_wrapper)
+        if not _insert_unless_duplicate(message):
+            _reject_duplicate_message(message, hl7_wrapper)
+            db.session.add(message)
+            processed_message = None
+        elif processed_message is not None and use_outbox:
+            outbox.add_message(
+                routing_key=EDI_MESSAGE_ROUTING_KEY, body=processed_message
+            )
+        if processed_message is not None:
+            processed_messages.append(processed_message)
+
+    db.session.commit()
+    logger.info(
+        "Saved batch of %d HL7 messages, %d valid",
+        len(messages),
+        len(processed_messages),
+    )
+
+    if not use_outbox:
+        for processed_message in processed_messages:
+            _publish_processed_message(processed_message)
+
+    for message, hl7_wrapper in zip(messages, hl7_wrappers):
+        if message.awaiting_processing:
+            _submit_for_processing(message, hl7_wrapper)
+
+    return [_generate_ack_response(message) for message in messages]
+
+
+def _create_received_message(content: str) -> Hl7Message:
+    message = Hl7Message()
+    message.uuid = generate_uuid()
+    message.content = content  # Save the content as received initially
+    message.src_description = "tie"
+    message.dst_description = "dhos"
+    message.is_processed = False
+    return message
+
+
+def _parse_received_message(message: Hl7Message, is_b64_encoded: bool) -> Hl7Wrapper:
+    # 1) Decode the content (if required) and overwrite the model field.
+    # 2) Transform the message with any trust-specific logic.
+    # 3) Parse the message into HL7 wrapper structure
+    if is_b64_encoded:
+        message.content = _decode_b64_message(message.content)
+        logger.debug("Decoded HL7 message", extra={"hl7_message": message.content})
+    message.content = _transform_hl7_message(message.content)
+    logger.debug("Transformed incoming HL7 message")
+    hl7_wrapper: Hl7Wrapper = parse_hl7_message(
+        message.content, fast=current_app.config["FAST_ADT_EXTRACTION"]
+    )
+    logger.debug("Parsed HL7 message")
+    if current_app.config["STORE_PARSED_CONTENT"]:
+        # Lets the message be reprocessed later without parsing it again.
+        message.content_parsed = hl7_wrapper.to_parsed_representation(ADT_FIELD_PATHS)
+    return hl7_wrapper
+
+
+def _validate_and_process_message(
+    message: Hl7Message, hl7_wrapper: Hl7Wrapper
+) -> Optional[Dict]:
+    """
+    Try to validate the message. If validation fails, handle the resulting exception and generate
+    a (N)ACK. Returns the processed message to be published, or None if the message was rejected.
+    """
     try:
         validate_hl7_message(hl7_wrapper)
         logger.debug("Validated HL7 message")
-        message.patient_identifiers = hl7_wrapper.get_patient_identifiers_as_dict()
+        _populate_message_fields(message, hl7_wrapper)
+        message.ack = hl7_wrapper.generate_ack(ack_code="AA")
+        logger.info("Received message '%s' for processing", message.message_control_id)
+        return process_hl7_message(message.uuid, hl7_wrapper)
+    except Exception as e:
+        _set_error_ack(message, hl7_wrapper, e)
+    return None
+
+
+def _validate_message_header(message: Hl7Message, hl7_wrapper: Hl7Wrapper) -> None:
+    """
+    Validates only the message header, which is enough to (N)ACK the message. If the message
+    is accepted it is flagged as awaiting processing.
+    """
+    try:
+        validate_hl7_message_header(hl7_wrapper)
         message.message_type = hl7_wrapper.get_message_type_field()
-        message.sent_at = hl7_wrapper.get_message_datetime_iso8601(
-            default_timezone=current_app.config["SERVER_TIMEZONE"]
-        )
         message.message_control_id = hl7_wrapper.get_message_control_id()
         message.ack = hl7_wrapper.generate_ack(ack_code="AA")
-        logger.info("Received message '%s' for processing", message.message_control_id)
-        processed_message = process_hl7_message(message.uuid, hl7_wrapper)
-    except Hl7ApplicationRejectException as e:
+        message.awaiting_processing = True
+        logger.info("Accepted message '%s' for processing", message.message_control_id)
+    except Exception as e:
+        _set_error_ack(message, hl7_wrapper, e)
+
+
+def _populate_message_fields(message: Hl7Message, hl7_wrapper: Hl7Wrapper) -> None:
+    message.patient_identifiers = hl7_wrapper.get_patient_identifiers_as_dict()
+    message.message_type = hl7_wrapper.get_message_type_field()
+    message.sent_at = hl7_wrapper.get_message_datetime_iso8601(
+        default_timezone=current_app.config["SERVER_TIMEZONE"]
+    )
+    message.message_control_id = hl7_wrapper.get_message_control_id()
+
+
+def _set_error_ack(
+    message: Hl7Message, hl7_wrapper: Optional[Hl7Wrapper], e: Exception
+) -> None:
+    # Must be called while handling the exception, so that unexpected errors are logged
+    # with their traceback.
+    if hl7_wrapper is None:
+        # The stored message couldn't be parsed, so there is no header to (N)ACK it with and
+        # the ack it was given when it was received is kept.
+        logger.exception("Failed to process message: could not parse stored message")
+    elif isinstance(e, Hl7ApplicationRejectException):
         # Generate an AR (N)ACK message.
         logger.warning("Failed to process message: %s", e.reason)
         message.ack = e.wrapped_message.generate_ack(
@@ -78,8 +269,7 @@ def create_and_process_hl7_message(body_b64: str) -> Dict:
             error_code=str(Hl7ApplicationRejectException.__name__),
             error_msg=e.reason,
         )
-        is_message_valid = False
-    except Hl7ApplicationErrorException as e:
+    elif isinstance(e, Hl7ApplicationErrorException):
         # Generate an AE (N)ACK message.
         logger.warning("Failed to process message: %s", e.reason)
         message.ack = e.wrapped_message.generate_ack(
@@ -87,8 +277,7 @@ def create_and_process_hl7_message(body_b64: str) -> Dict:
             error_code=str(Hl7ApplicationErrorException.__name__),
             error_msg=e.reason,
         )
-        is_message_valid = False
-    except Exception as e:
+    else:
         # Generate an AE (N)ACK message. The error was not a custom exception raised by our
         # validation/processing, which means it is an unexpected error that we don't have
         # explicit checks for - worth flagging a bit more loudly than just a warning.
@@ -100,43 +289,298 @@ def create_and_process_hl7_message(body_b64: str) -> Dict:
             error_code=str(Hl7ApplicationErrorException.__name__),
             error_msg=f"Unexpected error: {type(e).__name__}",
         )
-        is_message_valid = False
 
-    try:
-        db.session.commit()
-    except IntegrityError as e:
-        if "unique constraint" not in str(e).lower():
-            # Unexpected error - re-raise.
-            raise
-        # Message is a duplicate. Generate an AR (N)ACK message. Set the message control ID
-        # to None so it can be saved in the database.
-        logger.warning("Failed to process message: duplicate message control ID")
-        message.ack = hl7_wrapper.generate_ack(
-            ack_code="AR",
-            error_code=str(Hl7ApplicationRejectException.__name__),
-            error_msg="HL7 message appears to be duplicate",
+
+def _submit_for_processing(message: Hl7Message, hl7_wrapper: Hl7Wrapper) -> None:
+    # Messages for the same patient are processed in the order they were received.
+    partition_key: str = message.uuid
+    if hl7_wrapper.contains_segment("PID"):
+        partition_key = (
+            hl7_wrapper.get_patient_identifier("MRN", default=None)
+            or hl7_wrapper.get_patient_identifier("NHS", default=None)
+            or partition_key
         )
-        message.message_control_id = None
+    app: Flask = current_app._get_current_object()  # type: ignore
+    _get_processing_executor(app).submit(
+        partition_key, _process_pending_in_app_context, app, message.uuid, hl7_wrapper
+    )
+
+
+def _get_processing_executor(app: Flask) -> PartitionedExecutor:
+    with _processing_executor_lock:
+        if PROCESSING_EXECUTOR_KEY not in app.extensions:
+            app.extensions[PROCESSING_EXECUTOR_KEY] = PartitionedExecutor(
+                num_partitions=app.config["ACK_FIRST_WORKERS"],
+                thread_name_prefix="hl7-processing",
+            )
+        return app.extensions[PROCESSING_EXECUTOR_KEY]
+
+
+def _process_pending_in_app_context(
+    app: Flask, message_uuid: str, hl7_wrapper: Hl7Wrapper
+) -> None:
+    with app.app_context():
+        try:
+            process_pending_hl7_message(message_uuid, hl7_wrapper)
+        except Exception:
+            # The message is left flagged as awaiting processing, so it will be picked up
+            # by the process-pending-messages command.
+            logger.exception("Failed to process pending HL7 message %s", message_uuid)
+            db.session.rollback()
+
+
+def process_pending_hl7_message(
+    message_uuid: str, hl7_wrapper: Optional[Hl7Wrapper] = None
+) -> None:
+    """
+    Generates and publishes the actions for a message that was ACKed in ACK-first mode. If the
+    message fails full validation its ack is replaced with the (N)ACK it would have received,
+    so that the failure is visible when the message is looked up.
+    """
+    message: Optional[Hl7Message] = (
+        Hl7Message.query.filter_by(uuid=message_uuid, awaiting_processing=True)
+        .with_for_update(skip_locked=True)
+        .first()
+    )
+    if message is None:
+        # Already processed elsewhere.
         db.session.rollback()
-        db.session.add(message)
-        db.session.commit()
-        is_message_valid = False
+        return
 
-    # If validation succeeded, publish the message internally.
-    if is_message_valid and processed_message is not None:
-        # Publish the message to the rest of the platform.
-        logger.debug(
-            "Publishing internal message to DHOS",
-            extra={"message_body": processed_message},
+    processed_message: Optional[Dict] = None
+    try:
+        if hl7_wrapper is None:
+            hl7_wrapper = parse_stored_hl7_message(
+                message.content,
+                message.content_parsed,
+                fast=current_app.config["FAST_ADT_EXTRACTION"],
+            )
+        validate_hl7_message(hl7_wrapper)
+        _populate_message_fields(message, hl7_wrapper)
+        processed_message = process_hl7_message(message.uuid, hl7_wrapper)
+    except Exception as e:
+        _set_error_ack(message, hl7_wrapper, e)
+        logger.warning(
+            "Message '%s' was rejected after being acknowledged",
+            message.message_control_id,
         )
-        # SCTID: 24891000000101 - EDI message (record artifact)
-        kombu_batteries_included.publish_message(
-            routing_key="dhos.24891000000101", body=processed_message
+    message.awaiting_processing = False
+
+    use_outbox: bool = current_app.config["PUBLISH_VIA_OUTBOX"]
+    if processed_message is not None and use_outbox:
+        outbox.add_message(routing_key=EDI_MESSAGE_ROUTING_KEY, body=processed_message)
+    db.session.commit()
+
+    if processed_message is not None and not use_outbox:
+        _publish_processed_message(processed_message)
+
+
+def process_pending_hl7_messages(min_age_seconds: int) -> int:
+    """
+    Processes messages that were ACKed in ACK-first mode but never processed, e.g. because the
+    server was restarted. Only messages at least `min_age_seconds` old are picked up, to avoid
+    racing the background workers. Returns the number of messages found.
+    """
+    cutoff: datetime = datetime.utcnow() - timedelta(seconds=min_age_seconds)
+    message_uuids: List[str] = [
+        uuid
+        for (uuid,) in db.session.query(Hl7Message.uuid)
+        .filter(Hl7Message.awaiting_processing.is_(True), Hl7Message.created < cutoff)
+        .order_by(Hl7Message.created)
+        .all()
+    ]
+    db.session.rollback()
+    logger.info("Found %d HL7 messages awaiting processing", len(message_uuids))
+    for message_uuid in message_uuids:
+        process_pending_hl7_message(message_uuid)
+    return len(message_uuids)
+
+
+def reprocess_hl7_messages(
+    received_after: Optional[datetime] = None,
+    received_before: Optional[datetime] = None,
+    message_type: Optional[str] = None,
+    is_processed: Optional[bool] = None,
+    ack_status: Optional[str] = None,
+    workers: int = 1,
+    batch_size: int = 100,
+    batch_interval: float = 0.0,
+) -> int:
+    """
+    Regenerates and republishes the actions for received messages matching the filters, e.g.
+    after a mapping fix. Messages are read in batches of `batch_size` and processed by a pool of
+    `workers` processes, with each batch of actions published (in the order the messages were
+    received) while the next batch is processed. `batch_interval` seconds are left between
+    published batches to throttle the load on consumers. Messages that fail validation, and
+    duplicates that were rejected (which are stored without a message control ID), are
+    skipped. Returns the number of messages republished.
+    """
+    query = Hl7Message.query.filter(
+        Hl7Message.src_description == "tie",
+        Hl7Message.message_control_id.isnot(None),
+    )
+    if received_after is not None:
+        query = query.filter(Hl7Message.created >= received_after)
+    if received_before is not None:
+        query = query.filter(Hl7Message.created < received_before)
+    if message_type is not None:
+        query = query.filter(Hl7Message.message_type == message_type)
+    if is_processed is not None:
+        query = query.filter(Hl7Message.is_processed.is_(is_processed))
+    if ack_status is not None:
+        query = query.filter(Hl7Message.ack_status_ == ack_status)
+
+    app: Flask = current_app._get_current_object()  # type: ignore
+    pool: Optional[ProcessPoolExecutor] = None
+    if workers > 1:
+        # Workers are forked so that they share the app, but they don't use the database.
+        pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("fork"),
+            initializer=_init_reprocess_worker,
+            initargs=(app,),
+        )
+
+    found: int = 0
+    published: int = 0
+    previous: Optional[Iterator[Optional[Dict]]] = None
+    try:
+        for rows in _query_reprocess_batches(query, batch_size):
+            found += len(rows)
+            current: Iterator[Optional[Dict]] = (
+                pool.map(
+                    _reprocess_message, rows, chunksize=max(1, len(rows) // workers)
+                )
+                if pool is not None
+                else map(_reprocess_message, rows)
+            )
+            if previous is not None:
+                published += _republish_batch(previous)
+                time.sleep(batch_interval)
+            previous = current
+        if previous is not None:
+            published += _republish_batch(previous)
+    finally:
+        if pool is not None:
+            pool.shutdown(wait=True)
+
+    logger.info("Republished %d of %d HL7 messages", published, found)
+    return published
+
+
+def _query_reprocess_batches(
+    query: Any, batch_size: int
+) -> Iterable[List[Tuple[str, str, Optional[Dict]]]]:
+    # Keyset pagination, so each batch is a short query and no cursor is held open.
+    query = query.with_entities(
+        Hl7Message.created,
+        Hl7Message.uuid,
+        Hl7Message.content,
+        Hl7Message.content_parsed,
+    ).order_by(Hl7Message.created, Hl7Message.uuid)
+    last: Optional[Tuple[datetime, str]] = None
+    while True:
+        batch_query = query
+        if last is not None:
+            batch_query = batch_query.filter(
+                tuple_(Hl7Message.created, Hl7Message.uuid) > last
+            )
+        rows = batch_query.limit(batch_size).all()
+        db.session.rollback()
+        if not rows:
+            return
+        last = (rows[-1].created, rows[-1].uuid)
+        yield [(row.uuid, row.content, row.content_parsed) for row in rows]
+
+
+def _init_reprocess_worker(app: Flask) -> None:
+    app.app_context().push()
+
+
+def _reprocess_message(row: Tuple[str, str, Optional[Dict]]) -> Optional[Dict]:
+    message_uuid, content, content_parsed = row
+    try:
+        hl7_wrapper: Hl7Wrapper = parse_stored_hl7_message(
+            content, content_parsed, fast=current_app.config["FAST_ADT_EXTRACTION"]
         )
-        logger.debug("Published internal message to DHOS")
+        validate_hl7_message(hl7_wrapper)
+        return process_hl7_message(message_uuid, hl7_wrapper)
+    except Exception as e:
+        logger.warning("Skipping HL7 message %s: %s", message_uuid, e)
+        return None
+
+
+def _republish_batch(processed_messages: Iterable[Optional[Dict]]) -> int:
+    to_publish: List[Dict] = [m for m in processed_messages if m is not None]
+    if current_app.config["PUBLISH_VIA_OUTBOX"]:
+        for processed_message in to_publish:
+            outbox.add_message(
+                routing_key=EDI_MESSAGE_ROUTING_KEY, body=processed_message
+            )
+        db.session.commit()
+    else:
+        for processed_message in to_publish:
+            _publish_processed_message(processed_message)
+    logger.debug("Republished batch of %d HL7 messages", len(to_publish))
+    return len(to_publish)
+
+
+def _insert_unless_duplicate(message: Hl7Message) -> bool:
+    """
+    Inserts a new message with INSERT ... ON CONFLICT DO NOTHING on the message control ID,
+    then attaches it to the session. Returns False (and inserts nothing) if another message
+    with the same message control ID exists. A concurrent insert of the same ID waits for the
+    other transaction rather than failing, so there is no IntegrityError to recover from.
+    """
+    dialect_insert = (
+        sqlite_insert if db.engine.dialect.name == "sqlite" else postgresql_insert
+    )
+    values: Dict[str, Any] = {
+        attr.columns[0].key: getattr(message, attr.key)
+        for attr in sa_inspect(Hl7Message).column_attrs
+        if attr.key in message.__dict__
+    }
+    statement = (
+        dialect_insert(Hl7Message.__table__)
+        .values(**values)
+        .on_conflict_do_nothing(index_elements=["message_control_id"])
+    )
+    if db.session.execute(statement).rowcount == 0:
+        return False
+    # The row now exists, so attach the object as if it had been loaded from the database.
+    make_transient_to_detached(message)
+    db.session.add(message)
+    return True
+
+
+def _reject_duplicate_message(message: Hl7Message, hl7_wrapper: Hl7Wrapper) -> None:
+    # Generate an AR (N)ACK message. Set the message control ID to None so it can be
+    # saved in the database.
+    logger.warning("Failed to process message: duplicate message control ID")
+    message.ack = hl7_wrapper.generate_ack(
+        ack_code="AR",
+        error_code=str(Hl7ApplicationRejectException.__name__),
+        error_msg="HL7 message appears to be duplicate",
+    )
+    message.message_control_id = None
+    message.awaiting_processing = False
+
+
+def _publish_processed_message(processed_message: Dict) -> None:
+    # Publish the message to the rest of the platform.
+    logger.debug(
+        "Publishing internal message to DHOS",
+        extra={"message_body": processed_message},
+    )
+    kombu_batteries_included.publish_message(
+        routing_key=EDI_MESSAGE_ROUTING_KEY, body=processed_message
+    )
+    logger.debug("Published internal message to DHOS")
+
 
+def _generate_ack_response(message: Hl7Message) -> Dict:
     # Encode the resulting (N)ACK HL7 message.
-    logger.debug("Responding to HTTP request with ACK: %s", message.ack)
+    logger.debug("Responding with ACK: %s", message.ack)
     b64encoded_ack_message = base64.b64encode(message.ack.encode("utf8")).decode("utf8")
 
     return {
@@ -165,7 +609,7 @@ def process_hl7_message(msg_uuid: str, m: Hl7Wrapper) -> Dict:
     # An HL7 message may not have admission date information in the PV1 segment
     # This appears to occur in A08 messages. If the admission date (PV1.F44) is
     # missing do not attempt to update the location and encounter information
-    if m.contains_segment("PV1") and m.get_field_by_hl7_path("PV1.F44"):
+    if m.contains_segment("PV1") and m.get_field_by_hl7_path(ADMITTED_AT_PATH):
         actions.append(generate_location_action(m))
         actions.append(generate_encounter_action(m))
 
@@ -1,25 +1,42 @@
 import base64
+import os
+import threading
 from datetime import datetime
 from importlib import import_module
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Optional, Tuple
 from urllib.parse import ParseResult, urlparse, urlunparse
 
 import requests
-from flask import current_app
+from flask import Flask, current_app
 from flask_batteries_included.helpers.error_handler import ServiceUnavailableException
-from flask_batteries_included.helpers.timestamp import parse_datetime_to_iso8601
+from flask_batteries_included.helpers.timestamp import (
+    parse_datetime_to_iso8601,
+    parse_iso8601_to_datetime,
+)
 from flask_batteries_included.sqldb import db, generate_uuid
 from pytz import utc
 from requests import Session
 from requests.auth import HTTPBasicAuth
 from she_logging import logger
-from zeep import CachingClient, Transport
-
-from dhos_connector_api.helpers import generator, trustomer
+from zeep import Client, Transport
+from zeep.cache import Base as ZeepCache
+from zeep.cache import InMemoryCache, SqliteCache
+
+from dhos_connector_api.helpers import (
+    failed_requests,
+    generator,
+    http_client,
+    mirth,
+    trustomer,
+)
+from dhos_connector_api.helpers.background import BoundedDispatcher
 from dhos_connector_api.helpers.hl7_wrapper import Hl7Wrapper
 from dhos_connector_api.helpers.jwt import get_epr_service_adapter_headers
 from dhos_connector_api.models.hl7_message import Hl7Message
 
+ORU_DISPATCHER_KEY = "oru_dispatcher"
+_oru_dispatcher_lock = threading.Lock()
+
 
 def _base_64_encode(message: str) -> str:
     return base64.b64encode(message.encode("utf8")).decode("utf8")
@@ -37,15 +54,81 @@ def create_oru_message(data: Dict) -> None:
 
         # We track failed requests to TIE by observation_set uuid.
         observation_set_uuid = data["observation_set"]["uuid"]
-        post_hl7_message(
-            hl7_message_uuid=hl7_message_uuid, observation_set_uuid=observation_set_uuid
-        )
+        if current_app.config["ASYNC_ORU_SENDING"]:
+            # Commit the message along with a record of the request to send it, then send it
+            # in the background. If it isn't sent, the failed request worker will send it.
+            # Each message is sent separately, so these are tracked by message uuid.
+            record_time: Optional[datetime] = parse_iso8601_to_datetime(
+                data["observation_set"]["record_time"]
+            )
+            if record_time is not None:
+                # Stored in UTC without a timezone, like the queue's other timestamps.
+                record_time = record_time.astimezone(utc).replace(tzinfo=None)
+            request_id, due_at = failed_requests.add_pending_request(
+                request_type="oru_message",
+                identifier=hl7_message_uuid,
+                fn=post_hl7_message,
+                call_args={
+                    "hl7_message_uuid": hl7_message_uuid,
+                    "observation_set_uuid": observation_set_uuid,
+                },
+                partition_key=data["patient"]["uuid"],
+                record_time=record_time,
+            )
+            db.session.commit()
+            app: Flask = current_app._get_current_object()  # type: ignore
+            # ORU messages for the same patient are sent one at a time by the dispatcher, and
+            # the queue holds a message back while one for an observation set recorded earlier
+            # (e.g. received late, from another process, or waiting to be retried) hasn't
+            # been sent.
+            _get_oru_dispatcher(app).submit_ordered(
+                "epr_service_adapter",
+                data["patient"]["uuid"],
+                failed_requests.run_request,
+                app,
+                request_id,
+                due_at,
+            )
+            return
+        try:
+            post_hl7_message(
+                hl7_message_uuid=hl7_message_uuid,
+                observation_set_uuid=observation_set_uuid,
+            )
+        except ServiceUnavailableException as e:
+            if not current_app.config["QUEUE_FAILED_ORU_MESSAGES"]:
+                raise
+            logger.warning(
+                "Failed to send ORU message, will be retried by failed request queue",
+                extra={"hl7_message_uuid": hl7_message_uuid},
+            )
+            failed_requests.add_failed_request(
+                request_type="oru_message",
+                identifier=observation_set_uuid,
+                fn=post_hl7_message,
+                call_args={
+                    "hl7_message_uuid": hl7_message_uuid,
+                    "observation_set_uuid": observation_set_uuid,
+                },
+                reason=str(e),
+            )
         db.session.commit()
     except:
         db.session.rollback()
         raise
 
 
+def _get_oru_dispatcher(app: Flask) -> BoundedDispatcher:
+    with _oru_dispatcher_lock:
+        if ORU_DISPATCHER_KEY not in app.extensions:
+            app.extensions[ORU_DISPATCHER_KEY] = BoundedDispatcher(
+                max_workers=app.config["ORU_DISPATCH_WORKERS"],
+                max_per_destination=app.config["ORU_DISPATCH_MAX_PER_DESTINATION"],
+                thread_name_prefix="oru-dispatch",
+            )
+        return app.extensions[ORU_DISPATCHER_KEY]
+
+
 def generate_oru_message(raw_data: Dict) -> str:
 
     # Check required data is present.
@@ -125,7 +208,12 @@ def _do_send_hl7_message(
 ) -> None:
     logger.info("Sending HL7 message: %s", message_uuid)
     try:
-        post_response = requests.post(url, headers=headers, json=json, timeout=15)
+        post_response = http_client.get_session("epr_service_adapter").post(
+            url,
+            headers=headers,
+            json=json,
+            timeout=current_app.config["EPR_SERVICE_ADAPTER_TIMEOUT_SEC"],
+        )
         post_response.raise_for_status()
     except requests.exceptions.HTTPError as e:
         logger.exception(
@@ -150,11 +238,9 @@ def _do_send_hl7_message(
 
     hl7_message: Hl7Message = Hl7Message.query.get(message_uuid)
     ack_msg: str = base64.b64decode(ack_resp_body).decode("utf8")
+    # Setting the ACK also stores its status.
     hl7_message.ack = ack_msg
-    ack_msg = ack_msg.replace("\r\n", "\r").replace("\n", "\r")
-    hl7_parsed: Hl7Wrapper = Hl7Wrapper(ack_msg)
-
-    ack_field = hl7_parsed.get_field_by_hl7_path("MSA.F1")
+    ack_field = hl7_message.ack_status()
 
     if ack_field == "AA":
         logger.info(
@@ -221,16 +307,76 @@ def post_cda_message(hl7_message: Hl7Message) -> None:
 
 
 def _do_send_cda_message(body: str) -> None:
-    url = f"{current_app.config['MIRTH_HOST_URL_BASE']}?wsdl"
-    session = Session()
+    if current_app.config["MIRTH_TEMPLATED_SOAP"]:
+        response = mirth.send_accept_message(
+            _get_mirth_session(),
+            current_app.config["MIRTH_HOST_URL_BASE"],
+            body,
+            timeout=current_app.config["MIRTH_TIMEOUT_SEC"],
+        )
+    else:
+        client: Client = _get_mirth_client()
+        response = client.service.acceptMessage(arg0=body)
+    logger.debug("CDA response: %s", response)
+
+
+def _get_mirth_session() -> Session:
+    session: Session = http_client.get_session("mirth")
     session.auth = HTTPBasicAuth(
         current_app.config["MIRTH_USERNAME"], current_app.config["MIRTH_PASSWORD"]
     )
-    client: CachingClient = CachingClient(
-        url, transport=CustomTransport(session=session)
+    return session
+
+
+# The Mirth SOAP client, and the process and Mirth config it was created for.
+_mirth_client: Optional[Tuple[Tuple, Client]] = None
+_mirth_client_lock = threading.Lock()
+
+
+def _get_mirth_client() -> Client:
+    """
+    Returns a Mirth SOAP client for this process, creating it the first time it is needed.
+    Loading the WSDL is slow, so the client is reused, and the WSDL and XSDs are cached (on
+    disk if MIRTH_WSDL_CACHE_PATH is set, so that they aren't fetched again after a restart).
+    """
+    global _mirth_client
+    key: Tuple = (
+        os.getpid(),
+        current_app.config["MIRTH_HOST_URL_BASE"],
+        current_app.config["MIRTH_USERNAME"],
+        current_app.config["MIRTH_PASSWORD"],
     )
-    response = client.service.acceptMessage(arg0=body)
-    logger.debug("CDA response: %s", response)
+    cached: Optional[Tuple[Tuple, Client]] = _mirth_client
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    with _mirth_client_lock:
+        if _mirth_client is not None and _mirth_client[0] == key:
+            return _mirth_client[1]
+        logger.debug("Creating Mirth SOAP client")
+        session: Session = _get_mirth_session()
+        cache: ZeepCache
+        cache_path: Optional[str] = current_app.config["MIRTH_WSDL_CACHE_PATH"]
+        cache_timeout: int = current_app.config["MIRTH_WSDL_CACHE_TIMEOUT_SEC"]
+        if cache_path:
+            cache = SqliteCache(path=cache_path, timeout=cache_timeout)
+        else:
+            cache = InMemoryCache(timeout=cache_timeout)
+        client = Client(
+            f"{current_app.config['MIRTH_HOST_URL_BASE']}?wsdl",
+            transport=CustomTransport(
+                session=session,
+                cache=cache,
+                operation_timeout=current_app.config["MIRTH_TIMEOUT_SEC"],
+            ),
+        )
+        _mirth_client = (key, client)
+        return client
+
+
+def clear_mirth_client() -> None:
+    global _mirth_client
+    with _mirth_client_lock:
+        _mirth_client = None
 
 
 class CustomTransport(Transport):
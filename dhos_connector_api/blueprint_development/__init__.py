@@ -12,6 +12,7 @@ def drop_data_route() -> Response:
 
     session = db.session
     session.execute("TRUNCATE TABLE hl7_message")
+    session.execute("TRUNCATE TABLE outbox_message")
     session.commit()
     session.close()
     return make_response(204)
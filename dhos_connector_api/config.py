@@ -17,9 +17,33 @@ class Configuration:
     MIRTH_HOST_URL_BASE: str = env.str("MIRTH_HOST_URL_BASE", "")
     MIRTH_USERNAME: str = env.str("MIRTH_USERNAME", "")
     MIRTH_PASSWORD: str = env.str("MIRTH_PASSWORD", "")
+    MIRTH_TEMPLATED_SOAP: bool = env.bool("MIRTH_TEMPLATED_SOAP", False)
+    MIRTH_TIMEOUT_SEC: float = env.float("MIRTH_TIMEOUT_SEC", 60.0)
+    MIRTH_WSDL_CACHE_PATH: Optional[str] = env.str("MIRTH_WSDL_CACHE_PATH", None)
+    MIRTH_WSDL_CACHE_TIMEOUT_SEC: int = env.int(
+        "MIRTH_WSDL_CACHE_TIMEOUT_SEC", 24 * 60 * 60
+    )
     JWT_EXPIRY_IN_SECONDS: int = env.int("JWT_EXPIRY_IN_SECONDS", 600)
+    JWT_RENEW_BEFORE_EXPIRY_SEC: int = env.int("JWT_RENEW_BEFORE_EXPIRY_SEC", 60)
 
     MAX_REQUEST_FAILS: int = env.int("MAX_REQUEST_FAILS", 3)
+    ASYNC_ORU_SENDING: bool = env.bool("ASYNC_ORU_SENDING", False)
+    ORU_DISPATCH_WORKERS: int = env.int("ORU_DISPATCH_WORKERS", 8)
+    ORU_DISPATCH_MAX_PER_DESTINATION: int = env.int(
+        "ORU_DISPATCH_MAX_PER_DESTINATION", 4
+    )
+    QUEUE_FAILED_ORU_MESSAGES: bool = env.bool("QUEUE_FAILED_ORU_MESSAGES", False)
+    FAILED_REQUEST_RETRY_BASE_SEC: float = env.float(
+        "FAILED_REQUEST_RETRY_BASE_SEC", 60.0
+    )
+    FAILED_REQUEST_RETRY_MAX_SEC: float = env.float(
+        "FAILED_REQUEST_RETRY_MAX_SEC", 60.0 * 60
+    )
+    FAILED_REQUEST_BATCH_SIZE: int = env.int("FAILED_REQUEST_BATCH_SIZE", 50)
+    FAILED_REQUEST_WORKERS: int = env.int("FAILED_REQUEST_WORKERS", 4)
+    FAILED_REQUEST_POLL_INTERVAL_SEC: float = env.float(
+        "FAILED_REQUEST_POLL_INTERVAL_SEC", 10.0
+    )
     SMTP_HOST: Optional[str] = env.str("SMTP_HOST", None)
     SMTP_AUTH_PASS = env.str("SMTP_AUTH_PASS", None)
     SMTP_AUTH_USER = env.str("SMTP_AUTH_USER", None)
@@ -34,6 +58,40 @@ class Configuration:
     TRUSTOMER_CONFIG_CACHE_TTL_SEC: int = env.int(
         "TRUSTOMER_CONFIG_CACHE_TTL_SEC", 60 * 60  # Cache for 1 hour by default.
     )
+    TRUSTOMER_CONFIG_REFRESH_AHEAD_SEC: int = env.int(
+        "TRUSTOMER_CONFIG_REFRESH_AHEAD_SEC", 5 * 60
+    )
+    TRUSTOMER_CONFIG_SHARED_CACHE: bool = env.bool(
+        "TRUSTOMER_CONFIG_SHARED_CACHE", False
+    )
+    TRUSTOMER_CONFIG_VERSION_CHECK_SEC: int = env.int(
+        "TRUSTOMER_CONFIG_VERSION_CHECK_SEC", 60
+    )
+    TRUSTOMER_CONFIG_SNAPSHOT_PATH: Optional[str] = env.str(
+        "TRUSTOMER_CONFIG_SNAPSHOT_PATH", None
+    )
+    TRUSTOMER_API_TIMEOUT_SEC: float = env.float("TRUSTOMER_API_TIMEOUT_SEC", 15.0)
+    EPR_SERVICE_ADAPTER_TIMEOUT_SEC: float = env.float(
+        "EPR_SERVICE_ADAPTER_TIMEOUT_SEC", 15.0
+    )
+    HTTP_POOL_CONNECTIONS: int = env.int("HTTP_POOL_CONNECTIONS", 10)
+    HTTP_POOL_MAXSIZE: int = env.int("HTTP_POOL_MAXSIZE", 10)
+    HTTP_RETRIES: int = env.int("HTTP_RETRIES", 3)
+    HTTP_RETRY_BACKOFF_FACTOR: float = env.float("HTTP_RETRY_BACKOFF_FACTOR", 0.5)
+    PUBLISH_VIA_OUTBOX: bool = env.bool("PUBLISH_VIA_OUTBOX", False)
+    OUTBOX_BATCH_SIZE: int = env.int("OUTBOX_BATCH_SIZE", 100)
+    OUTBOX_POLL_INTERVAL_SEC: float = env.float("OUTBOX_POLL_INTERVAL_SEC", 1.0)
+    MLLP_MAX_WORKERS: int = env.int("MLLP_MAX_WORKERS", 4)
+    MLLP_ENCODING: str = env.str("MLLP_ENCODING", "utf8")
+    ACK_FIRST_PROCESSING: bool = env.bool("ACK_FIRST_PROCESSING", False)
+    ACK_FIRST_WORKERS: int = env.int("ACK_FIRST_WORKERS", 4)
+    FAST_ADT_EXTRACTION: bool = env.bool("FAST_ADT_EXTRACTION", False)
+    STORE_PARSED_CONTENT: bool = env.bool("STORE_PARSED_CONTENT", False)
+    SERVER_WORKERS: int = env.int("SERVER_WORKERS", 1)
+    SERVER_THREADS: int = env.int("SERVER_THREADS", 4)
+    SERVER_MAX_REQUESTS: int = env.int("SERVER_MAX_REQUESTS", 0)
+    SERVER_MAX_REQUESTS_JITTER: int = env.int("SERVER_MAX_REQUESTS_JITTER", 0)
+    SERVER_GRACEFUL_TIMEOUT_SEC: float = env.float("SERVER_GRACEFUL_TIMEOUT_SEC", 30.0)
 
 
 def init_config(app: Flask) -> None:
@@ -0,0 +1,151 @@
+"""
+A fast alternative to building the full `hl7` parse tree for an incoming ADT message. The raw
+message is scanned once and only the fields we know we'll need are extracted into a flat
+structure, which `Hl7Wrapper` uses in place of the parse tree. Anything unusual (custom
+encoding characters, escape sequences, malformed segments) isn't handled here; the
+extractor returns None and the caller falls back to the `hl7` library.
+
+The extraction rules replicate `hl7.parse` followed by `Hl7Path.extract` for messages using the
+default encoding characters.
+"""
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from dhos_connector_api.helpers.hl7_path import Hl7Path
+
+# Default encoding characters. Messages using anything else fall back to the hl7 library.
+DEFAULT_MSH_PREFIX = "MSH|^~\\&|"
+ESCAPE_CHARACTER = "\\"
+
+
+class ExtractedFields:
+    def __init__(
+        self,
+        segment_ids: FrozenSet[str],
+        fields: Dict[Hl7Path, Optional[str]],
+        raw_fields: Dict[Tuple[str, int], str],
+        msh_segment: str,
+    ) -> None:
+        # IDs of all segments in the message.
+        self.segment_ids = segment_ids
+        # Field values as Hl7Wrapper would return them, with None for missing fields.
+        self.fields = fields
+        # Unsplit text of each (segment ID, field number) read by the extracted paths.
+        self.raw_fields = raw_fields
+        # Text of the MSH segment, which is all that is needed to generate an ACK.
+        self.msh_segment = msh_segment
+
+
+def extract_fields(
+    raw_message: str, paths: Iterable[Hl7Path], repeated_paths: Iterable[Hl7Path]
+) -> Optional[ExtractedFields]:
+    """
+    Extracts `paths` from the raw message, along with `repeated_paths` for every repetition of
+    their field (e.g. each identifier in PID.F3). Returns None if the message needs the full
+    parser.
+    """
+    message: str = raw_message.strip()
+    if not message.startswith(DEFAULT_MSH_PREFIX):
+        return None
+    if ESCAPE_CHARACTER in message[len(DEFAULT_MSH_PREFIX) :]:
+        return None
+
+    segments: Dict[str, List[str]] = {}
+    for segment_text in message.split("\r"):
+        segment: List[str] = segment_text.split("|")
+        segment_id: str = segment[0]
+        if len(segment_id) != 3 or not segment_id.isalnum():
+            return None
+        # As with the full parser, paths refer to the first segment with each ID.
+        segments.setdefault(segment_id, segment)
+
+    raw_fields: Dict[Tuple[str, int], str] = {}
+    fields: Dict[Hl7Path, Optional[str]] = {}
+    for path in paths:
+        if path.segment_num != 1 or (
+            path.segment == "MSH" and path.field_num in (1, 2)
+        ):
+            # Left for the full parser if they are ever looked up.
+            continue
+        fields[path] = _extract(segments, path, raw_fields)
+    for path in repeated_paths:
+        if path.field_num is None:
+            continue
+        raw_field: Optional[str] = _get_raw_field(
+            segments, path.segment, path.field_num, raw_fields
+        )
+        if raw_field is None:
+            continue
+        for repeat_num in range(1, raw_field.count("~") + 2):
+            repeat_path: Hl7Path = path.with_repeat(repeat_num)
+            fields[repeat_path] = _extract(segments, repeat_path, raw_fields)
+
+    return ExtractedFields(
+        segment_ids=frozenset(segments),
+        fields=fields,
+        raw_fields=raw_fields,
+        msh_segment="|".join(segments["MSH"]),
+    )
+
+
+def _get_raw_field(
+    segments: Dict[str, List[str]],
+    segment_id: str,
+    field_num: int,
+    raw_fields: Dict[Tuple[str, int], str],
+) -> Optional[str]:
+    segment: Optional[List[str]] = segments.get(segment_id)
+    if segment is None:
+        return None
+    # MSH.F1 is the field separator itself, so MSH fields are offset by one.
+    idx: int = field_num - 1 if segment_id == "MSH" else field_num
+    if idx >= len(segment):
+        return None
+    raw_fields[(segment_id, field_num)] = segment[idx]
+    return segment[idx]
+
+
+def _extract(
+    segments: Dict[str, List[str]],
+    path: Hl7Path,
+    raw_fields: Dict[Tuple[str, int], str],
+) -> Optional[str]:
+    if path.segment not in segments:
+        return None
+    field_num: int = path.field_num or 1
+    repeat_num: int = path.repeat_num or 1
+    component_num: int = path.component_num or 1
+    subcomponent_num: int = path.subcomponent_num or 1
+
+    # None is returned where the hl7 library would raise an error, and "" where it would
+    # assume a non-present optional value.
+    field: Optional[str] = _get_raw_field(segments, path.segment, field_num, raw_fields)
+    value: str
+    if field is None:
+        if repeat_num != 1 or component_num != 1 or subcomponent_num != 1:
+            return None
+        value = ""
+    elif not any(separator in field for separator in "~^&"):
+        # Leaf field.
+        if repeat_num != 1 or component_num != 1 or subcomponent_num != 1:
+            return None
+        value = field
+    else:
+        repetitions: List[str] = field.split("~")
+        if repeat_num > len(repetitions):
+            return None
+        components: List[str] = repetitions[repeat_num - 1].split("^")
+        if component_num > len(components):
+            if subcomponent_num != 1:
+                return None
+            value = ""
+        else:
+            subcomponents: List[str] = components[component_num - 1].split("&")
+            if subcomponent_num > len(subcomponents):
+                value = ""
+            else:
+                value = subcomponents[subcomponent_num - 1]
+
+    if value == '""':
+        # Empty HL7 field containing just quote marks.
+        return None
+    return value
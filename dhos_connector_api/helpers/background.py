@@ -0,0 +1,138 @@
+import threading
+import zlib
+from collections import defaultdict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from she_logging import logger
+
+# A function and the positional and keyword arguments to call it with.
+_Task = Tuple[Callable[..., Any], Tuple, Dict[str, Any]]
+
+
+class PartitionedExecutor:
+    """
+    Runs tasks in the background on a fixed number of single-threaded workers. Tasks submitted
+    with the same partition key (e.g. a patient identifier) always run on the same worker, so
+    they run one at a time in the order they were submitted. Tasks with different keys can run
+    in parallel.
+    """
+
+    def __init__(self, num_partitions: int, thread_name_prefix: str) -> None:
+        if num_partitions < 1:
+            raise ValueError("PartitionedExecutor requires at least one partition")
+        self._workers: List[ThreadPoolExecutor] = [
+            ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix=f"{thread_name_prefix}-{i}"
+            )
+            for i in range(num_partitions)
+        ]
+
+    def submit(
+        self, partition_key: str, fn: Callable[..., Any], *args: Any, **kwargs: Any
+    ) -> Future:
+        # crc32 rather than hash() so keys map to the same partition in every process.
+        idx: int = zlib.crc32(partition_key.encode("utf8")) % len(self._workers)
+        return self._workers[idx].submit(fn, *args, **kwargs)
+
+    def shutdown(self, wait: bool = True) -> None:
+        for worker in self._workers:
+            worker.shutdown(wait=wait)
+
+
+class BoundedDispatcher:
+    """
+    Runs tasks in the background on a pool of `max_workers` threads, with at most
+    `max_per_destination` tasks for the same destination (e.g. a downstream service) running at
+    once. Tasks for a destination that is at its limit are queued, in the order they were
+    submitted, until one of its running tasks finishes, so they don't tie up a worker thread
+    that could be used for another destination.
+
+    Tasks submitted with `submit_ordered` and the same partition key (e.g. a patient UUID) run
+    one at a time in the order they were submitted, while tasks with different keys run in
+    parallel. A task only joins its destination's queue once the previous task with its key has
+    finished, so a busy key doesn't hold up the rest of the queue.
+    """
+
+    def __init__(
+        self, max_workers: int, max_per_destination: int, thread_name_prefix: str
+    ) -> None:
+        if max_workers < 1 or max_per_destination < 1:
+            raise ValueError("BoundedDispatcher requires at least one worker")
+        self.max_per_destination = max_per_destination
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix=thread_name_prefix
+        )
+        # Tasks running (or waiting for a thread), and queued, by destination.
+        self._running: Dict[str, int] = defaultdict(int)
+        self._queued: Dict[str, Deque[Tuple[Optional[str], _Task]]] = defaultdict(deque)
+        # Tasks waiting for the previous task with the same key to finish, by key. A key is
+        # present while it has a task queued or running.
+        self._waiting: Dict[str, Deque[Tuple[str, _Task]]] = {}
+        self._idle = threading.Condition()
+
+    def submit(
+        self, destination: str, fn: Callable[..., Any], *args: Any, **kwargs: Any
+    ) -> None:
+        with self._idle:
+            self._dispatch(destination, None, (fn, args, kwargs))
+
+    def submit_ordered(
+        self,
+        destination: str,
+        partition_key: str,
+        fn: Callable[..., Any],
+        *args: Any,
+        **kwargs: Any,
+    ) -> None:
+        task: _Task = (fn, args, kwargs)
+        with self._idle:
+            if partition_key in self._waiting:
+                self._waiting[partition_key].append((destination, task))
+            else:
+                self._waiting[partition_key] = deque()
+                self._dispatch(destination, partition_key, task)
+
+    def shutdown(self, wait: bool = True) -> None:
+        if wait:
+            # Queued tasks are only submitted to the executor as running ones finish.
+            with self._idle:
+                self._idle.wait_for(lambda: not any(self._running.values()))
+        self._executor.shutdown(wait=wait)
+
+    def _dispatch(
+        self, destination: str, partition_key: Optional[str], task: _Task
+    ) -> None:
+        # Called with the lock held.
+        if (
+            self._running[destination] < self.max_per_destination
+            and not self._queued[destination]
+        ):
+            self._running[destination] += 1
+            self._executor.submit(self._run, destination, partition_key, task)
+        else:
+            self._queued[destination].append((partition_key, task))
+
+    def _run(self, destination: str, partition_key: Optional[str], task: _Task) -> None:
+        fn, args, kwargs = task
+        try:
+            fn(*args, **kwargs)
+        except Exception:
+            logger.exception("Background task for %s failed", destination)
+        with self._idle:
+            self._running[destination] -= 1
+            if partition_key is not None:
+                if self._waiting[partition_key]:
+                    # The next task with this key joins the back of its destination's queue.
+                    next_destination, next_task = self._waiting[partition_key].popleft()
+                    self._dispatch(next_destination, partition_key, next_task)
+                else:
+                    del self._waiting[partition_key]
+            while (
+                self._queued[destination]
+                and self._running[destination] < self.max_per_destination
+            ):
+                self._running[destination] += 1
+                queued_key, queued_task = self._queued[destination].popleft()
+                self._executor.submit(self._run, destination, queued_key, queued_task)
+            self._idle.notify_all()
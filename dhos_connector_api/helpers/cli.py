@@ -1,8 +1,13 @@
+from datetime import datetime
+from typing import Optional
+
 import click
 from flask import Flask
 from flask_batteries_included.helpers.apispec import generate_openapi_spec
 
 from dhos_connector_api import blueprint_api
+from dhos_connector_api.blueprint_api import receive_controller
+from dhos_connector_api.helpers import failed_requests, outbox
 from dhos_connector_api.models.api_spec import dhos_connector_api_spec
 
 
@@ -13,3 +18,126 @@ def add_cli_command(app: Flask) -> None:
         generate_openapi_spec(
             dhos_connector_api_spec, output, blueprint_api.api_blueprint
         )
+
+    @app.cli.command("publish-outbox")
+    @click.option(
+        "--batch-size",
+        type=int,
+        default=None,
+        help="Maximum number of messages to publish per transaction",
+    )
+    @click.option(
+        "--once", is_flag=True, help="Exit once the outbox is empty instead of polling"
+    )
+    def publish_outbox(batch_size: Optional[int], once: bool) -> None:
+        """Publish messages from the outbox to RabbitMQ."""
+        outbox.relay(
+            batch_size=batch_size or app.config["OUTBOX_BATCH_SIZE"],
+            poll_interval=app.config["OUTBOX_POLL_INTERVAL_SEC"],
+            run_once=once,
+        )
+
+    @app.cli.command("retry-failed-requests")
+    @click.option(
+        "--batch-size",
+        type=int,
+        default=None,
+        help="Maximum number of requests to claim at a time",
+    )
+    @click.option(
+        "--workers",
+        type=click.IntRange(min=1),
+        default=None,
+        help="Number of requests to retry concurrently",
+    )
+    @click.option(
+        "--once",
+        is_flag=True,
+        help="Exit once no requests are due instead of polling",
+    )
+    def retry_failed_requests(
+        batch_size: Optional[int], workers: Optional[int], once: bool
+    ) -> None:
+        """Retry failed outbound requests as they become due."""
+        failed_requests.retry_worker(
+            batch_size=batch_size or app.config["FAILED_REQUEST_BATCH_SIZE"],
+            workers=workers or app.config["FAILED_REQUEST_WORKERS"],
+            poll_interval=app.config["FAILED_REQUEST_POLL_INTERVAL_SEC"],
+            run_once=once,
+        )
+
+    @app.cli.command("process-pending-messages")
+    @click.option(
+        "--min-age-seconds",
+        type=int,
+        default=300,
+        help="Only process messages received at least this many seconds ago",
+    )
+    def process_pending_messages(min_age_seconds: int) -> None:
+        """Process HL7 messages that were ACKed but never processed."""
+        receive_controller.process_pending_hl7_messages(min_age_seconds=min_age_seconds)
+
+    @app.cli.command("reprocess-messages")
+    @click.option(
+        "--received-after",
+        type=click.DateTime(),
+        default=None,
+        help="Only messages received at or after this time (UTC)",
+    )
+    @click.option(
+        "--received-before",
+        type=click.DateTime(),
+        default=None,
+        help="Only messages received before this time (UTC)",
+    )
+    @click.option(
+        "--message-type", default=None, help="Only messages of this type, e.g. ADT^A01"
+    )
+    @click.option(
+        "--processed/--not-processed",
+        default=None,
+        help="Only messages that have (or haven't) been processed",
+    )
+    @click.option(
+        "--ack-status", default=None, help="Only messages with this ACK code, e.g. AA"
+    )
+    @click.option(
+        "--workers",
+        type=click.IntRange(min=1),
+        default=1,
+        help="Number of worker processes",
+    )
+    @click.option(
+        "--batch-size",
+        type=click.IntRange(min=1),
+        default=100,
+        help="Number of messages to read and republish at a time",
+    )
+    @click.option(
+        "--batch-interval",
+        type=float,
+        default=1.0,
+        help="Seconds to wait between republishing batches",
+    )
+    def reprocess_messages(
+        received_after: Optional[datetime],
+        received_before: Optional[datetime],
+        message_type: Optional[str],
+        processed: Optional[bool],
+        ack_status: Optional[str],
+        workers: int,
+        batch_size: int,
+        batch_interval: float,
+    ) -> None:
+        """Regenerate and republish the actions for stored HL7 messages."""
+        count: int = receive_controller.reprocess_hl7_messages(
+            received_after=received_after,
+            received_before=received_before,
+            message_type=message_type,
+            is_processed=processed,
+            ack_status=ack_status,
+            workers=workers,
+            batch_size=batch_size,
+            batch_interval=batch_interval,
+        )
+        click.echo(f"Republished {count} messages")
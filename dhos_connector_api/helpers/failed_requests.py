@@ -0,0 +1,291 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from importlib import import_module
+from typing import Callable, Dict, List, Optional, Tuple
+
+from flask import Flask, current_app
+from flask_batteries_included.sqldb import db
+from she_logging import logger
+from sqlalchemy import and_, exists, or_
+from sqlalchemy.orm import aliased
+from sqlalchemy.sql.elements import ColumnElement
+
+from dhos_connector_api.models.failed_request import FailedRequest
+
+# A request to retry: the failed request ID, module, function name and keyword arguments.
+_Request = Tuple[int, str, str, Optional[Dict]]
+
+
+def add_failed_request(
+    request_type: str,
+    identifier: str,
+    fn: Callable,
+    call_args: Dict,
+    reason: str,
+) -> None:
+    """
+    Records a failed request in the current database transaction, so that the retry worker
+    calls `fn(**call_args)` again later.
+    """
+    failed_request: Optional[FailedRequest] = FailedRequest.query.filter_by(
+        type=request_type, identifier=identifier
+    ).first()
+    if failed_request is None:
+        failed_request = FailedRequest(type=request_type, identifier=identifier)
+        db.session.add(failed_request)
+    if (
+        failed_request.succeeded
+        or failed_request.hard_fail
+        or failed_request.id is None
+    ):
+        # A new request, rather than a retry of one that is already queued.
+        failed_request.fail_count = 0
+        failed_request.succeeded = False
+        failed_request.hard_fail = False
+    failed_request.path_to_module = fn.__module__
+    failed_request.api_name = fn.__name__
+    failed_request.call_args = call_args
+    _record_failure(failed_request, reason)
+
+
+def add_pending_request(
+    request_type: str,
+    identifier: str,
+    fn: Callable,
+    call_args: Dict,
+    partition_key: Optional[str] = None,
+    record_time: Optional[datetime] = None,
+) -> Tuple[int, datetime]:
+    """
+    Records a request that is about to be made in the background, in the current database
+    transaction, and returns its ID and when it is due to be retried, for `run_request`. If
+    the request isn't completed (e.g. because the process stops), the retry worker makes it
+    once the retry delay has passed. The request isn't made while an earlier request with the
+    same `partition_key` is still waiting to be made, unless that one has been given up on.
+    Requests in a partition are ordered by `record_time` (naive UTC), then by when they were
+    added.
+    """
+    failed_request = FailedRequest(
+        type=request_type,
+        identifier=identifier,
+        path_to_module=fn.__module__,
+        api_name=fn.__name__,
+        call_args=call_args,
+        partition_key=partition_key,
+        record_time=record_time,
+        fail_count=0,
+        next_retry_at=datetime.utcnow() + timedelta(seconds=_retry_delay(1)),
+        hard_fail=False,
+        succeeded=False,
+    )
+    db.session.add(failed_request)
+    db.session.flush()
+    return failed_request.id, failed_request.next_retry_at
+
+
+def run_request(app: Flask, request_id: int, due_at: datetime) -> None:
+    """
+    Makes a request recorded by `add_pending_request`, recording its outcome. The request is
+    claimed in the same way as by `retry_batch`, and is skipped if it has already been claimed
+    (i.e. it is no longer due at `due_at`), so that it isn't also made by the retry worker. It
+    is also skipped, and left for the retry worker, if an earlier request in its partition is
+    still waiting to be made.
+    """
+    with app.app_context():
+        failed_request: Optional[FailedRequest] = (
+            FailedRequest.query.filter(
+                FailedRequest.id == request_id,
+                FailedRequest.hard_fail.is_(False),
+                FailedRequest.succeeded.is_(False),
+                FailedRequest.next_retry_at == due_at,
+                _in_partition_order(),
+            )
+            .with_for_update(skip_locked=True)
+            .first()
+        )
+        if failed_request is None:
+            db.session.rollback()
+            logger.debug(
+                "Request %d has already been claimed or is waiting for an earlier request",
+                request_id,
+            )
+            return
+        failed_request.next_retry_at = datetime.utcnow() + timedelta(
+            seconds=_retry_delay(failed_request.fail_count + 1)
+        )
+        request: _Request = (
+            failed_request.id,
+            failed_request.path_to_module,
+            failed_request.api_name,
+            failed_request.call_args,
+        )
+        db.session.commit()
+        _complete_request(request_id, _retry_request(request))
+        db.session.commit()
+
+
+def retry_batch(batch_size: int, workers: int = 1) -> int:
+    """
+    Retries the failed requests that are due. Rows are locked with SKIP LOCKED while they are
+    claimed, so several workers (e.g. one per replica) can drain the queue at once. The claimed
+    requests are then retried on `workers` threads. Requests waiting for an earlier request in
+    their partition aren't retried until it has been made. Returns the number of requests
+    retried.
+    """
+    now: datetime = datetime.utcnow()
+    due: List[FailedRequest] = (
+        FailedRequest.query.filter(
+            FailedRequest.hard_fail.is_(False),
+            FailedRequest.succeeded.is_(False),
+            FailedRequest.next_retry_at <= now,
+            _in_partition_order(),
+        )
+        .order_by(FailedRequest.next_retry_at)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+        .all()
+    )
+    if not due:
+        db.session.rollback()
+        return 0
+
+    # Claim the requests by making them due again only after the delay for another failure,
+    # so that if this worker dies they are retried later rather than lost.
+    requests: List[_Request] = []
+    for failed_request in due:
+        failed_request.next_retry_at = now + timedelta(
+            seconds=_retry_delay(failed_request.fail_count + 1)
+        )
+        requests.append(
+            (
+                failed_request.id,
+                failed_request.path_to_module,
+                failed_request.api_name,
+                failed_request.call_args,
+            )
+        )
+    db.session.commit()
+
+    errors: List[Optional[str]]
+    if workers > 1:
+        app: Flask = current_app._get_current_object()  # type: ignore
+        with ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="failed-request"
+        ) as executor:
+            errors = list(
+                executor.map(lambda r: _retry_request_in_app(app, r), requests)
+            )
+    else:
+        errors = [_retry_request(request) for request in requests]
+
+    for (request_id, _, _, _), error in zip(requests, errors):
+        _complete_request(request_id, error)
+    db.session.commit()
+    logger.info(
+        "Retried %d failed requests, %d succeeded",
+        len(requests),
+        errors.count(None),
+    )
+    return len(requests)
+
+
+def _in_partition_order() -> ColumnElement:
+    """
+    Filters out requests with an earlier request in their partition that is still waiting to
+    be made (i.e. hasn't succeeded or been given up on).
+    """
+    earlier = aliased(FailedRequest)
+    return ~exists().where(
+        earlier.partition_key == FailedRequest.partition_key,
+        or_(
+            earlier.record_time < FailedRequest.record_time,
+            and_(
+                # Requests recorded at the same time, or without a record time, are made in
+                # the order they were added.
+                or_(
+                    earlier.record_time == FailedRequest.record_time,
+                    earlier.record_time.is_(None),
+                    FailedRequest.record_time.is_(None),
+                ),
+                earlier.id < FailedRequest.id,
+            ),
+        ),
+        earlier.hard_fail.is_(False),
+        earlier.succeeded.is_(False),
+    )
+
+
+def retry_worker(
+    batch_size: int, workers: int, poll_interval: float, run_once: bool = False
+) -> None:
+    """
+    Retries failed requests as they become due. Full batches are retried back to back; once
+    nothing is due the worker sleeps for `poll_interval` seconds before checking again.
+    """
+    logger.info("Starting failed request worker with batch size %d", batch_size)
+    while True:
+        try:
+            retried: int = retry_batch(batch_size, workers=workers)
+        except Exception:
+            logger.exception("Failed to retry failed requests, will try again")
+            db.session.rollback()
+            retried = 0
+        if run_once and retried < batch_size:
+            return
+        if retried < batch_size:
+            time.sleep(poll_interval)
+
+
+def _retry_request_in_app(app: Flask, request: _Request) -> Optional[str]:
+    with app.app_context():
+        return _retry_request(request)
+
+
+def _retry_request(request: _Request) -> Optional[str]:
+    request_id, path_to_module, api_name, call_args = request
+    try:
+        fn: Callable = getattr(import_module(path_to_module), api_name)
+        fn(**(call_args or {}))
+    except Exception as e:
+        db.session.rollback()
+        logger.warning("Retry of failed request %d failed: %s", request_id, e)
+        return str(e) or type(e).__name__
+    return None
+
+
+def _complete_request(request_id: int, error: Optional[str]) -> None:
+    failed_request: FailedRequest = FailedRequest.query.get(request_id)
+    if error is None:
+        failed_request.succeeded = True
+        failed_request.next_retry_at = None
+    else:
+        _record_failure(failed_request, error)
+
+
+def _record_failure(failed_request: FailedRequest, reason: str) -> None:
+    now: datetime = datetime.utcnow()
+    failed_request.fail_count = (failed_request.fail_count or 0) + 1
+    failed_request.last_fail_time = now
+    failed_request.last_fail_reason = reason
+    if failed_request.fail_count >= current_app.config["MAX_REQUEST_FAILS"]:
+        logger.error(
+            "Giving up on %s request %s after %d failures",
+            failed_request.type,
+            failed_request.identifier,
+            failed_request.fail_count,
+        )
+        failed_request.hard_fail = True
+        failed_request.next_retry_at = None
+    else:
+        failed_request.next_retry_at = now + timedelta(
+            seconds=_retry_delay(failed_request.fail_count)
+        )
+
+
+def _retry_delay(fail_count: int) -> float:
+    """The delay before retrying a request that has failed `fail_count` times."""
+    return min(
+        current_app.config["FAILED_REQUEST_RETRY_BASE_SEC"] * 2 ** (fail_count - 1),
+        current_app.config["FAILED_REQUEST_RETRY_MAX_SEC"],
+    )
@@ -1,16 +1,70 @@
 from hashlib import md5
-from typing import Any, Dict, List, Optional, Set, Tuple, Union
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple, Union
 
 from flask_batteries_included.helpers.timestamp import parse_iso8601_to_date
 from she_logging import logger
 
-from dhos_connector_api.helpers import trustomer
+from dhos_connector_api.helpers import obx_mapping, trustomer
 from dhos_connector_api.helpers.converters import parse_sct_to_sex
-from dhos_connector_api.helpers.hl7_wrapper import Hl7Wrapper
+from dhos_connector_api.helpers.hl7_wrapper import (
+    Hl7DatetimeFormatter,
+    Hl7Wrapper,
+    get_hl7_datetime_formatter,
+)
+from dhos_connector_api.helpers.obx_mapping import ObxTemplate
 
 VALID_EWS_SCORE_SYSTEMS: Set[str] = {"NEWS2", "MEOWS"}
 
 
+class _OruContext:
+    """
+    Everything needed to render the segments of one ORU message, worked out once per message:
+    the trustomer config, the HL7 timestamp formatter, the trust's OBX templates, and the
+    observations they use indexed by type. Timestamps are converted using the context rather
+    than Hl7Wrapper.
+    """
+
+    def __init__(self, observations: List[Dict]) -> None:
+        self.trustomer_config: Dict = trustomer.get_trustomer_config()
+        self._formatter: Hl7DatetimeFormatter = get_hl7_datetime_formatter()
+        self.obx_templates: Tuple[ObxTemplate, ...] = obx_mapping.get_obx_templates(
+            self.trustomer_config
+        )
+        observation_types: Set[str] = {
+            obs_type
+            for template in self.obx_templates
+            for obs_type in template.observation_types
+        }
+        # The first observation of each type sent, or None if it has no value.
+        self._observations: Dict[str, Optional[Dict]] = {}
+        for obs in observations:
+            if (
+                obs["observation_type"] in observation_types
+                and obs["observation_type"] not in self._observations
+            ):
+                self._observations[obs["observation_type"]] = (
+                    obs if _has_value(obs) else None
+                )
+        # The times the observations were measured are converted together up front.
+        measured_times: List[str] = [
+            obs["measured_time"] for obs in self._observations.values() if obs
+        ]
+        self._hl7_datetimes: Dict[str, str] = dict(
+            zip(measured_times, self._formatter.from_iso8601_list(measured_times))
+        )
+
+    def get_obs(self, obs_type: str) -> Optional[Dict]:
+        return self._observations.get(obs_type)
+
+    def hl7_datetime(self, iso8601: str) -> str:
+        hl7_datetime: Optional[str] = self._hl7_datetimes.get(iso8601)
+        if hl7_datetime is None:
+            hl7_datetime = self._hl7_datetimes[iso8601] = self._formatter.from_iso8601(
+                iso8601
+            )
+        return hl7_datetime
+
+
 def generate_oru_message(
     patient: Dict, encounter: Dict, obs_set: Dict, clinician: Dict = None
 ) -> str:
@@ -41,58 +95,34 @@ def generate_oru_message(
         )
         collector = None
 
-    obs_list: List[Dict] = obs_set.get("observations", [])
+    context = _OruContext(obs_set.get("observations", []))
     msg_ctrl_id: str = md5(
         obs_set["uuid"].encode("utf-8"), usedforsecurity=False
     ).hexdigest()[:20]
 
-    segment_msh = _generate_msh_segment(msg_ctrl_id=msg_ctrl_id)
+    segment_msh = _generate_msh_segment(context, msg_ctrl_id=msg_ctrl_id)
     segment_pid = _generate_pid_segment(patient=patient)
-    segment_obr = _generate_obr_segment(obs_set=obs_set, collector=collector)
-    segment_pv1 = _generate_pv1_segment(encounter=encounter)
+    segment_obr = _generate_obr_segment(
+        obs_set=obs_set, context=context, collector=collector
+    )
+    segment_pv1 = _generate_pv1_segment(encounter=encounter, context=context)
 
     # Generate OBX (observation) segments.
     segment_obx: List[str] = []
-    segment_obx.extend(
-        _generate_obx_overall_score(obs_set, start_idx=len(segment_obx) + 1)
-    )
-    segment_obx.extend(
-        _generate_obx_time_next_due(obs_set, start_idx=len(segment_obx) + 1)
-    )
-    segment_obx.extend(_generate_obx_mins_late(obs_set, start_idx=len(segment_obx) + 1))
-    segment_obx.extend(
-        _generate_obx_hr(obs_list, collector, start_idx=len(segment_obx) + 1)
-    )
-    segment_obx.extend(
-        _generate_obx_rr(obs_list, collector, start_idx=len(segment_obx) + 1)
-    )
-    segment_obx.extend(
-        _generate_obx_dbp(obs_list, collector, start_idx=len(segment_obx) + 1)
-    )
-    segment_obx.extend(
-        _generate_obx_sbp(obs_list, collector, start_idx=len(segment_obx) + 1)
-    )
-    segment_obx.extend(
-        _generate_obx_bp_posture(obs_list, collector, start_idx=len(segment_obx) + 1)
-    )
-    segment_obx.extend(
-        _generate_obx_spo2(obs_list, collector, start_idx=len(segment_obx) + 1)
-    )
-    segment_obx.extend(
-        _generate_obx_o2_therapy(obs_list, collector, start_idx=len(segment_obx) + 1)
-    )
-    segment_obx.extend(
-        _generate_obx_temp(obs_list, collector, start_idx=len(segment_obx) + 1)
-    )
-    segment_obx.extend(
-        _generate_obx_acvpu(obs_list, collector, start_idx=len(segment_obx) + 1)
-    )
-    segment_obx.extend(
-        _generate_obx_gcs(obs_list, collector, start_idx=len(segment_obx) + 1)
-    )
-    segment_obx.extend(
-        _generate_obx_nurse_concern(obs_list, collector, start_idx=len(segment_obx) + 1)
-    )
+    for generate_obx_for_obs_set in (
+        _generate_obx_overall_score,
+        _generate_obx_time_next_due,
+        _generate_obx_mins_late,
+    ):
+        segment_obx.extend(
+            generate_obx_for_obs_set(obs_set, context, start_idx=len(segment_obx) + 1)
+        )
+    for template in context.obx_templates:
+        segment_obx.extend(
+            _OBX_RENDERERS[template.renderer](
+                template, context, collector, len(segment_obx) + 1
+            )
+        )
 
     oru_message_segments = [segment_msh, segment_pid]
     if segment_pv1 is not None:
@@ -104,9 +134,11 @@ def generate_oru_message(
     return full_oru_message
 
 
-def _generate_msh_segment(msg_ctrl_id: Optional[str] = None) -> str:
+def _generate_msh_segment(
+    context: _OruContext, msg_ctrl_id: Optional[str] = None
+) -> str:
     logger.debug("Generating MSH segment")
-    trustomer_config: Dict = trustomer.get_trustomer_config()
+    trustomer_config: Dict = context.trustomer_config
     receiving_application = _hl7_escape(
         trustomer_config["hl7_config"]["outgoing_receiving_application"]
     )
@@ -157,7 +189,7 @@ def _generate_pid_segment(patient: Dict) -> str:
     return pid_segment
 
 
-def _generate_pv1_segment(encounter: Dict) -> Union[str, None]:
+def _generate_pv1_segment(encounter: Dict, context: _OruContext) -> Union[str, None]:
     logger.debug("Generating PV1 segment")
     epr_encounter_id: Optional[str] = encounter.get("epr_encounter_id")
     if epr_encounter_id is None:
@@ -166,17 +198,19 @@ def _generate_pv1_segment(encounter: Dict) -> Union[str, None]:
     location_ods_code: str = encounter[
         "location_ods_code"
     ]  # Don't escape this because it's a field
-    admission_date: str = Hl7Wrapper.iso8601_to_hl7_datetime(encounter["admitted_at"])
+    admission_date: str = context.hl7_datetime(encounter["admitted_at"])
     pv1_segment: str = f"PV1|1||{location_ods_code}||||||||||||||||{escaped_epr_id}|||||||||||||||||||||||||{admission_date}"
     logger.debug("Generated PV1 segment", extra={"pv1_segment": pv1_segment})
     return pv1_segment
 
 
-def _generate_obr_segment(obs_set: Dict, collector: str = None) -> str:
+def _generate_obr_segment(
+    obs_set: Dict, context: _OruContext, collector: str = None
+) -> str:
     logger.debug("Generating OBR segment")
     collector_field = collector if collector else ""
     filler_order_number = _hl7_escape(obs_set["uuid"])
-    obs_set_datetime = Hl7Wrapper.iso8601_to_hl7_datetime(obs_set["record_time"])
+    obs_set_datetime = context.hl7_datetime(obs_set["record_time"])
     obr_segment: str = f"OBR|1||{filler_order_number}|EWS|||{obs_set_datetime}|||{collector_field}|||||||||||||||F"
     logger.debug("Generated OBR segment", extra={"obr_segment": obr_segment})
     return obr_segment
@@ -223,279 +257,117 @@ def _float_or_none_to_str(obs_value: Optional[str]) -> str:
     return str(round(float(obs_value))) if obs_value else ""
 
 
-def _get_obs_with_value(observations: List[Dict], obs_type: str) -> Optional[Dict]:
-    obs = next((o for o in observations if o["observation_type"] == obs_type), None)
-    if obs is None:
-        # No obs found with that name.
-        return None
-    if (
-        obs["observation_value"] is None
-        and obs["observation_string"] is None
-        and obs["patient_refused"] is False
-    ):
-        # There is no value in the observation, so we don't care about it.
-        return None
-    return obs
-
-
-def _generate_obx_hr(
-    obs_list: List[Dict], collector: Optional[str], start_idx: int
-) -> List[str]:
-    logger.debug("Generating OBX segments for heart rate")
-    segments: List[str] = []
-    obs_hr: Optional[Dict] = _get_obs_with_value(obs_list, obs_type="heart_rate")
-    if obs_hr is not None:
-        obs_hr_datetime = Hl7Wrapper.iso8601_to_hl7_datetime(obs_hr["measured_time"])
-        segments.append(
-            _generate_obx_segment(
-                idx=start_idx,
-                obs_category="NM",
-                obs_code="HR",
-                obs_value=_float_or_none_to_str(obs_hr["observation_value"]),
-                obs_unit=_hl7_escape(obs_hr["observation_unit"]),
-                obs_datetime=obs_hr_datetime,
-                collector=collector,
-                patient_refused=obs_hr["patient_refused"],
-            )
-        )
-        segments.append(
-            _generate_obx_segment(
-                idx=start_idx + 1,
-                obs_category="NM",
-                obs_code="HRScore",
-                obs_value=obs_hr["score_value"],
-                obs_datetime=obs_hr_datetime,
-            )
-        )
-    logger.debug(
-        "Generated OBX segments for heart rate", extra={"obx_segments": segments}
-    )
-    return segments
-
-
-def _generate_obx_rr(
-    obs_list: List[Dict], collector: Optional[str], start_idx: int
-) -> List[str]:
-    logger.debug("Generating OBX segments for respiratory rate")
-    segments: List[str] = []
-    obs_rr: Optional[Dict] = _get_obs_with_value(obs_list, obs_type="respiratory_rate")
-    if obs_rr is not None:
-        obs_rr_datetime = Hl7Wrapper.iso8601_to_hl7_datetime(obs_rr["measured_time"])
-        segments.append(
-            _generate_obx_segment(
-                idx=start_idx,
-                obs_category="NM",
-                obs_code="RR",
-                obs_value=_float_or_none_to_str(obs_rr["observation_value"]),
-                obs_unit=_hl7_escape(obs_rr["observation_unit"]),
-                obs_datetime=obs_rr_datetime,
-                collector=collector,
-                patient_refused=obs_rr["patient_refused"],
-            )
-        )
-        segments.append(
-            _generate_obx_segment(
-                idx=start_idx + 1,
-                obs_category="NM",
-                obs_code="RRScore",
-                obs_value=obs_rr["score_value"],
-                obs_datetime=obs_rr_datetime,
-            )
-        )
-    logger.debug(
-        "Generated OBX segments for respiratory rate", extra={"obx_segments": segments}
+def _has_value(obs: Dict) -> bool:
+    # Observations with no value (and not refused) are left out of the message.
+    return (
+        obs["observation_value"] is not None
+        or obs["observation_string"] is not None
+        or obs["patient_refused"] is not False
     )
-    return segments
 
 
-def _generate_obx_dbp(
-    obs_list: List[Dict], collector: Optional[str], start_idx: int
-) -> List[str]:
-    logger.debug("Generating OBX segments for diastolic blood pressure")
-    segments: List[str] = []
-    obs_dbp: Optional[Dict] = _get_obs_with_value(
-        obs_list, obs_type="diastolic_blood_pressure"
-    )
-    if obs_dbp is not None:
-        obs_dbp_datetime = Hl7Wrapper.iso8601_to_hl7_datetime(obs_dbp["measured_time"])
-        segments.append(
-            _generate_obx_segment(
-                idx=start_idx,
-                obs_category="NM",
-                obs_code="DBP",
-                obs_value=_float_or_none_to_str(obs_dbp["observation_value"]),
-                obs_unit=_hl7_escape(obs_dbp["observation_unit"]),
-                obs_datetime=obs_dbp_datetime,
-                collector=collector,
-                patient_refused=obs_dbp["patient_refused"],
-            )
-        )
-        if obs_dbp.get("score_value", None) is not None:
-            segments.append(
-                _generate_obx_segment(
-                    idx=start_idx + 1,
-                    obs_category="NM",
-                    obs_code="DBPScore",
-                    obs_value=obs_dbp["score_value"],
-                    obs_datetime=obs_dbp_datetime,
-                )
-            )
-    logger.debug(
-        "Generated OBX segments for diastolic blood pressure",
-        extra={"obx_segments": segments},
-    )
-    return segments
+def _format_obs_value(value_format: str, obs: Dict) -> str:
+    # See obx_mapping.VALUE_FORMATS.
+    if value_format == "integer":
+        return _float_or_none_to_str(obs["observation_value"])
+    if value_format == "number":
+        return f"{obs['observation_value']}"
+    value: str = _hl7_escape(obs["observation_string"])
+    if value_format == "coded_string":
+        return f"{value[0]}^{value}"
+    return value
 
 
-def _generate_obx_sbp(
-    obs_list: List[Dict], collector: Optional[str], start_idx: int
+def _generate_obx_observation(
+    template: ObxTemplate,
+    context: _OruContext,
+    collector: Optional[str],
+    start_idx: int,
 ) -> List[str]:
-    logger.debug("Generating OBX segments for systolic blood pressure")
-    segments: List[str] = []
-    obs_sbp: Optional[Dict] = _get_obs_with_value(
-        obs_list, obs_type="systolic_blood_pressure"
-    )
-    if obs_sbp is not None:
-        obs_sbp_datetime = Hl7Wrapper.iso8601_to_hl7_datetime(obs_sbp["measured_time"])
-        segments.append(
-            _generate_obx_segment(
-                idx=start_idx,
-                obs_category="NM",
-                obs_code="SBP",
-                obs_value=_float_or_none_to_str(obs_sbp["observation_value"]),
-                obs_unit=_hl7_escape(obs_sbp["observation_unit"]),
-                obs_datetime=obs_sbp_datetime,
-                collector=collector,
-                patient_refused=obs_sbp["patient_refused"],
-            )
-        )
-        segments.append(
-            _generate_obx_segment(
-                idx=start_idx + 1,
-                obs_category="NM",
-                obs_code="SBPScore",
-                obs_value=obs_sbp["score_value"],
-                obs_datetime=obs_sbp_datetime,
-            )
-        )
-    logger.debug(
-        "Generated OBX segments for systolic blood pressure",
-        extra={"obx_segments": segments},
-    )
-    return segments
-
-
-def _generate_obx_bp_posture(
-    obs_list: List[Dict], collector: Optional[str], start_idx: int
-) -> List[str]:
-    logger.debug("Generating OBX segments for bp posture")
-    segments: List[str] = []
-
-    # Get the position from either SBP or DBP obs metadata.
-    obs_sbp: Optional[Dict] = _get_obs_with_value(
-        obs_list, obs_type="systolic_blood_pressure"
-    )
-    obs_dbp: Optional[Dict] = _get_obs_with_value(
-        obs_list, obs_type="diastolic_blood_pressure"
-    )
-    if (
-        obs_sbp is not None
-        and obs_sbp.get("observation_metadata")
-        and obs_sbp["observation_metadata"].get("patient_position")
-    ):
-        position_value = obs_sbp["observation_metadata"]["patient_position"]
-        position_datetime_iso = obs_sbp["measured_time"]
-    elif (
-        obs_dbp is not None
-        and obs_dbp.get("observation_metadata")
-        and obs_dbp["observation_metadata"].get("patient_position")
-    ):
-        position_value = obs_dbp["observation_metadata"]["patient_position"]
-        position_datetime_iso = obs_dbp["measured_time"]
+    obs: Optional[Dict] = context.get_obs(template.observation_types[0])
+    if obs is None:
+        return []
+    obs_datetime: str = context.hl7_datetime(obs["measured_time"])
+    if template.patient_refused and obs["patient_refused"]:
+        obs_value: str = "patient_refused"
     else:
-        position_value = None
-        position_datetime_iso = None
-    if position_value is not None:
-        position_datetime = Hl7Wrapper.iso8601_to_hl7_datetime(position_datetime_iso)
+        obs_value = _format_obs_value(template.value, obs)
+    obs_unit: str = _hl7_escape(obs["observation_unit"]) if template.unit else ""
+    obs_unit_field: str = f"^{obs_unit}" if obs_unit else ""
+    collector_field: str = f"||{collector}" if collector else ""
+    segments: List[str] = [
+        f"OBX|{start_idx}{template.prefix}{obs_value}|{obs_unit_field}"
+        f"|||||F|||{obs_datetime}{collector_field}"
+    ]
+    if template.score_code is not None and (
+        template.score_required or obs.get("score_value") is not None
+    ):
         segments.append(
-            _generate_obx_segment(
-                idx=start_idx,
-                obs_category="ST",
-                obs_code="BPPOS",
-                obs_value=_hl7_escape(position_value),
-                obs_datetime=position_datetime,
-                collector=collector,
-            )
+            f"OBX|{start_idx + 1}{template.score_prefix}{obs['score_value']}"
+            f"||||||F|||{obs_datetime}"
         )
-    logger.debug(
-        "Generated OBX segments for bp posture", extra={"obx_segments": segments}
-    )
     return segments
 
 
-def _generate_obx_spo2(
-    obs_list: List[Dict], collector: Optional[str], start_idx: int
+def _generate_obx_bp_posture(
+    template: ObxTemplate,
+    context: _OruContext,
+    collector: Optional[str],
+    start_idx: int,
 ) -> List[str]:
-    logger.debug("Generating OBX segments for oxygen saturation")
-    segments: List[str] = []
-    obs_spo2: Optional[Dict] = _get_obs_with_value(obs_list, obs_type="spo2")
-    if obs_spo2 is not None:
-        obs_spo2_datetime = Hl7Wrapper.iso8601_to_hl7_datetime(
-            obs_spo2["measured_time"]
-        )
-        segments.append(
-            _generate_obx_segment(
-                idx=start_idx,
-                obs_category="NM",
-                obs_code="SPO2",
-                obs_value=_float_or_none_to_str(obs_spo2["observation_value"]),
-                obs_unit=_hl7_escape(obs_spo2["observation_unit"]),
-                obs_datetime=obs_spo2_datetime,
-                collector=collector,
-                patient_refused=obs_spo2["patient_refused"],
-            )
-        )
-        segments.append(
-            _generate_obx_segment(
-                idx=start_idx + 1,
-                obs_category="NM",
-                obs_code="SPO2Score",
-                obs_value=obs_spo2["score_value"],
-                obs_datetime=obs_spo2_datetime,
-            )
-        )
-    logger.debug(
-        "Generated OBX segments for oxygen saturation", extra={"obx_segments": segments}
-    )
-    return segments
+    # Get the position from the metadata of the first observation (e.g. SBP, then DBP) with one.
+    for obs_type in template.observation_types:
+        obs: Optional[Dict] = context.get_obs(obs_type)
+        if (
+            obs is not None
+            and obs.get("observation_metadata")
+            and obs["observation_metadata"].get("patient_position")
+        ):
+            return [
+                _generate_obx_segment(
+                    idx=start_idx,
+                    obs_category=template.category,
+                    obs_code=template.code,
+                    obs_value=_hl7_escape(
+                        obs["observation_metadata"]["patient_position"]
+                    ),
+                    obs_datetime=context.hl7_datetime(obs["measured_time"]),
+                    collector=collector,
+                )
+            ]
+    return []
 
 
 def _generate_obx_o2_therapy(
-    obs_list: List[Dict], collector: Optional[str], start_idx: int
+    template: ObxTemplate,
+    context: _OruContext,
+    collector: Optional[str],
+    start_idx: int,
 ) -> List[str]:
-    logger.debug("Generating OBX segments for oxygen therapy")
     segments: List[str] = []
-    obs_o2_therapy: Optional[Dict] = _get_obs_with_value(
-        obs_list, obs_type="o2_therapy_status"
-    )
+    obs_o2_therapy: Optional[Dict] = context.get_obs(template.observation_types[0])
     if obs_o2_therapy is not None:
-        obs_o2_therapy_datetime = Hl7Wrapper.iso8601_to_hl7_datetime(
-            obs_o2_therapy["measured_time"]
-        )
+        obs_o2_therapy_datetime = context.hl7_datetime(obs_o2_therapy["measured_time"])
 
         segments.append(
             _generate_obx_segment(
                 idx=start_idx,
-                obs_category="NM",
-                obs_code="O2Rate",
-                obs_value=obs_o2_therapy["observation_value"],
-                obs_unit=_hl7_escape(obs_o2_therapy["observation_unit"]),
+                obs_category=template.category,
+                obs_code=template.code,
+                obs_value=_format_obs_value(template.value, obs_o2_therapy),
+                obs_unit=_hl7_escape(obs_o2_therapy["observation_unit"])
+                if template.unit
+                else None,
                 obs_datetime=obs_o2_therapy_datetime,
                 collector=collector,
+                patient_refused=template.patient_refused
+                and obs_o2_therapy["patient_refused"],
             )
         )
         start_idx += 1
-        mask_code, mask_name = _get_o2_mask_type(obs_o2_therapy)
+        mask_code, mask_name = _get_o2_mask_type(
+            obs_o2_therapy, context.trustomer_config
+        )
 
         if mask_code is not None:
             segments.append(
@@ -509,24 +381,24 @@ def _generate_obx_o2_therapy(
                 )
             )
             start_idx += 1
-        if obs_o2_therapy.get("score_value", None) is not None:
+        if template.score_code is not None and (
+            template.score_required
+            or obs_o2_therapy.get("score_value", None) is not None
+        ):
             segments.append(
                 _generate_obx_segment(
                     idx=start_idx,
                     obs_category="NM",
-                    obs_code="O2Score",
+                    obs_code=template.score_code,
                     obs_value=obs_o2_therapy["score_value"],
                     obs_datetime=obs_o2_therapy_datetime,
                 )
             )
-    logger.debug(
-        "Generated OBX segments for oxygen therapy", extra={"obx_segments": segments}
-    )
     return segments
 
 
 def _get_o2_mask_type(
-    obs_o2_therapy: Dict[str, Any]
+    obs_o2_therapy: Dict[str, Any], trustomer_config: Dict
 ) -> Tuple[Optional[str], Optional[str]]:
     observation_metadata: Optional[Dict] = obs_o2_therapy.get("observation_metadata")
     if observation_metadata is None:
@@ -536,7 +408,6 @@ def _get_o2_mask_type(
     if not mask_name:
         return None, None
 
-    trustomer_config: Dict = trustomer.get_trustomer_config()
     oxygen_masks = trustomer_config["send_config"]["oxygen_masks"]
     mask_code = None
     mask_pct = obs_o2_therapy["observation_metadata"].get("mask_percent", None)
@@ -554,93 +425,19 @@ def _get_o2_mask_type(
     return mask_code, mask_name
 
 
-def _generate_obx_temp(
-    obs_list: List[Dict], collector: Optional[str], start_idx: int
-) -> List[str]:
-    logger.debug("Generating OBX segments for temperature")
-    segments: List[str] = []
-    obs_temp: Optional[Dict] = _get_obs_with_value(obs_list, obs_type="temperature")
-    if obs_temp is not None:
-        obs_temp_datetime = Hl7Wrapper.iso8601_to_hl7_datetime(
-            obs_temp["measured_time"]
-        )
-        segments.append(
-            _generate_obx_segment(
-                idx=start_idx,
-                obs_category="NM",
-                obs_code="TEMP",
-                obs_value=obs_temp["observation_value"],
-                obs_unit=_hl7_escape(obs_temp["observation_unit"]),
-                obs_datetime=obs_temp_datetime,
-                collector=collector,
-                patient_refused=obs_temp["patient_refused"],
-            )
-        )
-        segments.append(
-            _generate_obx_segment(
-                idx=start_idx + 1,
-                obs_category="NM",
-                obs_code="TEMPScore",
-                obs_value=obs_temp["score_value"],
-                obs_datetime=obs_temp_datetime,
-            )
-        )
-    logger.debug(
-        "Generated OBX segments for temperature", extra={"obx_segments": segments}
-    )
-    return segments
-
-
-def _generate_obx_acvpu(
-    obs_list: List[Dict], collector: Optional[str], start_idx: int
-) -> List[str]:
-    logger.debug("Generating OBX segments for ACVPU")
-    segments: List[str] = []
-    obs_acvpu: Optional[Dict] = _get_obs_with_value(
-        obs_list, obs_type="consciousness_acvpu"
-    )
-    if obs_acvpu is not None:
-        obs_acvpu_datetime = Hl7Wrapper.iso8601_to_hl7_datetime(
-            obs_acvpu["measured_time"]
-        )
-        acvpu_value = _hl7_escape(obs_acvpu["observation_string"])
-        segments.append(
-            _generate_obx_segment(
-                idx=start_idx,
-                obs_category="CE",
-                obs_code="ACVPU",
-                obs_value=f"{acvpu_value[0]}^{acvpu_value}",
-                obs_datetime=obs_acvpu_datetime,
-                collector=collector,
-            )
-        )
-        segments.append(
-            _generate_obx_segment(
-                idx=start_idx + 1,
-                obs_category="NM",
-                obs_code="ACVPUScore",
-                obs_value=obs_acvpu["score_value"],
-                obs_datetime=obs_acvpu_datetime,
-            )
-        )
-    logger.debug("Generated OBX segments for ACVPU", extra={"obx_segments": segments})
-    return segments
-
-
 def _generate_obx_gcs(
-    obs_list: List[Dict], collector: Optional[str], start_idx: int
+    template: ObxTemplate,
+    context: _OruContext,
+    collector: Optional[str],
+    start_idx: int,
 ) -> List[str]:
-    logger.debug("Generating OBX segments for GCS")
     segments: List[str] = []
-    obs_gcs: Optional[Dict] = _get_obs_with_value(
-        obs_list, obs_type="consciousness_gcs"
-    )
+    obs_gcs: Optional[Dict] = context.get_obs(template.observation_types[0])
 
     if obs_gcs is None:
-        logger.debug("No GCS in observation set, no OBX segments to include")
         return []
 
-    obs_gcs_datetime = Hl7Wrapper.iso8601_to_hl7_datetime(obs_gcs["measured_time"])
+    obs_gcs_datetime = context.hl7_datetime(obs_gcs["measured_time"])
 
     current_obx_index: int = start_idx
     meta: Optional[Dict] = obs_gcs.get("observation_metadata")
@@ -680,27 +477,26 @@ def _generate_obx_gcs(
     segments.append(
         _generate_obx_segment(
             idx=current_obx_index,
-            obs_category="NM",
-            obs_code="GCS",
+            obs_category=template.category,
+            obs_code=template.code,
             obs_value=obs_value,
             obs_datetime=obs_gcs_datetime,
             collector=collector,
         )
     )
-    logger.debug("Generated OBX segments for GCS", extra={"obx_segments": segments})
     return segments
 
 
 def _generate_obx_nurse_concern(
-    obs_list: List[Dict], collector: Optional[str], start_idx: int
+    template: ObxTemplate,
+    context: _OruContext,
+    collector: Optional[str],
+    start_idx: int,
 ) -> List[str]:
-    logger.debug("Generating OBX segments for nurse concern")
     segments: List[str] = []
-    obs_nurse_concern: Optional[Dict] = _get_obs_with_value(
-        obs_list, obs_type="nurse_concern"
-    )
+    obs_nurse_concern: Optional[Dict] = context.get_obs(template.observation_types[0])
     if obs_nurse_concern is not None:
-        obs_nurse_concern_datetime = Hl7Wrapper.iso8601_to_hl7_datetime(
+        obs_nurse_concern_datetime = context.hl7_datetime(
             obs_nurse_concern["measured_time"]
         )
         nurse_concern_list: List[str] = obs_nurse_concern["observation_string"].split(
@@ -713,23 +509,34 @@ def _generate_obx_nurse_concern(
             segments.append(
                 _generate_obx_segment(
                     idx=start_idx + idx,
-                    obs_category="ST",
-                    obs_code="NC",
+                    obs_category=template.category,
+                    obs_code=template.code,
                     obs_value=nurse_concern_value,
                     obs_datetime=obs_nurse_concern_datetime,
                     collector=collector,
                 )
             )
-        logger.debug(
-            "Generated OBX segments for Nurse concern", extra={"obx_segments": segments}
-        )
     return segments
 
 
-def _generate_obx_overall_score(obs_set: Dict, start_idx: int) -> List[str]:
+# Renders the segments for an OBX template: (template, context, collector, start index).
+_OBX_RENDERERS: Dict[
+    str, Callable[[ObxTemplate, _OruContext, Optional[str], int], List[str]]
+] = {
+    "observation": _generate_obx_observation,
+    "bp_posture": _generate_obx_bp_posture,
+    "o2_therapy": _generate_obx_o2_therapy,
+    "gcs": _generate_obx_gcs,
+    "nurse_concern": _generate_obx_nurse_concern,
+}
+
+
+def _generate_obx_overall_score(
+    obs_set: Dict, context: _OruContext, start_idx: int
+) -> List[str]:
     logger.debug("Generating OBX segments for overall score")
     segments: List[str] = []
-    obs_set_datetime = Hl7Wrapper.iso8601_to_hl7_datetime(obs_set["record_time"])
+    obs_set_datetime = context.hl7_datetime(obs_set["record_time"])
     current_idx: int = start_idx
 
     # OBX ScoreSystem
@@ -799,17 +606,17 @@ def _generate_obx_overall_score(obs_set: Dict, start_idx: int) -> List[str]:
     return segments
 
 
-def _generate_obx_time_next_due(obs_set: Dict, start_idx: int) -> List[str]:
+def _generate_obx_time_next_due(
+    obs_set: Dict, context: _OruContext, start_idx: int
+) -> List[str]:
 
     logger.debug("Generating OBX segments for time nex obs set due")
     current_idx: int = start_idx
-    obs_set_datetime = Hl7Wrapper.iso8601_to_hl7_datetime(obs_set["record_time"])
+    obs_set_datetime = context.hl7_datetime(obs_set["record_time"])
     segments: List[str] = []
 
     if obs_set.get("time_next_obs_set_due"):
-        time_next_obs_set_due = Hl7Wrapper.iso8601_to_hl7_datetime(
-            obs_set["time_next_obs_set_due"]
-        )
+        time_next_obs_set_due = context.hl7_datetime(obs_set["time_next_obs_set_due"])
         segments.append(
             _generate_obx_segment(
                 idx=current_idx,
@@ -827,11 +634,13 @@ def _generate_obx_time_next_due(obs_set: Dict, start_idx: int) -> List[str]:
     return segments
 
 
-def _generate_obx_mins_late(obs_set: Dict, start_idx: int) -> List[str]:
+def _generate_obx_mins_late(
+    obs_set: Dict, context: _OruContext, start_idx: int
+) -> List[str]:
 
     logger.debug("Generating OBX segments for minutes late")
     current_idx: int = start_idx
-    obs_set_datetime = Hl7Wrapper.iso8601_to_hl7_datetime(obs_set["record_time"])
+    obs_set_datetime = context.hl7_datetime(obs_set["record_time"])
     segments: List[str] = []
 
     if obs_set.get("mins_late"):
@@ -0,0 +1,99 @@
+"""
+Compiled HL7 field paths. A path string such as "PV1.F6.R1.C3" is parsed once into an
+`Hl7Path`, which can then extract the field from a segment directly. Compiled paths are cached
+module-wide, so code should compile its paths at import time and pass the compiled objects to
+`Hl7Wrapper` rather than building path strings at runtime.
+"""
+from functools import lru_cache
+from typing import NamedTuple, Optional
+
+import hl7
+
+
+class Hl7Path(NamedTuple):
+    segment: str
+    segment_num: int = 1
+    field_num: Optional[int] = None
+    repeat_num: Optional[int] = None
+    component_num: Optional[int] = None
+    subcomponent_num: Optional[int] = None
+
+    @property
+    def key(self) -> str:
+        return hl7.Accessor(*self).key
+
+    def with_repeat(self, repeat_num: int) -> "Hl7Path":
+        # Compiled paths are cached, so looping over repetitions doesn't build new objects.
+        return _compile(
+            self.segment,
+            self.segment_num,
+            self.field_num,
+            repeat_num,
+            self.component_num,
+            self.subcomponent_num,
+        )
+
+    def extract(self, segment: hl7.Segment, message: hl7.Message) -> str:
+        """
+        Extracts the field from a segment, following the same rules as
+        `hl7.Message.extract_field` (which looks the segment up on every call). Raises
+        IndexError if the segment doesn't contain the path.
+        """
+        field_num: int = self.field_num or 1
+        repeat_num: int = self.repeat_num or 1
+        component_num: int = self.component_num or 1
+        subcomponent_num: int = self.subcomponent_num or 1
+
+        if field_num >= len(segment):
+            if repeat_num == 1 and component_num == 1 and subcomponent_num == 1:
+                return ""  # Assume non-present optional value
+            raise IndexError(f"Field not present: {self.key}")
+
+        rep = segment(field_num)(repeat_num)
+        if not isinstance(rep, hl7.Repetition):
+            # Leaf
+            if component_num == 1 and subcomponent_num == 1:
+                if self.segment == "MSH" and field_num in (1, 2):
+                    return rep
+                return message.unescape(rep)
+            raise IndexError(
+                f"Field reaches leaf node before completing path: {self.key}"
+            )
+
+        if component_num > len(rep):
+            if subcomponent_num == 1:
+                return ""  # Assume non-present optional value
+            raise IndexError(f"Component not present: {self.key}")
+
+        component = rep(component_num)
+        if not isinstance(component, hl7.Component):
+            # Leaf
+            if subcomponent_num == 1:
+                return message.unescape(component)
+            raise IndexError(
+                f"Field reaches leaf node before completing path: {self.key}"
+            )
+
+        if subcomponent_num <= len(component):
+            return message.unescape(component(subcomponent_num))
+        return ""  # Assume non-present optional value
+
+
+@lru_cache(maxsize=None)
+def compile_path(path: str) -> Hl7Path:
+    """Compiles a path such as "PID.F3.R1.C5". Raises ValueError if the path is invalid."""
+    return _compile(*hl7.Accessor.parse_key(path))
+
+
+@lru_cache(maxsize=None)
+def _compile(
+    segment: str,
+    segment_num: int,
+    field_num: Optional[int],
+    repeat_num: Optional[int],
+    component_num: Optional[int],
+    subcomponent_num: Optional[int],
+) -> Hl7Path:
+    return Hl7Path(
+        segment, segment_num, field_num, repeat_num, component_num, subcomponent_num
+    )
@@ -1,7 +1,8 @@
 import json
 import os
-from datetime import datetime
-from typing import Dict, Optional
+import threading
+from datetime import datetime, tzinfo
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Tuple, Union
 
 import hl7
 import pytz
@@ -14,6 +15,25 @@ from hl7 import generate_message_control_id as _generate_message_control_id
 from she_logging import logger
 
 from dhos_connector_api.helpers import trustomer
+from dhos_connector_api.helpers.adt_extractor import ExtractedFields, extract_fields
+from dhos_connector_api.helpers.hl7_path import Hl7Path, compile_path
+
+MESSAGE_DATETIME_PATH = compile_path("MSH.F7")
+MESSAGE_CONTROL_ID_PATH = compile_path("MSH.F10.R1.C1")
+PATIENT_IDENTIFIER_TYPE_PATH = compile_path("PID.F3.R1.C5")
+PATIENT_IDENTIFIER_PATH = compile_path("PID.F3.R1.C1")
+MERGED_PATIENT_IDENTIFIER_TYPE_PATH = compile_path("MRG.F1.R1.C5")
+MERGED_PATIENT_IDENTIFIER_PATH = compile_path("MRG.F1.R1.C1")
+VISIT_ID_PATH = compile_path("PV1.F19")
+IDENTIFIER_PATHS = (
+    PATIENT_IDENTIFIER_TYPE_PATH,
+    PATIENT_IDENTIFIER_PATH,
+    MERGED_PATIENT_IDENTIFIER_TYPE_PATH,
+    MERGED_PATIENT_IDENTIFIER_PATH,
+)
+
+# Bumped whenever the layout of the stored parsed representation changes.
+PARSED_REPRESENTATION_VERSION = 1
 
 
 class Hl7Wrapper:
@@ -22,31 +42,159 @@ class Hl7Wrapper:
     confused with the HL7Message model, which is what is persisted in the database.
     """
 
-    def __init__(self, raw_message: str):
+    def __init__(
+        self,
+        raw_message: str,
+        extracted: ExtractedFields = None,
+        parsed: hl7.Message = None,
+    ):
+        """
+        Parses the message with the hl7 library, unless it has already been `parsed` or fields
+        have already been `extracted` from the raw message, in which case it is only parsed if
+        something else is needed.
+        """
         self.raw_message = raw_message
-        self.parsed = hl7.parse(raw_message)
+        self._parsed: Optional[hl7.Message] = None
+        self._segments: Dict[str, List[hl7.Segment]] = {}
+        # Resolved fields are memoised (None meaning missing) on first lookup.
+        self._fields: Dict[Union[str, Hl7Path], Optional[str]] = {}
+        self._raw_fields: Dict[Tuple[str, int], str] = {}
+        self._extracted: Optional[ExtractedFields] = extracted
+        if parsed is not None:
+            self._set_parsed(parsed)
+            self._segment_ids: FrozenSet[str] = frozenset(self._segments)
+        elif extracted is None:
+            self._parse()
+            self._segment_ids = frozenset(self._segments)
+        else:
+            self._segment_ids = extracted.segment_ids
+            self._fields.update(extracted.fields.items())
+            self._raw_fields.update(extracted.raw_fields)
+
+    @classmethod
+    def from_extracted_fields(
+        cls, raw_message: str, paths: Iterable[Hl7Path]
+    ) -> "Hl7Wrapper":
+        """
+        Extracts `paths` (plus the fields used by this class) in a single pass over the raw
+        message, falling back to the hl7 library if the message can't be handled that way.
+        """
+        extracted: Optional[ExtractedFields] = extract_fields(
+            raw_message,
+            paths=[
+                *paths,
+                MESSAGE_DATETIME_PATH,
+                MESSAGE_CONTROL_ID_PATH,
+                VISIT_ID_PATH,
+            ],
+            repeated_paths=IDENTIFIER_PATHS,
+        )
+        if extracted is None:
+            logger.debug("Falling back to full HL7 parse")
+        return cls(raw_message, extracted=extracted)
+
+    @classmethod
+    def from_parsed_representation(
+        cls, raw_message: str, representation: Dict[str, Any]
+    ) -> "Hl7Wrapper":
+        """
+        Rebuilds a wrapper from the output of `to_parsed_representation` without reparsing the
+        raw message. Raises ValueError if the representation is in an unsupported format.
+        """
+        if representation.get("version") != PARSED_REPRESENTATION_VERSION:
+            raise ValueError("Unsupported parsed HL7 message representation")
+        separators: List[str] = list(representation["separators"])
+        parsed: hl7.Message = _build_container(
+            representation["segments"], 0, separators, representation["esc"]
+        )
+        wrapper = cls(raw_message, parsed=parsed)
+        wrapper._fields.update(
+            (compile_path(path), value)
+            for path, value in representation["fields"].items()
+        )
+        return wrapper
+
+    def to_parsed_representation(self, paths: Iterable[Hl7Path] = ()) -> Dict[str, Any]:
+        """
+        Returns a JSON-serialisable form of the parsed message from which the wrapper can be
+        rebuilt, along with the values of `paths` in a flat mapping so that they can be
+        searched without walking the segments.
+        """
+        parsed: hl7.Message = self.parsed
+        return {
+            "version": PARSED_REPRESENTATION_VERSION,
+            "separators": "".join(parsed.separators),
+            "esc": parsed.esc,
+            "segments": _to_lists(parsed),
+            "fields": {path.key: self.get_field_by_hl7_path(path) for path in paths},
+        }
+
+    @property
+    def parsed(self) -> hl7.Message:
+        if self._parsed is None:
+            self._parse()
+        return self._parsed
+
+    def _parse(self) -> None:
+        self._set_parsed(hl7.parse(self.raw_message))
+
+    def _set_parsed(self, parsed: hl7.Message) -> None:
+        self._parsed = parsed
+        # The parsed message is never modified, so segments are indexed by ID once here.
+        for segment in parsed:
+            self._segments.setdefault(str(segment[0][0]), []).append(segment)
 
     def contains_segment(self, segment_id: str) -> bool:
-        # Well, this sucks.
+        return segment_id in self._segment_ids
+
+    def get_segment(self, segment_id: str) -> hl7.Segment:
+        # The first segment with this ID, raising KeyError if there isn't one.
+        if self._parsed is None:
+            self._parse()
+        try:
+            return self._segments[segment_id][0]
+        except KeyError:
+            raise KeyError(f"No {segment_id} segments")
+
+    def get_field_by_hl7_path(
+        self, path: Union[str, Hl7Path], default: str = None
+    ) -> Optional[str]:
         try:
-            self.parsed.segment(segment_id)
-            return True
+            field: Optional[str] = self._fields[path]
         except KeyError:
-            return False
+            field = self._fields[path] = self._resolve_field(path)
+        return default if field is None else field
 
-    def get_field_by_hl7_path(self, path: str, default: str = None) -> Optional[str]:
-        # Well, this also sucks.
+    def _get_raw_field(self, segment_id: str, field_num: int) -> str:
+        # Unsplit text of a field in the first segment with this ID.
         try:
-            field = str(self.parsed[path])
-            if field == '""':
-                # Empty HL7 field containing just quote marks.
-                return default
-            return field
+            return self._raw_fields[(segment_id, field_num)]
+        except KeyError:
+            raw_field = self._raw_fields[(segment_id, field_num)] = str(
+                self.get_segment(segment_id)(field_num)
+            )
+            return raw_field
+
+    def _resolve_field(self, path: Union[str, Hl7Path]) -> Optional[str]:
+        try:
+            compiled: Hl7Path = compile_path(path) if isinstance(path, str) else path
+            if compiled in self._fields:
+                # Already extracted or resolved under its compiled path.
+                return self._fields[compiled]
+            parsed: hl7.Message = self.parsed
+            segment: hl7.Segment = self._segments[compiled.segment][
+                compiled.segment_num - 1
+            ]
+            field = str(compiled.extract(segment, parsed))
         except (KeyError, IndexError, ValueError):
-            return default
+            return None
+        if field == '""':
+            # Empty HL7 field containing just quote marks.
+            return None
+        return field
 
     def get_iso8601_datetime_by_hl7_path(
-        self, path: str, default_timezone: str = "UTC"
+        self, path: Union[str, Hl7Path], default_timezone: str = "UTC"
     ) -> Optional[str]:
         hl7_timestamp: Optional[str] = self.get_field_by_hl7_path(path)
         if hl7_timestamp is None:
@@ -61,7 +209,7 @@ class Hl7Wrapper:
             dt = pytz.timezone(default_timezone).localize(dt)
         return parse_datetime_to_iso8601(dt)
 
-    def get_iso8601_date_by_hl7_path(self, path: str) -> Optional[str]:
+    def get_iso8601_date_by_hl7_path(self, path: Union[str, Hl7Path]) -> Optional[str]:
         hl7_timestamp: Optional[str] = self.get_field_by_hl7_path(path, default=None)
         dt: datetime = hl7.datatypes.parse_datetime(hl7_timestamp)
         if dt is None:
@@ -73,13 +221,13 @@ class Hl7Wrapper:
 
     def get_message_type_field(self) -> str:
         # e.g. "ADT^A01"
-        return str(self.parsed.segment("MSH")[9])
+        return self._get_raw_field("MSH", 9)
 
     def get_message_datetime_iso8601(
         self, default_timezone: str = "UTC"
     ) -> Optional[str]:
         return self.get_iso8601_datetime_by_hl7_path(
-            "MSH.F7", default_timezone=default_timezone
+            MESSAGE_DATETIME_PATH, default_timezone=default_timezone
         )
 
     def get_patient_identifier(
@@ -91,11 +239,12 @@ class Hl7Wrapper:
         if identifier_type == "NHS":
             identifiers_to_search = ["NHS", "NHSNBR", "NHSNMBR"]
 
-        for i in range(len(self.parsed.segment("PID")[3])):
-            pid = self.get_field_by_hl7_path(f"PID.F3.R{i+1}.C5", default=default)
-            if pid in identifiers_to_search:
-                return self.get_field_by_hl7_path(f"PID.F3.R{i+1}.C1", default=default)
-        return default
+        return self._find_identifier(
+            identifiers_to_search,
+            PATIENT_IDENTIFIER_TYPE_PATH,
+            PATIENT_IDENTIFIER_PATH,
+            default=default,
+        )
 
     def get_merged_patient_identifier(
         self, identifier_type: str, default: str = None
@@ -106,19 +255,45 @@ class Hl7Wrapper:
         if identifier_type == "NHS":
             identifiers_to_search = ["NHS", "NHSNBR", "NHSNMBR"]
 
-        for i in range(len(self.parsed.segment("MRG")[1])):
-            pid = self.get_field_by_hl7_path(f"MRG.F1.R{i+1}.C5", default=default)
-            if pid in identifiers_to_search:
-                return self.get_field_by_hl7_path(f"MRG.F1.R{i+1}.C1", default=default)
+        return self._find_identifier(
+            identifiers_to_search,
+            MERGED_PATIENT_IDENTIFIER_TYPE_PATH,
+            MERGED_PATIENT_IDENTIFIER_PATH,
+            default=default,
+        )
+
+    def _find_identifier(
+        self,
+        identifiers_to_search: List[str],
+        type_path: Hl7Path,
+        value_path: Hl7Path,
+        default: Optional[str],
+    ) -> Optional[str]:
+        # Search each repetition of an identifier list field for one of the given types.
+        field: str = self._get_raw_field(type_path.segment, type_path.field_num or 1)
+        for i in range(1, field.count("~") + 2):
+            identifier_type = self.get_field_by_hl7_path(
+                type_path.with_repeat(i), default=default
+            )
+            if identifier_type in identifiers_to_search:
+                return self.get_field_by_hl7_path(
+                    value_path.with_repeat(i), default=default
+                )
         return default
 
     def get_message_control_id(self) -> Optional[str]:
-        return self.get_field_by_hl7_path("MSH.F10.R1.C1")
+        return self.get_field_by_hl7_path(MESSAGE_CONTROL_ID_PATH)
 
     def generate_ack(
         self, ack_code: str, error_code: str = "", error_msg: str = ""
     ) -> str:
-        ack: str = str(self.parsed.create_ack(ack_code))
+        # Only the MSH segment is needed to create an ACK, so avoid a full parse if possible.
+        source: hl7.Message = (
+            hl7.parse(self._extracted.msh_segment)
+            if self._parsed is None and self._extracted is not None
+            else self.parsed
+        )
+        ack: str = str(source.create_ack(ack_code))
         if error_msg or error_code:
             ack += f"\nERR|||{error_code}|E||||{error_msg}"
         return ack
@@ -127,7 +302,7 @@ class Hl7Wrapper:
         return {
             "NHS number": self.get_patient_identifier("NHS"),
             "MRN": self.get_patient_identifier("MRN"),
-            "Visit ID": self.get_field_by_hl7_path("PV1.F19"),
+            "Visit ID": self.get_field_by_hl7_path(VISIT_ID_PATH),
         }
 
     @classmethod
@@ -138,32 +313,132 @@ class Hl7Wrapper:
     def generate_hl7_datetime_now(
         cls, server_tz: str = os.environ["SERVER_TIMEZONE"]
     ) -> str:
-        server_timezone = pytz.timezone(server_tz)
-        current_time = datetime.now(server_timezone)
-        ans = cls.hl7_datetime_format(current_time)
-        return ans
+        return get_hl7_datetime_formatter(server_tz).now()
 
     @classmethod
     def iso8601_to_hl7_datetime(
         cls, iso8601: str, server_tz: str = os.environ["SERVER_TIMEZONE"]
     ) -> str:
+        return get_hl7_datetime_formatter(server_tz).from_iso8601(iso8601)
+
+    @classmethod
+    def hl7_datetime_format(cls, date_time: datetime) -> str:
+        return get_hl7_datetime_formatter().format(date_time)
+
+
+class Hl7DatetimeFormatter:
+    """
+    Formats datetimes as HL7 timestamps in the server timezone, using a trustomer's outgoing
+    timestamp format. The format (which may use %L for milliseconds) and timezone are
+    compiled once, so use `get_hl7_datetime_formatter` rather than creating these directly.
+    """
+
+    def __init__(self, timestamp_format: str, server_tz: str) -> None:
+        self.timestamp_format = timestamp_format
+        self.timezone: tzinfo = pytz.timezone(server_tz)
+        # We use %L as a custom strftime formatter referring to milliseconds.
+        self._sections: Optional[List[str]] = (
+            timestamp_format.split("%L") if "%L" in timestamp_format else None
+        )
+
+    def format(self, date_time: datetime) -> str:
+        """Formats `date_time` as it is, without converting it to the server timezone."""
+        if self._sections is None:
+            return date_time.strftime(self.timestamp_format)
+        millis: str = date_time.strftime("%f")[:-3]
+        return millis.join([date_time.strftime(s) for s in self._sections])
+
+    def now(self) -> str:
+        return self.format(datetime.now(self.timezone))
+
+    def from_iso8601(self, iso8601: str) -> str:
         dt = parse_iso8601_to_datetime(iso8601)
         if dt is None:
             return ""
+        return self.format(dt.astimezone(self.timezone))
 
-        stc = pytz.timezone(server_tz)
-        dt = dt.astimezone(stc)
-        return cls.hl7_datetime_format(dt)
+    def from_iso8601_list(self, iso8601_list: Iterable[str]) -> List[str]:
+        """
+        Converts several ISO8601 timestamps at once. Parsing is the slow part, and timestamps
+        are often repeated (e.g. observations measured together), so each distinct timestamp
+        is only converted once.
+        """
+        converted: Dict[str, str] = {}
+        result: List[str] = []
+        for iso8601 in iso8601_list:
+            hl7_datetime: Optional[str] = converted.get(iso8601)
+            if hl7_datetime is None:
+                hl7_datetime = converted[iso8601] = self.from_iso8601(iso8601)
+            result.append(hl7_datetime)
+        return result
 
-    @classmethod
-    def hl7_datetime_format(cls, date_time: datetime) -> str:
-        trustomer_config: Dict = trustomer.get_trustomer_config()
-        timestamp_format: str = trustomer_config["hl7_config"][
-            "outgoing_timestamp_format"
+
+# Formatters for the current trustomer config by timezone, cleared when the config changes.
+_formatters: Dict[str, Hl7DatetimeFormatter] = {}
+_formatters_generation: int = 0
+_formatters_lock = threading.Lock()
+
+
+def get_hl7_datetime_formatter(
+    server_tz: str = os.environ["SERVER_TIMEZONE"],
+) -> Hl7DatetimeFormatter:
+    formatter: Optional[Hl7DatetimeFormatter] = _formatters.get(server_tz)
+    if formatter is not None:
+        return formatter
+    generation: int = _formatters_generation
+    trustomer_config: Dict = trustomer.get_trustomer_config()
+    formatter = Hl7DatetimeFormatter(
+        trustomer_config["hl7_config"]["outgoing_timestamp_format"], server_tz
+    )
+    with _formatters_lock:
+        # Don't cache a formatter for a config that changed while it was being compiled.
+        if generation == _formatters_generation:
+            _formatters[server_tz] = formatter
+    return formatter
+
+
+def clear_hl7_datetime_formatters(trustomer_config: Optional[Dict] = None) -> None:
+    global _formatters_generation
+    with _formatters_lock:
+        _formatters_generation += 1
+        _formatters.clear()
+
+
+trustomer.add_change_listener(clear_hl7_datetime_formatters)
+
+
+# Containers at each depth of the parse tree, from message down to component.
+_CONTAINER_TYPES = (
+    hl7.Factory.create_message,
+    hl7.Factory.create_segment,
+    hl7.Factory.create_field,
+    hl7.Factory.create_repetition,
+    hl7.Factory.create_component,
+)
+
+
+def _to_lists(container: Union[hl7.Container, str]) -> Union[List, str]:
+    if isinstance(container, list):
+        return [_to_lists(child) for child in container]
+    return container
+
+
+def _build_container(
+    data: Union[List, str], depth: int, separators: List[str], esc: str
+) -> Any:
+    # Rebuilds the containers that hl7.parse would have produced for this part of the message.
+    if isinstance(data, str):
+        return data
+    children: List = [
+        _build_container(child, depth + 1, separators, esc) for child in data
+    ]
+    if depth == 1 and data[0] in (["MSH"], ["FHS"]):
+        # hl7.parse creates the segment ID and encoding character fields specially.
+        children[:3] = [
+            hl7.Factory.create_field("", [data[0][0]]),
+            hl7.Factory.create_field("", [data[1][0]]),
+            hl7.Factory.create_field(separators[1], [data[2][0]]),
         ]
-        if "%L" in timestamp_format:
-            # We use %L as a custom strftime formatter referring to milliseconds.
-            sections = [date_time.strftime(s) for s in timestamp_format.split("%L")]
-            millis = date_time.strftime("%f")[:-3]
-            return millis.join(sections)
-        return date_time.strftime(timestamp_format)
+    return _CONTAINER_TYPES[depth](
+        separators[depth], children, esc, separators[depth:], hl7.Factory
+    )
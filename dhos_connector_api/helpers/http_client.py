@@ -0,0 +1,65 @@
+"""
+Shared HTTP sessions for outbound requests. Each destination (e.g. the EPR service adapter or
+the trustomer API) gets its own session, whose connections are pooled and kept alive between
+requests, so that most requests don't pay for a new TCP connection and TLS handshake.
+
+Requests are retried with exponential backoff if the connection can't be made, or if an
+idempotent request (e.g. GET) fails with a 502, 503 or 504 response. Non-idempotent requests
+(e.g. POST) are never retried once they have been sent.
+
+Sessions are thread-safe, and each process gets its own sessions, so connections aren't shared
+with processes forked after they were opened.
+"""
+import os
+import threading
+from typing import Dict
+
+import requests
+from flask import current_app
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+_sessions: Dict[str, requests.Session] = {}
+_sessions_pid: int = os.getpid()
+_lock = threading.Lock()
+
+
+def get_session(destination: str) -> requests.Session:
+    global _sessions_pid
+    session = _sessions.get(destination)
+    if session is not None and _sessions_pid == os.getpid():
+        return session
+    with _lock:
+        if _sessions_pid != os.getpid():
+            # Forked since the sessions were created. Their connections belong to the parent.
+            _sessions.clear()
+            _sessions_pid = os.getpid()
+        if destination not in _sessions:
+            _sessions[destination] = _create_session()
+        return _sessions[destination]
+
+
+def close_sessions() -> None:
+    with _lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+
+
+def _create_session() -> requests.Session:
+    retry = Retry(
+        total=current_app.config["HTTP_RETRIES"],
+        backoff_factor=current_app.config["HTTP_RETRY_BACKOFF_FACTOR"],
+        status_forcelist=(502, 503, 504),
+        allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=current_app.config["HTTP_POOL_CONNECTIONS"],
+        pool_maxsize=current_app.config["HTTP_POOL_MAXSIZE"],
+        max_retries=retry,
+    )
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
@@ -1,3 +1,5 @@
+import threading
+import time
 import uuid
 from datetime import datetime, timedelta
 from typing import Dict, Optional, Tuple
@@ -11,35 +13,89 @@ from she_logging import logger
 from she_logging.request_id import current_request_id
 
 
+class EprTokenCache:
+    """
+    Caches the signed EPR service adapter JWT (and so the scope fetched from redis for it),
+    so that it is only minted again when it is within JWT_RENEW_BEFORE_EXPIRY_SEC of expiring.
+    Counts cache hits and misses, which are logged each time a token is minted.
+    """
+
+    def __init__(self) -> None:
+        self.hits = 0
+        self.misses = 0
+        self._token: Optional[str] = None
+        self._renew_at: float = 0.0
+        self._lock = threading.Lock()
+
+    def get(self) -> str:
+        with self._lock:
+            if self._token is not None and time.monotonic() < self._renew_at:
+                self.hits += 1
+                return self._token
+            self.misses += 1
+            expiry_sec: int = app.config["JWT_EXPIRY_IN_SECONDS"]
+            renew_at: float = (
+                time.monotonic()
+                + expiry_sec
+                - app.config["JWT_RENEW_BEFORE_EXPIRY_SEC"]
+            )
+            self._token = _create_jwt(expiry_sec)
+            self._renew_at = renew_at
+            logger.info(
+                "Minted EPR service adapter JWT (cache hits: %d, misses: %d)",
+                self.hits,
+                self.misses,
+            )
+            return self._token
+
+    def clear(self) -> None:
+        with self._lock:
+            self._token = None
+            self._renew_at = 0.0
+            self.hits = 0
+            self.misses = 0
+
+
+_token_cache = EprTokenCache()
+
+
 def get_epr_service_adapter_headers() -> Dict[str, str]:
 
+    jwt_token: str = _token_cache.get()
+
+    headers: Dict = {
+        "Accept": "application/json",
+        "Authorization": f"Bearer {jwt_token}",
+        "Content-Type": "application/json",
+        "X-Request-ID": current_request_id() or str(uuid.uuid4()),
+    }
+
+    logger.debug(
+        "Created headers for EPR service adapter request", extra={"headers": headers}
+    )
+
+    return headers
+
+
+def _create_jwt(expiry_sec: int) -> str:
     key, alg = get_key()
     hs_issuer: str = app.config["EPR_SERVICE_ADAPTER_ISSUER"]
     scope: str = get_scope()
 
-    jwt_token: str = jose_jwt.encode(
+    return jose_jwt.encode(
         {
             "iss": hs_issuer,
             "aud": hs_issuer,
             "scope": scope,
-            "exp": _generate_expiry_after_seconds(app.config["JWT_EXPIRY_IN_SECONDS"]),
+            "exp": _generate_expiry_after_seconds(expiry_sec),
         },
         key,
         algorithm=alg,
     )
 
-    headers: Dict = {
-        "Accept": "application/json",
-        "Authorization": f"Bearer {jwt_token}",
-        "Content-Type": "application/json",
-        "X-Request-ID": current_request_id() or str(uuid.uuid4()),
-    }
-
-    logger.debug(
-        "Created headers for EPR service adapter request", extra={"headers": headers}
-    )
 
-    return headers
+def clear_cache() -> None:
+    _token_cache.clear()
 
 
 def _generate_expiry_after_seconds(seconds: int) -> datetime:
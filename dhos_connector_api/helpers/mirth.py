@@ -0,0 +1,78 @@
+"""
+Sends messages to Mirth's acceptMessage SOAP operation without zeep. The request envelope is
+built from a template, with the message escaped into it once, and the response is parsed
+incrementally for the result, so large CDA documents aren't copied through zeep's object model.
+The envelope matches the one zeep builds from the Mirth WSDL.
+"""
+import uuid
+from typing import Optional
+from xml.etree.ElementTree import iterparse
+from xml.sax.saxutils import escape
+
+import requests
+from zeep.exceptions import Fault
+
+SOAP_ENVELOPE_NS = "http://schemas.xmlsoap.org/soap/envelope/"
+MIRTH_NS = "http://ws.connectors.connect.mirth.com/"
+ACCEPT_MESSAGE_ACTION = f"{MIRTH_NS}DefaultAcceptMessage/acceptMessageRequest"
+
+_ACCEPT_MESSAGE_TEMPLATE = (
+    "<?xml version='1.0' encoding='utf-8'?>\n"
+    f'<soap-env:Envelope xmlns:soap-env="{SOAP_ENVELOPE_NS}">'
+    '<soap-env:Header xmlns:wsa="http://www.w3.org/2005/08/addressing">'
+    f"<wsa:Action>{ACCEPT_MESSAGE_ACTION}</wsa:Action>"
+    "<wsa:MessageID>urn:uuid:{message_id}</wsa:MessageID>"
+    "<wsa:To>{to}</wsa:To>"
+    "</soap-env:Header>"
+    "<soap-env:Body>"
+    f'<ns0:acceptMessage xmlns:ns0="{MIRTH_NS}"><arg0>{{body}}</arg0></ns0:acceptMessage>'
+    "</soap-env:Body>"
+    "</soap-env:Envelope>"
+)
+
+_FAULT_TAG = f"{{{SOAP_ENVELOPE_NS}}}Fault"
+
+
+def build_accept_message_envelope(url: str, body: str) -> bytes:
+    return _ACCEPT_MESSAGE_TEMPLATE.format(
+        message_id=uuid.uuid4(), to=escape(url), body=escape(body)
+    ).encode("utf8")
+
+
+def send_accept_message(
+    session: requests.Session, url: str, body: str, timeout: Optional[float] = None
+) -> Optional[str]:
+    """
+    Posts `body` to Mirth's acceptMessage operation at `url`, and returns the result. Raises
+    zeep's Fault if Mirth responds with a SOAP fault, as zeep would.
+    """
+    response = session.post(
+        url,
+        data=build_accept_message_envelope(url, body),
+        headers={"SOAPAction": '""', "Content-Type": "text/xml; charset=utf-8"},
+        timeout=timeout,
+        stream=True,
+    )
+    with response:
+        if response.status_code not in (200, 500):
+            response.raise_for_status()
+        # Undo any content encoding (e.g. gzip) while reading the stream.
+        response.raw.decode_content = True
+        return _parse_accept_message_response(response)
+
+
+def _parse_accept_message_response(response: requests.Response) -> Optional[str]:
+    fault_code: Optional[str] = None
+    fault_string: Optional[str] = None
+    for _, element in iterparse(response.raw, events=("end",)):
+        # Mirth's return element is unqualified, but match it by local name in case it isn't.
+        if element.tag.rsplit("}", 1)[-1] == "return":
+            return element.text
+        if element.tag == "faultcode":
+            fault_code = element.text
+        elif element.tag == "faultstring":
+            fault_string = element.text
+        elif element.tag == _FAULT_TAG:
+            raise Fault(message=fault_string, code=fault_code)
+    response.raise_for_status()
+    return None
@@ -0,0 +1,140 @@
+"""
+An MLLP (Minimal Lower Layer Protocol) listener, allowing HL7 messages to be received over
+long-lived TCP connections as well as via the HTTP API. Each message is wrapped in a start
+block character and an end block/carriage return pair. Messages received on a connection are
+processed one at a time, and the (N)ACK is written back on the same connection before the next
+message is read.
+"""
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from flask import Flask
+from she_logging import logger
+
+from dhos_connector_api.blueprint_api import receive_controller
+
+START_BLOCK = b"\x0b"
+END_BLOCK = b"\x1c\x0d"
+
+# Upper limit on the size of a single framed message.
+MAX_MESSAGE_BYTES = 1024 * 1024
+
+
+def frame_message(message: str, encoding: str = "utf8") -> bytes:
+    # HL7 segments must be separated by carriage returns only.
+    message = message.replace("\r\n", "\r").replace("\n", "\r")
+    return START_BLOCK + message.encode(encoding) + END_BLOCK
+
+
+def unframe_message(frame: bytes, encoding: str = "utf8") -> str:
+    start: int = frame.find(START_BLOCK)
+    if start == -1 or not frame.endswith(END_BLOCK):
+        raise ValueError("MLLP frame is missing start or end block")
+    try:
+        return frame[start + len(START_BLOCK) : -len(END_BLOCK)].decode(encoding)
+    except UnicodeDecodeError:
+        raise ValueError(f"MLLP frame could not be decoded as {encoding}")
+
+
+class MllpServer:
+    def __init__(
+        self,
+        app: Flask,
+        host: str,
+        port: int,
+        max_workers: int = 4,
+        encoding: str = "utf8",
+        reuse_port: bool = False,
+    ) -> None:
+        self.app = app
+        self.host = host
+        self.port = port
+        self.encoding = encoding
+        # Allows several processes to listen on the same port.
+        self.reuse_port = reuse_port
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="mllp"
+        )
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._started = threading.Event()
+
+    def start(self) -> threading.Thread:
+        """
+        Starts the listener in a daemon thread with its own event loop, so that it can run
+        alongside the waitress server. Returns once the listener is accepting connections.
+        """
+        thread = threading.Thread(target=self._run, name="mllp-server", daemon=True)
+        thread.start()
+        self._started.wait()
+        if self._server is None:
+            raise RuntimeError(f"MLLP server failed to start on port {self.port}")
+        return thread
+
+    def stop(self) -> None:
+        if self._loop is not None and self._server is not None:
+            self._loop.call_soon_threadsafe(self._server.close)
+        self._executor.shutdown(wait=False)
+
+    def _run(self) -> None:
+        self._loop = asyncio.new_event_loop()
+        try:
+            self._server = self._loop.run_until_complete(
+                asyncio.start_server(
+                    self._handle_connection,
+                    host=self.host,
+                    port=self.port,
+                    limit=MAX_MESSAGE_BYTES,
+                    reuse_port=self.reuse_port or None,
+                )
+            )
+        except OSError:
+            logger.exception("Couldn't start MLLP server on port %d", self.port)
+            self._started.set()
+            return
+
+        # If port 0 was requested, record the port that was actually bound.
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info("MLLP server listening on port %d", self.port)
+        self._started.set()
+        try:
+            self._loop.run_until_complete(self._server.wait_closed())
+        finally:
+            self._loop.close()
+
+    async def _handle_connection(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        peer = writer.get_extra_info("peername")
+        logger.info("MLLP connection opened from %s", peer)
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                try:
+                    frame: bytes = await reader.readuntil(END_BLOCK)
+                except asyncio.IncompleteReadError as e:
+                    if e.partial.strip():
+                        logger.warning(
+                            "MLLP connection closed mid-message, discarding %d bytes",
+                            len(e.partial),
+                        )
+                    break
+                content: str = unframe_message(frame, encoding=self.encoding)
+                ack: str = await loop.run_in_executor(
+                    self._executor, self._process_message, content
+                )
+                writer.write(frame_message(ack, encoding=self.encoding))
+                await writer.drain()
+        except Exception:
+            # Without a parseable message we can't (N)ACK, so drop the connection and leave
+            # the sender to retry.
+            logger.exception("Failed to process MLLP message, closing connection")
+        finally:
+            writer.close()
+            logger.info("MLLP connection closed from %s", peer)
+
+    def _process_message(self, content: str) -> str:
+        with self.app.app_context():
+            return receive_controller.create_and_process_raw_hl7_message(content)
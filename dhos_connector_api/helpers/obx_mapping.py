@@ -0,0 +1,213 @@
+"""
+Declarative mapping from observations to the OBX segments of outgoing ORU messages. Each entry
+in `DEFAULT_OBX_MAPPINGS` describes the segments generated for one observation type (or, for BP
+posture, for the metadata of the blood pressure observations), in the order they appear in the
+message. The mappings are compiled once into `ObxTemplate`s, which the generator renders.
+
+Trusts can change the mappings with `send_config.obx_mappings` in their trustomer config: an
+object keyed in the same way as the defaults, whose fields replace those of the default entry.
+A key set to null leaves that observation type out of the message, and keys without a default
+entry add segments for another observation type, after the defaults.
+"""
+import threading
+from typing import Any, Dict, FrozenSet, NamedTuple, Optional, Tuple
+
+from dhos_connector_api.helpers import trustomer
+
+# How each kind of entry is rendered. "observation" entries produce a segment for the value of
+# the observation and, optionally, one for its score; the others need bespoke handling.
+RENDERERS: FrozenSet[str] = frozenset(
+    {"observation", "bp_posture", "o2_therapy", "gcs", "nurse_concern"}
+)
+
+# How the value of the observation is written into the segment: "integer" rounds the value,
+# "number" writes it as it is, "string" writes the observation string, and "coded_string" writes
+# the observation string with its first character as the code, e.g. "A^Alert".
+VALUE_FORMATS: FrozenSet[str] = frozenset(
+    {"integer", "number", "string", "coded_string"}
+)
+
+# Fields of an entry that aren't given, other than `code` which is required.
+_MAPPING_DEFAULTS: Dict[str, Any] = {
+    "renderer": "observation",
+    "observation_types": None,  # Defaults to the key of the entry.
+    "category": "NM",
+    "value": "integer",
+    "unit": True,
+    "patient_refused": True,
+    "score_code": None,
+    "score_required": True,
+}
+
+DEFAULT_OBX_MAPPINGS: Dict[str, Dict[str, Any]] = {
+    "heart_rate": {"code": "HR", "score_code": "HRScore"},
+    "respiratory_rate": {"code": "RR", "score_code": "RRScore"},
+    "diastolic_blood_pressure": {
+        "code": "DBP",
+        "score_code": "DBPScore",
+        "score_required": False,
+    },
+    "systolic_blood_pressure": {"code": "SBP", "score_code": "SBPScore"},
+    "bp_posture": {
+        "renderer": "bp_posture",
+        "observation_types": ["systolic_blood_pressure", "diastolic_blood_pressure"],
+        "category": "ST",
+        "code": "BPPOS",
+    },
+    "spo2": {"code": "SPO2", "score_code": "SPO2Score"},
+    "o2_therapy_status": {
+        "renderer": "o2_therapy",
+        "code": "O2Rate",
+        "value": "number",
+        "patient_refused": False,
+        "score_code": "O2Score",
+        "score_required": False,
+    },
+    "temperature": {"code": "TEMP", "value": "number", "score_code": "TEMPScore"},
+    "consciousness_acvpu": {
+        "category": "CE",
+        "code": "ACVPU",
+        "value": "coded_string",
+        "unit": False,
+        "patient_refused": False,
+        "score_code": "ACVPUScore",
+    },
+    "consciousness_gcs": {"renderer": "gcs", "code": "GCS"},
+    "nurse_concern": {"renderer": "nurse_concern", "category": "ST", "code": "NC"},
+}
+
+# The fields each renderer supports, other than `renderer`. Entries can't set the others to
+# anything but their defaults, as they would be ignored.
+_RENDERER_FIELDS: Dict[str, FrozenSet[str]] = {
+    "observation": frozenset({*_MAPPING_DEFAULTS, "code"}),
+    "bp_posture": frozenset({"observation_types", "category", "code"}),
+    "o2_therapy": frozenset({*_MAPPING_DEFAULTS, "code"}),
+    "gcs": frozenset({"observation_types", "category", "code"}),
+    "nurse_concern": frozenset({"observation_types", "category", "code"}),
+}
+
+# Separators that can't appear in codes or categories, as they are written unescaped.
+_HL7_SEPARATORS: FrozenSet[str] = frozenset("|^~\\&")
+
+
+class ObxTemplate(NamedTuple):
+    key: str
+    renderer: str
+    # The observations the segments are generated from, in order of preference.
+    observation_types: Tuple[str, ...]
+    category: str
+    code: str
+    value: str
+    unit: bool
+    patient_refused: bool
+    score_code: Optional[str]
+    # Whether the score segment is included even if the observation has no score.
+    score_required: bool
+    # Fields of the value and score segments up to the value, e.g. "|NM|HR||".
+    prefix: str
+    score_prefix: str
+
+
+def compile_obx_mappings(
+    overrides: Optional[Dict[str, Optional[Dict[str, Any]]]] = None
+) -> Tuple[ObxTemplate, ...]:
+    """
+    Compiles the default mappings, changed by a trust's `overrides`. Raises ValueError if a
+    mapping is invalid.
+    """
+    overrides = overrides or {}
+    templates = []
+    added_keys = [key for key in overrides if key not in DEFAULT_OBX_MAPPINGS]
+    for key in [*DEFAULT_OBX_MAPPINGS, *added_keys]:
+        if key in overrides and overrides[key] is None:
+            continue
+        entry: Dict[str, Any] = {
+            **DEFAULT_OBX_MAPPINGS.get(key, {}),
+            **(overrides.get(key) or {}),
+        }
+        templates.append(_compile(key, entry))
+    return tuple(templates)
+
+
+def _compile(key: str, entry: Dict[str, Any]) -> ObxTemplate:
+    unknown_fields = entry.keys() - _MAPPING_DEFAULTS.keys() - {"code"}
+    if unknown_fields:
+        raise ValueError(
+            f"Invalid OBX mapping for '{key}': unknown fields {sorted(unknown_fields)}"
+        )
+    mapping: Dict[str, Any] = {**_MAPPING_DEFAULTS, **entry}
+    if not mapping.get("code"):
+        raise ValueError(f"Invalid OBX mapping for '{key}': no code")
+    if mapping["renderer"] not in RENDERERS:
+        raise ValueError(
+            f"Invalid OBX mapping for '{key}': unknown renderer '{mapping['renderer']}'"
+        )
+    unsupported_fields = {
+        field
+        for field in entry.keys() - _RENDERER_FIELDS[mapping["renderer"]] - {"renderer"}
+        if entry[field] != _MAPPING_DEFAULTS[field]
+    }
+    if unsupported_fields:
+        raise ValueError(
+            f"Invalid OBX mapping for '{key}': fields {sorted(unsupported_fields)} aren't "
+            f"supported by the '{mapping['renderer']}' renderer"
+        )
+    if mapping["value"] not in VALUE_FORMATS:
+        raise ValueError(
+            f"Invalid OBX mapping for '{key}': unknown value format '{mapping['value']}'"
+        )
+    category: str = mapping["category"]
+    code: str = mapping["code"]
+    score_code: Optional[str] = mapping["score_code"]
+    for field in (category, code, score_code):
+        if field is not None and _HL7_SEPARATORS.intersection(field):
+            raise ValueError(
+                f"Invalid OBX mapping for '{key}': '{field}' contains an HL7 separator"
+            )
+    return ObxTemplate(
+        key=key,
+        renderer=mapping["renderer"],
+        observation_types=tuple(mapping["observation_types"] or [key]),
+        category=category,
+        code=code,
+        value=mapping["value"],
+        unit=bool(mapping["unit"]),
+        patient_refused=bool(mapping["patient_refused"]),
+        score_code=score_code,
+        score_required=bool(mapping["score_required"]),
+        prefix=f"|{category}|{code}||",
+        score_prefix="" if score_code is None else f"|NM|{score_code}||",
+    )
+
+
+# Templates compiled from the current trustomer config, cleared when the config changes.
+_templates: Optional[Tuple[ObxTemplate, ...]] = None
+_templates_generation: int = 0
+_templates_lock = threading.Lock()
+
+
+def get_obx_templates(trustomer_config: Dict) -> Tuple[ObxTemplate, ...]:
+    """Returns the compiled templates for `trustomer_config`, the current trustomer config."""
+    global _templates
+    templates: Optional[Tuple[ObxTemplate, ...]] = _templates
+    if templates is not None:
+        return templates
+    generation: int = _templates_generation
+    templates = compile_obx_mappings(
+        trustomer_config["send_config"].get("obx_mappings")
+    )
+    with _templates_lock:
+        # Don't cache templates for a config that changed while they were being compiled.
+        if generation == _templates_generation:
+            _templates = templates
+    return templates
+
+
+def clear_obx_templates(trustomer_config: Optional[Dict] = None) -> None:
+    global _templates, _templates_generation
+    with _templates_lock:
+        _templates_generation += 1
+        _templates = None
+
+
+trustomer.add_change_listener(clear_obx_templates)
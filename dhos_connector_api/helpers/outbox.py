@@ -0,0 +1,97 @@
+import json
+import time
+from typing import Dict, List, Union
+
+import kombu_batteries_included
+from flask_batteries_included.sqldb import db
+from kombu import Connection, Producer
+from kombu_batteries_included import config as kbi_config
+from kombu_batteries_included import infra
+from she_logging import logger
+from she_logging.request_id import current_request_id
+
+from dhos_connector_api.models.outbox_message import OutboxMessage
+
+
+def add_message(routing_key: str, body: Union[Dict, List]) -> None:
+    """
+    Adds a message to the outbox in the current database transaction. It will be published
+    by the outbox relay once the transaction has been committed.
+    """
+    db.session.add(
+        OutboxMessage(
+            routing_key=routing_key, body=body, correlation_id=current_request_id()
+        )
+    )
+
+
+def publish_batch(batch_size: int) -> int:
+    """
+    Publishes the oldest messages in the outbox, removing them once the broker has confirmed
+    receipt. Rows are locked with SKIP LOCKED so several relays can run at once. If publishing
+    fails the rows are left in place to be retried, so delivery is at-least-once. Returns the
+    number of messages published.
+    """
+    messages: List[OutboxMessage] = (
+        OutboxMessage.query.order_by(OutboxMessage.id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+        .all()
+    )
+    if not messages:
+        db.session.rollback()
+        return 0
+
+    try:
+        _publish_with_confirms(messages)
+    except Exception:
+        db.session.rollback()
+        raise
+
+    for message in messages:
+        db.session.delete(message)
+    db.session.commit()
+    logger.debug("Published %d messages from outbox", len(messages))
+    return len(messages)
+
+
+def relay(batch_size: int, poll_interval: float, run_once: bool = False) -> None:
+    """
+    Drains the outbox. Full batches are published back to back; once the outbox is empty the
+    relay sleeps for `poll_interval` seconds before checking again.
+    """
+    logger.info("Starting outbox relay with batch size %d", batch_size)
+    while True:
+        try:
+            published: int = publish_batch(batch_size)
+        except Exception:
+            logger.exception("Failed to publish messages from outbox, will retry")
+            published = 0
+        if run_once and published < batch_size:
+            return
+        if published < batch_size:
+            time.sleep(poll_interval)
+
+
+def _publish_with_confirms(messages: List[OutboxMessage]) -> None:
+    if kbi_config.RABBITMQ_DISABLED:
+        logger.debug("Skipping RabbitMQ message publish due to config")
+        return
+    # With publisher confirms enabled, each publish blocks until the broker has accepted
+    # the message, so a message is never removed from the outbox before it is safe.
+    with Connection(
+        kombu_batteries_included.get_connection_string(),
+        transport_options={"confirm_publish": True},
+    ) as conn:
+        producer: Producer = Producer(conn)
+        for message in messages:
+            producer.publish(
+                body=json.dumps(message.body),
+                exchange=infra.TASK_EXCHANGE_NAME,
+                routing_key=message.routing_key,
+                content_type="application/text",
+                compression=kbi_config.RABBITMQ_COMPRESSION,
+                retry=True,
+                timestamp=int(time.time()),
+                correlation_id=message.correlation_id,
+            )
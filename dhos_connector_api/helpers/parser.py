@@ -1,4 +1,4 @@
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Iterable, Optional
 
 from flask import current_app as app
 from she_logging import logger
@@ -8,6 +8,7 @@ from dhos_connector_api.helpers.errors import (
     Hl7ApplicationErrorException,
     Hl7ApplicationRejectException,
 )
+from dhos_connector_api.helpers.hl7_path import Hl7Path, compile_path
 from dhos_connector_api.helpers.hl7_wrapper import Hl7Wrapper
 
 ADT_TYPE_WHITELIST = {
@@ -40,34 +41,119 @@ ADT_TYPE_WHITELIST = {
 
 ENCOUNTER_TYPE_BLACKLIST = {"WAITLIST", "PREADMIT", "RECURRING"}
 
+# Fields read from ADT messages, compiled once at import.
+MESSAGE_CATEGORY_PATH = compile_path("MSH.F9.R1.C1")
+ADT_MESSAGE_TYPE_PATH = compile_path("MSH.F9.R1.C2")
+LAST_NAME_PATH = compile_path("PID.F5.R1.C1")
+FIRST_NAME_PATH = compile_path("PID.F5.R1.C2")
+DATE_OF_BIRTH_PATH = compile_path("PID.F7")
+SEX_PATH = compile_path("PID.F8")
+DATE_OF_DEATH_PATH = compile_path("PID.F29")
+ENCOUNTER_TYPE_PATH = compile_path("PV1.F2")
+WARD_CODE_PATH = compile_path("PV1.F3.R1.C1")
+BAY_CODE_PATH = compile_path("PV1.F3.R1.C2")
+BED_CODE_PATH = compile_path("PV1.F3.R1.C3")
+PREVIOUS_WARD_CODE_PATH = compile_path("PV1.F6.R1.C1")
+PREVIOUS_BAY_CODE_PATH = compile_path("PV1.F6.R1.C2")
+PREVIOUS_BED_CODE_PATH = compile_path("PV1.F6.R1.C3")
+ENCOUNTER_ID_PATH = compile_path("PV1.F19")
+ADMITTED_AT_PATH = compile_path("PV1.F44")
+DISCHARGED_AT_PATH = compile_path("PV1.F45")
+PARENT_ENCOUNTER_ID_PATH = compile_path("MRG.F5.R1.C1")
+PREVIOUS_LOCATION_CODE_PATH = compile_path("MRG.F6.R1.C1")
+ACK_CODE_PATH = compile_path("MSA.F1")
+ADT_FIELD_PATHS = (
+    MESSAGE_CATEGORY_PATH,
+    ADT_MESSAGE_TYPE_PATH,
+    LAST_NAME_PATH,
+    FIRST_NAME_PATH,
+    DATE_OF_BIRTH_PATH,
+    SEX_PATH,
+    DATE_OF_DEATH_PATH,
+    ENCOUNTER_TYPE_PATH,
+    WARD_CODE_PATH,
+    BAY_CODE_PATH,
+    BED_CODE_PATH,
+    PREVIOUS_WARD_CODE_PATH,
+    PREVIOUS_BAY_CODE_PATH,
+    PREVIOUS_BED_CODE_PATH,
+    ENCOUNTER_ID_PATH,
+    ADMITTED_AT_PATH,
+    DISCHARGED_AT_PATH,
+    PARENT_ENCOUNTER_ID_PATH,
+    PREVIOUS_LOCATION_CODE_PATH,
+)
+
 
-def parse_hl7_message(hl7_message: str) -> Hl7Wrapper:
+def parse_hl7_message(
+    hl7_message: str, fast: bool = False, paths: Iterable[Hl7Path] = ADT_FIELD_PATHS
+) -> Hl7Wrapper:
     # Replace CRLF and LF characters with carriage return characters, as
     # otherwise HL7 parsing will fail (expects segments to be delimited
     # only by carriage return characters)
     logger.debug("Parsing HL7 message", extra={"hl7_message": hl7_message})
     hl7_message = hl7_message.replace("\r\n", "\r").replace("\n", "\r")
     try:
+        if fast:
+            # Only extract `paths`, by default the fields used by the ADT validation and
+            # actions below.
+            return Hl7Wrapper.from_extracted_fields(hl7_message, paths)
         return Hl7Wrapper(hl7_message)
     except AssertionError:
         # Couldn't parse the message, so throw error that will manifest as a 400.
         raise ValueError("Could not parse HL7 message")
 
 
-def validate_hl7_message(parser: Hl7Wrapper) -> None:
+def parse_stored_hl7_message(
+    hl7_message: str, parsed_representation: Optional[Dict], fast: bool = False
+) -> Hl7Wrapper:
+    """
+    Loads a previously received message, rebuilding it from its stored parsed representation
+    if there is one rather than parsing the raw message again.
+    """
+    if parsed_representation is not None:
+        try:
+            return Hl7Wrapper.from_parsed_representation(
+                hl7_message, parsed_representation
+            )
+        except ValueError:
+            logger.warning("Ignoring stored parsed representation in unknown format")
+    return parse_hl7_message(hl7_message, fast=fast)
+
+
+def parse_ack_code(ack: str) -> Optional[str]:
+    """
+    Returns the acknowledgement code (MSA-1) from an ACK message: "AA", "AR", "AE" or None.
+    """
+    try:
+        hl7_wrapper: Hl7Wrapper = parse_hl7_message(
+            ack, fast=True, paths=(ACK_CODE_PATH,)
+        )
+    except ValueError:
+        return None
+    return hl7_wrapper.get_field_by_hl7_path(ACK_CODE_PATH)
+
+
+def validate_hl7_message_header(parser: Hl7Wrapper) -> None:
     # Raise application reject if message is not of the expected type.
     logger.debug("Checking message is of the expected type")
-    message_category: Optional[str] = parser.get_field_by_hl7_path("MSH.F9.R1.C1")
+    message_category: Optional[str] = parser.get_field_by_hl7_path(
+        MESSAGE_CATEGORY_PATH
+    )
     if message_category != "ADT":
         raise Hl7ApplicationRejectException(
             f"HL7 message of unexpected type '{message_category}'", parser
         )
-    adt_message_type = parser.get_field_by_hl7_path("MSH.F9.R1.C2")
+    adt_message_type = parser.get_field_by_hl7_path(ADT_MESSAGE_TYPE_PATH)
     if adt_message_type not in ADT_TYPE_WHITELIST:
         raise Hl7ApplicationRejectException(
             f"HL7 message of unexpected ADT type '{adt_message_type}'", parser
         )
 
+
+def validate_hl7_message(parser: Hl7Wrapper) -> None:
+    validate_hl7_message_header(parser)
+
     # Raise application error if expected segments/fields are missing.
     logger.debug("Checking message has expected segments and fields")
     if not parser.contains_segment("PID"):
@@ -78,14 +164,14 @@ def validate_hl7_message(parser: Hl7Wrapper) -> None:
         raise Hl7ApplicationRejectException("HL7 MRN and NHS number missing", parser)
 
     if parser.contains_segment("PV1"):
-        encounter_type = parser.get_field_by_hl7_path("PV1.F2")
+        encounter_type = parser.get_field_by_hl7_path(ENCOUNTER_TYPE_PATH)
         if encounter_type in ENCOUNTER_TYPE_BLACKLIST:
             raise Hl7ApplicationErrorException(
                 f"HL7 message concerns blacklisted encounter type '{encounter_type}'",
                 parser,
             )
 
-        ward_code = parser.get_field_by_hl7_path("PV1.F3.R1.C1")
+        ward_code = parser.get_field_by_hl7_path(WARD_CODE_PATH)
         if ward_code is None:
             raise Hl7ApplicationErrorException(
                 f"HL7 message contains an assigned patient location but the ward code is missing",
@@ -99,9 +185,9 @@ def validate_hl7_message(parser: Hl7Wrapper) -> None:
 def generate_patient_action(m: Hl7Wrapper) -> Dict[str, Any]:
     logger.debug("Generating patient action from ADT message")
     patient_data: dict = {
-        "first_name": m.get_field_by_hl7_path("PID.F5.R1.C2"),
-        "last_name": m.get_field_by_hl7_path("PID.F5.R1.C1"),
-        "sex_sct": parse_sex_to_sct(m.get_field_by_hl7_path("PID.F8")),
+        "first_name": m.get_field_by_hl7_path(FIRST_NAME_PATH),
+        "last_name": m.get_field_by_hl7_path(LAST_NAME_PATH),
+        "sex_sct": parse_sex_to_sct(m.get_field_by_hl7_path(SEX_PATH)),
     }
 
     nhs_number = m.get_patient_identifier("NHS", default=None)
@@ -112,10 +198,14 @@ def generate_patient_action(m: Hl7Wrapper) -> Dict[str, Any]:
     if mrn is not None and mrn != "":
         patient_data["mrn"] = mrn
 
-    if m.get_field_by_hl7_path("PID.F7"):
-        patient_data["date_of_birth"] = m.get_iso8601_date_by_hl7_path("PID.F7")
-    if m.get_field_by_hl7_path("PID.F29"):
-        patient_data["date_of_death"] = m.get_iso8601_date_by_hl7_path("PID.F29")
+    if m.get_field_by_hl7_path(DATE_OF_BIRTH_PATH):
+        patient_data["date_of_birth"] = m.get_iso8601_date_by_hl7_path(
+            DATE_OF_BIRTH_PATH
+        )
+    if m.get_field_by_hl7_path(DATE_OF_DEATH_PATH):
+        patient_data["date_of_death"] = m.get_iso8601_date_by_hl7_path(
+            DATE_OF_DEATH_PATH
+        )
 
     if "mrn" not in patient_data and "nhs_number" not in patient_data:
         # We have no patient identifiers; raise an application error exception.
@@ -124,7 +214,7 @@ def generate_patient_action(m: Hl7Wrapper) -> Dict[str, Any]:
     # If message is of type A34 or A40 (patient merge), add previous identifier information.
     # Note: A35 (account number merge) is not included here because we don't currently use
     # account number.
-    if m.get_field_by_hl7_path("MSH.F9.R1.C2") in ["A34", "A40"]:
+    if m.get_field_by_hl7_path(ADT_MESSAGE_TYPE_PATH) in ["A34", "A40"]:
 
         previous_nhs_number = m.get_merged_patient_identifier("NHS", default=None)
         if previous_nhs_number is not None and previous_nhs_number != "":
@@ -143,18 +233,18 @@ def generate_location_action(m: Hl7Wrapper) -> dict:
     logger.debug("Generating location action from ADT message")
     location_data: Dict = {
         "location": {
-            "epr_ward_code": m.get_field_by_hl7_path("PV1.F3.R1.C1"),
-            "epr_bay_code": m.get_field_by_hl7_path("PV1.F3.R1.C2"),
-            "epr_bed_code": m.get_field_by_hl7_path("PV1.F3.R1.C3"),
+            "epr_ward_code": m.get_field_by_hl7_path(WARD_CODE_PATH),
+            "epr_bay_code": m.get_field_by_hl7_path(BAY_CODE_PATH),
+            "epr_bed_code": m.get_field_by_hl7_path(BED_CODE_PATH),
         }
     }
 
     # If there is a previous location, add it to the action.
-    if m.get_field_by_hl7_path("PV1.F6.R1.C1"):
+    if m.get_field_by_hl7_path(PREVIOUS_WARD_CODE_PATH):
         location_data["previous_location"] = {
-            "epr_ward_code": m.get_field_by_hl7_path("PV1.F6.R1.C1"),
-            "epr_bay_code": m.get_field_by_hl7_path("PV1.F6.R1.C2"),
-            "epr_bed_code": m.get_field_by_hl7_path("PV1.F6.R1.C3"),
+            "epr_ward_code": m.get_field_by_hl7_path(PREVIOUS_WARD_CODE_PATH),
+            "epr_bay_code": m.get_field_by_hl7_path(PREVIOUS_BAY_CODE_PATH),
+            "epr_bed_code": m.get_field_by_hl7_path(PREVIOUS_BED_CODE_PATH),
         }
 
     location_action: Dict = {"name": "process_location", "data": location_data}
@@ -166,23 +256,25 @@ def generate_location_action(m: Hl7Wrapper) -> dict:
 
 def generate_encounter_action(m: Hl7Wrapper) -> Dict:
     logger.debug("Generating encounter action from ADT message")
-    message_type = m.get_field_by_hl7_path("MSH.F9.R1.C2")
+    message_type = m.get_field_by_hl7_path(ADT_MESSAGE_TYPE_PATH)
     admission_cancelled: bool = message_type in ["A11", "A23", "A27", "A38"]
     transfer_cancelled: bool = message_type == "A12"
     discharge_cancelled: bool = message_type == "A13"
     encounter_moved: bool = message_type == "A44"
-    patient_deceased: bool = m.get_iso8601_date_by_hl7_path("PID.F29") is not None
+    patient_deceased: bool = (
+        m.get_iso8601_date_by_hl7_path(DATE_OF_DEATH_PATH) is not None
+    )
 
     encounter_data: Dict = {
-        "epr_encounter_id": m.get_field_by_hl7_path("PV1.F19"),
+        "epr_encounter_id": m.get_field_by_hl7_path(ENCOUNTER_ID_PATH),
         "location": {
-            "epr_ward_code": m.get_field_by_hl7_path("PV1.F3.R1.C1"),
-            "epr_bay_code": m.get_field_by_hl7_path("PV1.F3.R1.C2"),
-            "epr_bed_code": m.get_field_by_hl7_path("PV1.F3.R1.C3"),
+            "epr_ward_code": m.get_field_by_hl7_path(WARD_CODE_PATH),
+            "epr_bay_code": m.get_field_by_hl7_path(BAY_CODE_PATH),
+            "epr_bed_code": m.get_field_by_hl7_path(BED_CODE_PATH),
         },
-        "encounter_type": m.get_field_by_hl7_path("PV1.F2"),
+        "encounter_type": m.get_field_by_hl7_path(ENCOUNTER_TYPE_PATH),
         "admitted_at": m.get_iso8601_datetime_by_hl7_path(
-            "PV1.F44", default_timezone=app.config["SERVER_TIMEZONE"]
+            ADMITTED_AT_PATH, default_timezone=app.config["SERVER_TIMEZONE"]
         ),
         "admission_cancelled": admission_cancelled,
         "transfer_cancelled": transfer_cancelled,
@@ -191,23 +283,25 @@ def generate_encounter_action(m: Hl7Wrapper) -> Dict:
         "patient_deceased": patient_deceased,
     }
 
-    if m.get_field_by_hl7_path("PV1.F45"):
+    if m.get_field_by_hl7_path(DISCHARGED_AT_PATH):
         encounter_data["discharged_at"] = m.get_iso8601_datetime_by_hl7_path(
-            "PV1.F45", default_timezone=app.config["SERVER_TIMEZONE"]
+            DISCHARGED_AT_PATH, default_timezone=app.config["SERVER_TIMEZONE"]
         )
 
     if m.contains_segment("MRG"):
-        encounter_data["parent_encounter_id"] = m.get_field_by_hl7_path("MRG.F5.R1.C1")
+        encounter_data["parent_encounter_id"] = m.get_field_by_hl7_path(
+            PARENT_ENCOUNTER_ID_PATH
+        )
         encounter_data["epr_previous_location_code"] = m.get_field_by_hl7_path(
-            "MRG.F6.R1.C1"
+            PREVIOUS_LOCATION_CODE_PATH
         )
 
     # If there is a previous location, add it to the action.
-    if m.get_field_by_hl7_path("PV1.F6.R1.C1"):
+    if m.get_field_by_hl7_path(PREVIOUS_WARD_CODE_PATH):
         encounter_data["previous_location"] = {
-            "epr_ward_code": m.get_field_by_hl7_path("PV1.F6.R1.C1"),
-            "epr_bay_code": m.get_field_by_hl7_path("PV1.F6.R1.C2"),
-            "epr_bed_code": m.get_field_by_hl7_path("PV1.F6.R1.C3"),
+            "epr_ward_code": m.get_field_by_hl7_path(PREVIOUS_WARD_CODE_PATH),
+            "epr_bay_code": m.get_field_by_hl7_path(PREVIOUS_BAY_CODE_PATH),
+            "epr_bed_code": m.get_field_by_hl7_path(PREVIOUS_BED_CODE_PATH),
         }
 
     encounter_action: Dict = {"name": "process_encounter", "data": encounter_data}
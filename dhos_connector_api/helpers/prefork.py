@@ -0,0 +1,263 @@
+"""
+A pre-forking HTTP server, so that a single container can use all of its cores despite the GIL.
+The app is created (importing all modules and loading the OpenAPI spec) and the listening
+socket bound once in the supervisor process, which then forks a number of waitress workers
+that share the socket and, copy-on-write, the app. Each worker gets its own database pool.
+
+Workers can be recycled after serving a number of requests: the worker stops accepting
+connections, finishes the requests it has in progress and exits, and the supervisor forks a
+replacement. Sending SIGTERM or SIGINT to the supervisor stops all of the workers in the same
+way before it exits.
+"""
+import gc
+import os
+import random
+import signal
+import socket
+import sys
+import threading
+import time
+from types import FrameType
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from flask import Flask
+from flask_batteries_included.sqldb import db
+from she_logging import logger
+from waitress import wasyncore
+from waitress.server import create_server
+
+from dhos_connector_api.helpers.mllp import MllpServer
+
+# Workers that exit sooner than this after starting are replaced after a delay, so that a
+# worker that fails on startup isn't restarted in a tight loop.
+MIN_WORKER_LIFETIME_SEC = 1.0
+
+# How often a worker checks whether it has been asked to stop.
+WORKER_POLL_INTERVAL_SEC = 0.5
+
+# While a worker is stopping, connections are closed once they have been idle for this long.
+# This gives a request on a connection that was accepted just before the worker stopped time
+# to arrive.
+DRAIN_IDLE_SEC = 1.0
+
+
+class RequestCounter:
+    """
+    WSGI middleware that calls `on_limit` once `max_requests` requests have been received.
+    """
+
+    def __init__(
+        self, app: Callable, max_requests: int, on_limit: Callable[[], None]
+    ) -> None:
+        self.app = app
+        self.max_requests = max_requests
+        self.on_limit = on_limit
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, environ: Dict, start_response: Callable) -> Iterable[bytes]:
+        with self._lock:
+            self.count += 1
+            limit_reached: bool = self.count == self.max_requests
+        if limit_reached:
+            self.on_limit()
+        return self.app(environ, start_response)
+
+
+class PreforkServer:
+    def __init__(
+        self,
+        app: Flask,
+        host: str,
+        port: int,
+        workers: int,
+        threads: int = 4,
+        max_requests: int = 0,
+        max_requests_jitter: int = 0,
+        graceful_timeout: float = 30.0,
+        mllp_port: Optional[int] = None,
+    ) -> None:
+        """
+        Workers are recycled after `max_requests` requests (never if 0), plus a random number
+        up to `max_requests_jitter` so that they don't all restart at once. If `mllp_port` is
+        set, each worker also runs an MLLP listener on that port.
+        """
+        self.app = app
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.threads = threads
+        self.max_requests = max_requests
+        self.max_requests_jitter = max_requests_jitter
+        self.graceful_timeout = graceful_timeout
+        self.mllp_port = mllp_port
+        self._socket: Optional[socket.socket] = None
+        # Start times of the running workers, by process ID.
+        self._workers: Dict[int, float] = {}
+        self._stopping = False
+
+    def bind(self) -> int:
+        """
+        Binds the listening socket that will be shared by the workers. Returns the port, which
+        is chosen by the OS if 0 was requested.
+        """
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.host, self.port))
+        sock.listen(1024)
+        sock.setblocking(False)
+        self._socket = sock
+        self.port = sock.getsockname()[1]
+        return self.port
+
+    def run(self) -> None:
+        """Forks the workers and replaces any that exit until the server is stopped."""
+        if self._socket is None:
+            self.bind()
+        logger.info(
+            "Starting %d server workers on %s:%d", self.workers, self.host, self.port
+        )
+        signal.signal(signal.SIGTERM, self._handle_stop)
+        signal.signal(signal.SIGINT, self._handle_stop)
+
+        # Objects that exist now are shared with the workers. Moving them out of the garbage
+        # collector's generations stops collections in the workers from writing to (and so
+        # copying) the pages they are on.
+        gc.collect()
+        gc.freeze()
+
+        for _ in range(self.workers):
+            self._spawn_worker()
+
+        while self._workers:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            started: Optional[float] = self._workers.pop(pid, None)
+            if started is None:
+                continue
+            exit_code: int = os.waitstatus_to_exitcode(status)
+            if exit_code != 0:
+                logger.warning("Server worker %d exited with code %d", pid, exit_code)
+            if self._stopping:
+                continue
+            if time.monotonic() - started < MIN_WORKER_LIFETIME_SEC:
+                time.sleep(MIN_WORKER_LIFETIME_SEC)
+            self._spawn_worker()
+
+        if self._socket is not None:
+            self._socket.close()
+        logger.info("Server stopped")
+
+    def _handle_stop(self, signum: int, frame: Optional[FrameType]) -> None:
+        logger.info("Stopping server workers")
+        self._stopping = True
+        for pid in list(self._workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def _spawn_worker(self) -> None:
+        pid: int = os.fork()
+        if pid == 0:
+            exit_code = 0
+            try:
+                self._run_worker()
+            except Exception:
+                logger.exception("Server worker failed")
+                exit_code = 1
+            finally:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                # Never return into the supervisor's code.
+                os._exit(exit_code)
+        self._workers[pid] = time.monotonic()
+        logger.debug("Started server worker %d", pid)
+
+    def _run_worker(self) -> None:
+        stop = threading.Event()
+
+        def _handle_stop(signum: int, frame: Optional[FrameType]) -> None:
+            stop.set()
+
+        signal.signal(signal.SIGTERM, _handle_stop)
+        signal.signal(signal.SIGINT, _handle_stop)
+
+        if "sqlalchemy" in self.app.extensions:
+            # Drop the connections inherited from the supervisor without closing them, so
+            # this worker opens its own.
+            with self.app.app_context():
+                db.engine.dispose(close=False)
+
+        mllp_server: Optional[MllpServer] = None
+        if self.mllp_port is not None:
+            # Each worker listens on the same port; the kernel spreads connections across them.
+            mllp_server = MllpServer(
+                self.app,
+                host=self.host,
+                port=self.mllp_port,
+                max_workers=self.app.config["MLLP_MAX_WORKERS"],
+                encoding=self.app.config["MLLP_ENCODING"],
+                reuse_port=True,
+            )
+            mllp_server.start()
+
+        wsgi_app: Any = self.app
+        if self.max_requests > 0:
+            max_requests: int = self.max_requests + random.randint(
+                0, self.max_requests_jitter
+            )
+            wsgi_app = RequestCounter(self.app, max_requests, on_limit=stop.set)
+        # With a single socket this is a TcpWSGIServer, whose internals (the channel map and
+        # active channels) are used below but aren't covered by the type stubs.
+        server: Any = create_server(
+            wsgi_app, sockets=[self._socket], threads=self.threads
+        )
+        logger.info("Server worker %d ready", os.getpid())
+
+        supervisor_pid: int = os.getppid()
+        while not stop.is_set():
+            if os.getppid() != supervisor_pid:
+                logger.warning("Server supervisor has exited, stopping worker")
+                break
+            wasyncore.loop(
+                timeout=WORKER_POLL_INTERVAL_SEC,
+                map=server._map,
+                use_poll=True,
+                count=1,
+            )
+
+        logger.info("Server worker %d stopping", os.getpid())
+        if mllp_server is not None:
+            mllp_server.stop()
+        self._drain(server)
+
+    def _drain(self, server: Any) -> None:
+        # Stop accepting connections (other workers will pick them up) and close each
+        # connection once the requests received on it have been responded to.
+        server.accepting = False
+        deadline: float = time.monotonic() + self.graceful_timeout
+        while server.active_channels and time.monotonic() < deadline:
+            idle_since: float = time.time() - DRAIN_IDLE_SEC
+            for channel in list(server.active_channels.values()):
+                if (
+                    not channel.requests
+                    and channel.request is None
+                    and channel.last_activity < idle_since
+                ):
+                    channel.will_close = True
+            wasyncore.loop(
+                timeout=WORKER_POLL_INTERVAL_SEC,
+                map=server._map,
+                use_poll=True,
+                count=1,
+            )
+        if server.active_channels:
+            logger.warning(
+                "Server worker %d closing %d connections after graceful timeout",
+                os.getpid(),
+                len(server.active_channels),
+            )
+        server.task_dispatcher.shutdown()
@@ -1,30 +1,331 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
 import uuid
-from typing import Dict
+from typing import Callable, Dict, List, Optional, Tuple
 
+import dhosredis
 import requests
-from cachetools import TTLCache, cached
-from flask import current_app
+from flask import Flask, current_app
 from flask_batteries_included.helpers.error_handler import ServiceUnavailableException
 from she_logging import logger
 from she_logging.request_id import current_request_id
 
 from dhos_connector_api import config
+from dhos_connector_api.helpers import http_client
+
+# After a failed background refresh, the cached config is used for this long before retrying.
+REFRESH_RETRY_INTERVAL_SEC = 60
+
+# Called with the new config whenever a different trustomer config is fetched.
+_change_listeners: List[Callable[[Dict], None]] = []
 
 
 def get_trustomer_base_url() -> str:
     return current_app.config["DHOS_TRUSTOMER_API_HOST"]
 
 
-_cache: TTLCache = TTLCache(1, config.Configuration().TRUSTOMER_CONFIG_CACHE_TTL_SEC)
+class TrustomerConfigCache:
+    """
+    Caches the trustomer config. Once the config is `refresh_ahead` seconds from expiring it
+    is refreshed in a background thread, and the cached config is returned in the meantime.
+    If the refresh fails (e.g. the trustomer API is down), the last config fetched continues to
+    be used, even once it has expired. Only one thread fetches the config at a time, so callers
+    only ever wait for a fetch when nothing has been cached yet.
+    """
+
+    def __init__(
+        self,
+        ttl: float,
+        refresh_ahead: float,
+        on_change: Optional[Callable[[Dict], None]] = None,
+    ) -> None:
+        self.ttl = ttl
+        self.refresh_ahead = refresh_ahead
+        # Called (in an app context) whenever a different config is fetched.
+        self.on_change = on_change
+        self._config: Optional[Dict] = None
+        self._fetched_at: float = 0.0
+        self._retry_at: float = 0.0
+        # Held while the config is being fetched.
+        self._lock = threading.Lock()
+        self._refresh_thread: Optional[threading.Thread] = None
+
+    def get(self, fetch: Callable[[], Dict]) -> Dict:
+        cached_config: Optional[Dict] = self._config
+        if cached_config is None:
+            with self._lock:
+                # Another thread may have fetched the config while we were waiting.
+                if self._config is not None:
+                    return self._config
+                trustomer_config: Dict = fetch()
+                self._store(trustomer_config)
+                return trustomer_config
+
+        now: float = time.monotonic()
+        if (
+            now - self._fetched_at >= self.ttl - self.refresh_ahead
+            and now >= self._retry_at
+        ):
+            self._refresh_in_background(fetch)
+        return cached_config
+
+    def clear(self) -> None:
+        with self._lock:
+            self._config = None
+            self._fetched_at = 0.0
+            self._retry_at = 0.0
+
+    def prime(self, trustomer_config: Dict) -> None:
+        """
+        Caches a config that may be out of date, e.g. from a snapshot. It is used straight
+        away, and refreshed in the background when it is first used.
+        """
+        with self._lock:
+            self._config = trustomer_config
+            self._fetched_at = time.monotonic() - self.ttl
+            self._retry_at = 0.0
+
+    def _store(self, trustomer_config: Dict) -> None:
+        changed: bool = trustomer_config != self._config
+        self._config = trustomer_config
+        self._fetched_at = time.monotonic()
+        if changed and self.on_change is not None:
+            self.on_change(trustomer_config)
+
+    def _refresh_in_background(self, fetch: Callable[[], Dict]) -> None:
+        if not self._lock.acquire(blocking=False):
+            # Already being fetched.
+            return
+        app: Flask = current_app._get_current_object()  # type: ignore
+        try:
+            self._refresh_thread = threading.Thread(
+                target=self._refresh,
+                args=(app, fetch),
+                name="trustomer-refresh",
+                daemon=True,
+            )
+            self._refresh_thread.start()
+        except Exception:
+            self._lock.release()
+            raise
+
+    def _refresh(self, app: Flask, fetch: Callable[[], Dict]) -> None:
+        # Runs with the lock held by `_refresh_in_background`.
+        try:
+            with app.app_context():
+                self._store(fetch())
+        except Exception:
+            logger.warning("Using cached trustomer config until it can be refreshed")
+            self._retry_at = time.monotonic() + REFRESH_RETRY_INTERVAL_SEC
+        finally:
+            self._lock.release()
+
+
+class SharedTrustomerConfigCache:
+    """
+    Caches the trustomer config in redis, so that one fetch from the trustomer API serves every
+    process and replica. Alongside the config, a small version stamp (a hash of the config and
+    the time it was fetched) is stored, so processes can check whether their copy is current
+    without loading the whole config. The config is fetched from the API again once the shared
+    copy is `refresh_ahead` seconds from being `ttl` seconds old; if that fails, the shared
+    copy continues to be used.
+    """
+
+    def __init__(self, ttl: float, refresh_ahead: float) -> None:
+        self.ttl = ttl
+        self.refresh_ahead = refresh_ahead
+        # This process's copy of the shared config, and its version.
+        self._config: Optional[Dict] = None
+        self._version: Optional[str] = None
+
+    def get(self, fetch: Callable[[], Dict]) -> Dict:
+        customer_code: str = current_app.config["CUSTOMER_CODE"].lower()
+        stamp: Optional[Tuple[str, float]] = self._get_stamp(customer_code)
+        if stamp is not None:
+            version, fetched_at = stamp
+            if version != self._version:
+                self._load(customer_code, version)
+            if (
+                self._config is not None
+                and self._version == version
+                and time.time() - fetched_at < self.ttl - self.refresh_ahead
+            ):
+                return self._config
+
+        try:
+            trustomer_config: Dict = fetch()
+        except ServiceUnavailableException:
+            if self._config is None or stamp is None or self._version != stamp[0]:
+                raise
+            logger.warning(
+                "Using trustomer config from redis until it can be refreshed"
+            )
+            return self._config
+        self._save(customer_code, trustomer_config)
+        return trustomer_config
+
+    def clear(self) -> None:
+        self._config = None
+        self._version = None
+
+    def _get_stamp(self, customer_code: str) -> Optional[Tuple[str, float]]:
+        stamp: Optional[str] = dhosredis.get_value(
+            key=f"TRUSTOMER_CONFIG_VERSION_{customer_code}", default=None
+        )
+        if stamp is None:
+            return None
+        try:
+            version, fetched_at = stamp.split(":")
+            return version, float(fetched_at)
+        except ValueError:
+            logger.warning("Ignoring invalid trustomer config version in redis")
+            return None
+
+    def _load(self, customer_code: str, version: str) -> None:
+        value: Optional[str] = dhosredis.get_value(
+            key=f"TRUSTOMER_CONFIG_{customer_code}", default=None
+        )
+        if value is None:
+            return
+        try:
+            entry: Dict = json.loads(value)
+        except ValueError:
+            logger.warning("Ignoring invalid trustomer config in redis")
+            return
+        if entry.get("version") != version:
+            # Changed between reading the stamp and the config. The next check will load it.
+            return
+        logger.info("Loaded trustomer config version %s from redis", version)
+        self._config = entry["config"]
+        self._version = version
+
+    def _save(self, customer_code: str, trustomer_config: Dict) -> None:
+        serialised: str = json.dumps(trustomer_config, sort_keys=True)
+        version: str = hashlib.sha256(serialised.encode("utf8")).hexdigest()[:16]
+        if version != self._version:
+            logger.info("Trustomer config version %s fetched", version)
+        # The config is written before the stamp, so a process that reads the new stamp
+        # will find the matching config.
+        dhosredis.set_value(
+            key=f"TRUSTOMER_CONFIG_{customer_code}",
+            value=json.dumps({"version": version, "config": trustomer_config}),
+        )
+        dhosredis.set_value(
+            key=f"TRUSTOMER_CONFIG_VERSION_{customer_code}",
+            value=f"{version}:{time.time()}",
+        )
+        self._config = trustomer_config
+        self._version = version
+
+
+def add_change_listener(listener: Callable[[Dict], None]) -> None:
+    """
+    Registers `listener` to be called (in an app context) with the new trustomer config
+    whenever a different config is fetched, e.g. to clear anything derived from the old one.
+    """
+    _change_listeners.append(listener)
+
+
+def _config_changed(trustomer_config: Dict) -> None:
+    _save_snapshot(trustomer_config)
+    for listener in _change_listeners:
+        listener(trustomer_config)
+
+
+def _save_snapshot(trustomer_config: Dict) -> None:
+    snapshot_path: Optional[str] = current_app.config["TRUSTOMER_CONFIG_SNAPSHOT_PATH"]
+    if snapshot_path is None:
+        return
+    snapshot: Dict = {
+        "customer_code": current_app.config["CUSTOMER_CODE"].lower(),
+        "config": trustomer_config,
+    }
+    try:
+        # Written to a temporary file and moved into place, so a snapshot is never partial.
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(snapshot_path) or ".")
+        with os.fdopen(fd, "w") as f:
+            json.dump(snapshot, f)
+        os.replace(tmp_path, snapshot_path)
+    except OSError:
+        logger.exception(
+            "Failed to save trustomer config snapshot to %s", snapshot_path
+        )
+
+
+def load_config_snapshot(app: Flask) -> bool:
+    """
+    Loads the trustomer config saved by a previous run (if TRUSTOMER_CONFIG_SNAPSHOT_PATH is
+    set), so that the first request after startup doesn't have to wait for it to be fetched.
+    The config is refreshed in the background when it is first used. Returns whether a
+    snapshot was loaded.
+    """
+    snapshot_path: Optional[str] = app.config["TRUSTOMER_CONFIG_SNAPSHOT_PATH"]
+    if snapshot_path is None or not os.path.exists(snapshot_path):
+        return False
+    try:
+        with open(snapshot_path) as f:
+            snapshot: Dict = json.load(f)
+    except (OSError, ValueError):
+        logger.exception(
+            "Failed to load trustomer config snapshot from %s", snapshot_path
+        )
+        return False
+    if snapshot.get("customer_code") != app.config["CUSTOMER_CODE"].lower():
+        logger.warning("Ignoring trustomer config snapshot for a different customer")
+        return False
+
+    if app.config["TRUSTOMER_CONFIG_SHARED_CACHE"]:
+        _shared_copy_cache.prime(snapshot["config"])
+    else:
+        _cache.prime(snapshot["config"])
+    logger.info("Loaded trustomer config snapshot from %s", snapshot_path)
+    return True
+
+
+_cache = TrustomerConfigCache(
+    ttl=config.Configuration().TRUSTOMER_CONFIG_CACHE_TTL_SEC,
+    refresh_ahead=config.Configuration().TRUSTOMER_CONFIG_REFRESH_AHEAD_SEC,
+    on_change=_config_changed,
+)
+_shared_cache = SharedTrustomerConfigCache(
+    ttl=config.Configuration().TRUSTOMER_CONFIG_CACHE_TTL_SEC,
+    refresh_ahead=config.Configuration().TRUSTOMER_CONFIG_REFRESH_AHEAD_SEC,
+)
+# With the shared cache, each process's copy is checked against the version in redis
+# whenever it is this old.
+_shared_copy_cache = TrustomerConfigCache(
+    ttl=config.Configuration().TRUSTOMER_CONFIG_VERSION_CHECK_SEC,
+    refresh_ahead=0,
+    on_change=_config_changed,
+)
 
 
-@cached(cache=_cache)  # cache for 1 hour
 def get_trustomer_config() -> Dict:
+    if current_app.config["TRUSTOMER_CONFIG_SHARED_CACHE"]:
+        return _shared_copy_cache.get(_fetch_shared_trustomer_config)
+    return _cache.get(_fetch_trustomer_config)
+
+
+def clear_cache() -> None:
+    _cache.clear()
+    _shared_cache.clear()
+    _shared_copy_cache.clear()
+
+
+def _fetch_shared_trustomer_config() -> Dict:
+    return _shared_cache.get(_fetch_trustomer_config)
+
+
+def _fetch_trustomer_config() -> Dict:
     customer_code = current_app.config["CUSTOMER_CODE"].lower()
     url = f"{get_trustomer_base_url()}/dhos/v1/trustomer/{customer_code}"
     logger.info("Fetching trustomer config from %s", url)
     try:
-        response = requests.get(
+        response = http_client.get_session("trustomer").get(
             url=url,
             headers={
                 "X-Request-ID": current_request_id() or str(uuid.uuid4()),
@@ -32,6 +333,7 @@ def get_trustomer_config() -> Dict:
                 "X-Trustomer": customer_code,
                 "X-Product": "polaris",
             },
+            timeout=current_app.config["TRUSTOMER_API_TIMEOUT_SEC"],
         )
         response.raise_for_status()
     except requests.RequestException as e:
@@ -6,7 +6,7 @@ from flask_batteries_included.helpers.apispec import (
     initialise_apispec,
     openapi_schema,
 )
-from marshmallow import EXCLUDE, INCLUDE, Schema, fields
+from marshmallow import EXCLUDE, INCLUDE, Schema, fields, validate
 
 dhos_connector_api_spec: APISpec = APISpec(
     version="1.0.0",
@@ -20,6 +20,8 @@ dhos_connector_api_spec: APISpec = APISpec(
 
 initialise_apispec(dhos_connector_api_spec)
 
+MAX_MESSAGE_BATCH_SIZE = 1000
+
 
 EXAMPLE_MESSAGE = (
     "TVNIfF5+XFxcJnxjMDQ4MXxPWE9OfE9YT05fVElFX0FEVHxPWE9OfDIwMTcwNzMxMTQxMzQ4fHxBRFReQTAxfFE1NDkyOTE2ODJU"
@@ -57,6 +59,21 @@ class MessageRequest(Schema):
     )
 
 
+@openapi_schema(dhos_connector_api_spec)
+class MessageBatchRequest(Schema):
+    class Meta:
+        title = "Message batch request"
+        unknown = EXCLUDE
+        ordered = True
+
+    messages = fields.List(
+        fields.Nested(MessageRequest),
+        required=True,
+        validate=validate.Length(min=1, max=MAX_MESSAGE_BATCH_SIZE),
+        metadata={"description": "HL7 messages to be processed, in order"},
+    )
+
+
 @openapi_schema(dhos_connector_api_spec)
 class MessageUpdate(Schema):
     class Meta:
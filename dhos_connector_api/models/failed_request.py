@@ -0,0 +1,41 @@
+from datetime import datetime
+from typing import Any
+
+from flask_batteries_included.sqldb import db
+
+
+class FailedRequest(db.Model):
+    """
+    An outbound request (e.g. sending an ORU or CDA message) that failed and is waiting to be
+    retried. The request is made again by calling `api_name` in the module `path_to_module`
+    with `call_args` as keyword arguments. There is at most one row for each type of request
+    and identifier (e.g. an observation set UUID).
+    """
+
+    __tablename__ = "failed_request_queue"
+    __table_args__ = (db.UniqueConstraint("type", "identifier"),)
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    created = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    type = db.Column(db.String, nullable=False)
+    identifier = db.Column(db.String, nullable=False)
+    path_to_module = db.Column(db.String, nullable=False)
+    api_name = db.Column(db.String, nullable=False)
+    call_args = db.Column(db.JSON, nullable=True)
+    # Requests with the same partition key (e.g. ORU messages for the same patient) are made
+    # one at a time, in order of record time (e.g. when the observation set was recorded),
+    # then the order they were added.
+    partition_key = db.Column(db.String, nullable=True, index=True)
+    record_time = db.Column(db.DateTime, nullable=True)
+    fail_count = db.Column(db.Integer, nullable=False, default=0)
+    last_fail_time = db.Column(db.DateTime, nullable=True)
+    last_fail_reason = db.Column(db.String, nullable=True)
+    # When the request is next due to be retried.
+    next_retry_at = db.Column(db.DateTime, nullable=True, index=True)
+    # Set once the request has failed MAX_REQUEST_FAILS times, after which it isn't retried.
+    hard_fail = db.Column(db.Boolean, nullable=False, default=False, index=True)
+    succeeded = db.Column(db.Boolean, nullable=False, default=False)
+
+    def __init__(self, **kwargs: Any) -> None:
+        # Constructor to satisfy linters.
+        super(FailedRequest, self).__init__(**kwargs)
@@ -5,6 +5,7 @@ from flask_batteries_included.helpers.timestamp import (
     parse_iso8601_to_datetime,
 )
 from flask_batteries_included.sqldb import ModelIdentifier, db
+from sqlalchemy.orm import validates
 
 import dhos_connector_api.helpers.parser
 
@@ -19,7 +20,20 @@ class Hl7Message(ModelIdentifier, db.Model):
     dst_description = db.Column(db.String, nullable=True, unique=False)
     message_control_id = db.Column(db.String, nullable=True, unique=True, index=True)
     ack = db.Column(db.String, nullable=True, unique=False)
+    # MSA-1 from the ACK, set whenever the ACK is so it doesn't need parsing on every read.
+    ack_status_ = db.Column(db.String, nullable=True, unique=False)
     patient_identifiers = db.Column(db.JSON, nullable=True, unique=False)
+    # Parsed form of the content, stored when STORE_PARSED_CONTENT is enabled.
+    content_parsed = db.Column(db.JSON, nullable=True, unique=False)
+    # Set when a message has been ACKed but its actions have not yet been generated.
+    awaiting_processing = db.Column(
+        db.Boolean,
+        nullable=False,
+        unique=False,
+        default=False,
+        server_default=db.false(),
+        index=True,
+    )
 
     def __init__(self, **kwargs: Any) -> None:
         # Constructor to satisfy linters.
@@ -41,17 +55,18 @@ class Hl7Message(ModelIdentifier, db.Model):
     def sent_at(self, v: str) -> None:
         self.sent_at_ = parse_iso8601_to_datetime(v)
 
+    @validates("ack")
+    def _set_ack_status(self, key: str, ack: Optional[str]) -> Optional[str]:
+        self.ack_status_ = (
+            dhos_connector_api.helpers.parser.parse_ack_code(ack) if ack else None
+        )
+        return ack
+
     def ack_status(self) -> Optional[str]:
         """
         Returns the status field in the ACK message. Expected values are: "AA", "AR", "AE" and None
         """
-        if not self.ack:
-            return None
-        try:
-            hl7_wrapper = dhos_connector_api.helpers.parser.parse_hl7_message(self.ack)
-            return hl7_wrapper.get_field_by_hl7_path("MSA.F1")
-        except ValueError:
-            return None
+        return self.ack_status_
 
     def to_dict(self) -> dict:
         message = {
@@ -0,0 +1,22 @@
+from datetime import datetime
+from typing import Any
+
+from flask_batteries_included.sqldb import db
+
+
+class OutboxMessage(db.Model):
+    """
+    A message waiting to be published to RabbitMQ. Rows are written in the same transaction
+    as the HL7 message they relate to, and deleted by the outbox relay once the broker has
+    confirmed receipt.
+    """
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    created = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    routing_key = db.Column(db.String, nullable=False)
+    body = db.Column(db.JSON, nullable=False)
+    correlation_id = db.Column(db.String, nullable=True)
+
+    def __init__(self, **kwargs: Any) -> None:
+        # Constructor to satisfy linters.
+        super(OutboxMessage, self).__init__(**kwargs)
@@ -3,9 +3,9 @@ import subprocess
 
 import sadisplay
 
-from dhos_connector_api.models import hl7_message
+from dhos_connector_api.models import hl7_message, outbox_message
 
-desc = sadisplay.describe([hl7_message.Hl7Message])
+desc = sadisplay.describe([hl7_message.Hl7Message, outbox_message.OutboxMessage])
 with codecs.open("docs/schema.plantuml", "w", encoding="utf-8") as f:
     f.write(sadisplay.plantuml(desc).rstrip() + "\n")
 
@@ -0,0 +1,60 @@
+"""failed request queue
+
+Revision ID: 5e07a9c3d1b2
+Revises: c41e8d2b7f03
+Create Date: 2026-10-16 17:02:18.530417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "5e07a9c3d1b2"
+down_revision = "c41e8d2b7f03"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "failed_request_queue",
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column("created", sa.DateTime(), nullable=False),
+        sa.Column("type", sa.String(), nullable=False),
+        sa.Column("identifier", sa.String(), nullable=False),
+        sa.Column("path_to_module", sa.String(), nullable=False),
+        sa.Column("api_name", sa.String(), nullable=False),
+        sa.Column("call_args", sa.JSON(), nullable=True),
+        sa.Column("fail_count", sa.Integer(), nullable=False),
+        sa.Column("last_fail_time", sa.DateTime(), nullable=True),
+        sa.Column("last_fail_reason", sa.String(), nullable=True),
+        sa.Column("next_retry_at", sa.DateTime(), nullable=True),
+        sa.Column("hard_fail", sa.Boolean(), nullable=False),
+        sa.Column("succeeded", sa.Boolean(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("type", "identifier"),
+    )
+    op.create_index(
+        op.f("ix_failed_request_queue_next_retry_at"),
+        "failed_request_queue",
+        ["next_retry_at"],
+        unique=False,
+    )
+    op.create_index(
+        op.f("ix_failed_request_queue_hard_fail"),
+        "failed_request_queue",
+        ["hard_fail"],
+        unique=False,
+    )
+
+
+def downgrade():
+    op.drop_index(
+        op.f("ix_failed_request_queue_hard_fail"), table_name="failed_request_queue"
+    )
+    op.drop_index(
+        op.f("ix_failed_request_queue_next_retry_at"),
+        table_name="failed_request_queue",
+    )
+    op.drop_table("failed_request_queue")
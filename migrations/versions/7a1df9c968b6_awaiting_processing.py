@@ -0,0 +1,41 @@
+"""awaiting processing
+
+Revision ID: 7a1df9c968b6
+Revises: 9958a082bf95
+Create Date: 2026-10-16 11:02:17.540913
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "7a1df9c968b6"
+down_revision = "9958a082bf95"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "hl7_message",
+        sa.Column(
+            "awaiting_processing",
+            sa.Boolean(),
+            server_default=sa.false(),
+            nullable=False,
+        ),
+    )
+    op.create_index(
+        op.f("ix_hl7_message_awaiting_processing"),
+        "hl7_message",
+        ["awaiting_processing"],
+        unique=False,
+    )
+
+
+def downgrade():
+    op.drop_index(
+        op.f("ix_hl7_message_awaiting_processing"), table_name="hl7_message"
+    )
+    op.drop_column("hl7_message", "awaiting_processing")
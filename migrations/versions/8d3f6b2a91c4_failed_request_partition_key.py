@@ -0,0 +1,37 @@
+"""failed request partition key
+
+Revision ID: 8d3f6b2a91c4
+Revises: 5e07a9c3d1b2
+Create Date: 2026-10-17 10:14:52.208311
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "8d3f6b2a91c4"
+down_revision = "5e07a9c3d1b2"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "failed_request_queue",
+        sa.Column("partition_key", sa.String(), nullable=True),
+    )
+    op.create_index(
+        op.f("ix_failed_request_queue_partition_key"),
+        "failed_request_queue",
+        ["partition_key"],
+        unique=False,
+    )
+
+
+def downgrade():
+    op.drop_index(
+        op.f("ix_failed_request_queue_partition_key"),
+        table_name="failed_request_queue",
+    )
+    op.drop_column("failed_request_queue", "partition_key")
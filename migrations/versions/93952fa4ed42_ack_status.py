@@ -0,0 +1,83 @@
+"""ack_status
+
+Revision ID: 93952fa4ed42
+Revises: 7a1df9c968b6
+Create Date: 2026-10-16 14:21:40.118532
+
+"""
+from typing import Dict, List, Optional
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "93952fa4ed42"
+down_revision = "7a1df9c968b6"
+branch_labels = None
+depends_on = None
+
+# Rows are backfilled in chunks, each committed separately, so that the lock taken when the
+# column is added isn't held while the whole table is backfilled. Messages received during the
+# backfill have their ACK status set as they are saved.
+BACKFILL_CHUNK_SIZE = 5000
+
+
+def upgrade():
+    op.add_column("hl7_message", sa.Column("ack_status_", sa.String(), nullable=True))
+    # Commits the migration so far (releasing the lock on the table), then runs the backfill
+    # outside of a transaction. Each statement is committed as it runs.
+    with op.get_context().autocommit_block():
+        _backfill_ack_status()
+
+
+def downgrade():
+    op.drop_column("hl7_message", "ack_status_")
+
+
+def _backfill_ack_status():
+    hl7_message = sa.table(
+        "hl7_message",
+        sa.column("uuid", sa.String),
+        sa.column("ack", sa.String),
+        sa.column("ack_status_", sa.String),
+    )
+    conn = op.get_bind()
+    last_uuid = ""
+    while True:
+        rows = conn.execute(
+            sa.select([hl7_message.c.uuid, hl7_message.c.ack])
+            .where(hl7_message.c.ack.isnot(None))
+            .where(hl7_message.c.uuid > last_uuid)
+            .order_by(hl7_message.c.uuid)
+            .limit(BACKFILL_CHUNK_SIZE)
+        ).fetchall()
+        if not rows:
+            break
+        updates: List[Dict] = [
+            {"b_uuid": row.uuid, "b_ack_status": _parse_ack_code(row.ack)}
+            for row in rows
+        ]
+        conn.execute(
+            hl7_message.update()
+            .where(hl7_message.c.uuid == sa.bindparam("b_uuid"))
+            .values(ack_status_=sa.bindparam("b_ack_status")),
+            updates,
+        )
+        last_uuid = rows[-1].uuid
+
+
+def _parse_ack_code(ack: str) -> Optional[str]:
+    # Self-contained version of parser.parse_ack_code, so that this migration doesn't
+    # change if the application code does.
+    if not ack.startswith("MSH") or len(ack) < 5:
+        return None
+    field_separator, component_separator = ack[3], ack[4]
+    for segment in ack.replace("\r\n", "\r").replace("\n", "\r").split("\r"):
+        fields = segment.split(field_separator)
+        if fields[0] == "MSA":
+            if len(fields) < 2:
+                return ""
+            code = fields[1].split(component_separator)[0]
+            return None if code == '""' else code
+    return None
@@ -0,0 +1,32 @@
+"""outbox message
+
+Revision ID: 9958a082bf95
+Revises: 750f62cf51e5
+Create Date: 2026-10-16 10:12:41.118274
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "9958a082bf95"
+down_revision = "750f62cf51e5"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "outbox_message",
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column("created", sa.DateTime(), nullable=False),
+        sa.Column("routing_key", sa.String(), nullable=False),
+        sa.Column("body", sa.JSON(), nullable=False),
+        sa.Column("correlation_id", sa.String(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+    )
+
+
+def downgrade():
+    op.drop_table("outbox_message")
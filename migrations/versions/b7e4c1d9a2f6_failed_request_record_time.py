@@ -0,0 +1,27 @@
+"""failed request record time
+
+Revision ID: b7e4c1d9a2f6
+Revises: 8d3f6b2a91c4
+Create Date: 2026-10-17 14:38:05.617290
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "b7e4c1d9a2f6"
+down_revision = "8d3f6b2a91c4"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "failed_request_queue",
+        sa.Column("record_time", sa.DateTime(), nullable=True),
+    )
+
+
+def downgrade():
+    op.drop_column("failed_request_queue", "record_time")
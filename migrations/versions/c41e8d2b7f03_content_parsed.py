@@ -0,0 +1,24 @@
+"""content parsed
+
+Revision ID: c41e8d2b7f03
+Revises: 93952fa4ed42
+Create Date: 2026-10-16 15:37:52.204118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "c41e8d2b7f03"
+down_revision = "93952fa4ed42"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("hl7_message", sa.Column("content_parsed", sa.JSON(), nullable=True))
+
+
+def downgrade():
+    op.drop_column("hl7_message", "content_parsed")
@@ -0,0 +1,176 @@
+"""
+Microbenchmark for generating an ORU message for a 12-observation set, and for converting its
+timestamps with the per-message rendering context (which converts the measured times in one
+batch) compared with converting each one through Hl7Wrapper. Trustomer config is served from a
+dictionary rather than the (cached) trustomer API.
+
+Run with `tox -e benchmark`, or `python -m tests.benchmarks.bench_generator` with the tox
+environment variables set.
+"""
+import timeit
+from typing import Any, Callable, Dict, List, Optional
+
+from flask import Flask
+
+from dhos_connector_api.helpers import generator, trustomer
+from dhos_connector_api.helpers.hl7_wrapper import Hl7Wrapper
+
+ITERATIONS = 2000
+
+TRUSTOMER_CONFIG: Dict = {
+    "send_config": {
+        "generate_oru_messages": True,
+        "oxygen_masks": [
+            {"code": "RA", "name": "Room Air"},
+            {"code": "V{mask_percent}", "name": "Venturi"},
+        ],
+    },
+    "hl7_config": {
+        "outgoing_receiving_facility": "TRUST",
+        "outgoing_receiving_application": "TRUST_TIE_ADT",
+        "outgoing_timestamp_format": "%Y%m%d%H%M%S.%L%z",
+        "outgoing_sending_application": "DHOS",
+        "outgoing_sending_facility": "SENSYNE",
+        "outgoing_processing_id": "P",
+    },
+}
+
+
+def _obs(
+    measured_time: str,
+    observation_type: str,
+    value: Any = None,
+    unit: Optional[str] = None,
+    string: Optional[str] = None,
+    metadata: Optional[Dict] = None,
+) -> Dict:
+    return {
+        "measured_time": measured_time,
+        "observation_metadata": metadata,
+        "observation_string": string,
+        "observation_type": observation_type,
+        "observation_unit": unit,
+        "observation_value": value,
+        "patient_refused": None,
+        "score_value": 1,
+    }
+
+
+OBSERVATIONS: List[Dict] = [
+    _obs("2019-01-30T13:06:26.870Z", "heart_rate", 72, "bpm"),
+    _obs("2019-01-30T13:06:26.870Z", "respiratory_rate", 16, "/min"),
+    _obs(
+        "2019-01-30T13:07:02.113Z",
+        "diastolic_blood_pressure",
+        80,
+        "mmHg",
+        metadata={"patient_position": "sitting"},
+    ),
+    _obs(
+        "2019-01-30T13:07:02.113Z",
+        "systolic_blood_pressure",
+        120,
+        "mmHg",
+        metadata={"patient_position": "sitting"},
+    ),
+    _obs("2019-01-30T13:06:26.870Z", "spo2", 96, "%"),
+    _obs(
+        "2019-01-30T13:08:45.002Z",
+        "o2_therapy_status",
+        2,
+        "lpm",
+        metadata={"mask": "Venturi", "mask_percent": 28},
+    ),
+    _obs("2019-01-30T13:06:26.870Z", "temperature", 37.1, "celcius"),
+    _obs("2019-01-30T13:09:10.540Z", "consciousness_acvpu", string="Alert"),
+    _obs(
+        "2019-01-30T13:09:10.540Z",
+        "consciousness_gcs",
+        15,
+        metadata={
+            "gcs_eyes": 4,
+            "gcs_eyes_description": "Spontaneous",
+            "gcs_motor": 6,
+            "gcs_motor_description": "Obeys Commands",
+            "gcs_verbal": 5,
+            "gcs_verbal_description": "Oriented",
+        },
+    ),
+    _obs(
+        "2019-01-30T13:09:31.007Z",
+        "nurse_concern",
+        string="Infection?, Pallor or Cyanosis",
+    ),
+    # Observations that aren't sent in ORU messages.
+    _obs("2019-01-30T13:10:00.000Z", "blood_glucose", 5.5, "mmol/L"),
+    _obs("2019-01-30T13:10:00.000Z", "pain_score", 2),
+]
+
+OBS_SET: Dict = {
+    "uuid": "0324e62b-88fb-4aef-b15c-ee0454ce997f",
+    "record_time": "2019-01-30T13:06:26.870Z",
+    "time_next_obs_set_due": "2019-01-30T17:06:26.870Z",
+    "mins_late": -30,
+    "score_system": "news2",
+    "score_value": 2,
+    "score_severity": "low",
+    "spo2_scale": 1,
+    "observations": OBSERVATIONS,
+}
+
+PATIENT: Dict = {
+    "uuid": "2c4f1d24-2952-4d4e-b1d1-3637e33cc161",
+    "hospital_number": "654321",
+    "nhs_number": "8888888888",
+    "first_name": "Jane",
+    "last_name": "Smith",
+    "dob": "1982-11-23",
+    "sex": "248152002",
+}
+
+ENCOUNTER: Dict = {
+    "epr_encounter_id": "2018L86699800",
+    "location_ods_code": "J-WD 5A^Bay A^Bed 1",
+    "admitted_at": "2019-01-29T09:00:00.000Z",
+}
+
+CLINICIAN: Dict = {
+    "send_entry_identifier": "321",
+    "first_name": "Jane",
+    "last_name": "Deer",
+}
+
+
+def time_per_call(fn: Callable[[], Any]) -> float:
+    return min(timeit.repeat(fn, number=ITERATIONS, repeat=3)) / ITERATIONS
+
+
+def convert_with_context(timestamps: List[str]) -> List[str]:
+    context = generator._OruContext(OBSERVATIONS)
+    return [context.hl7_datetime(t) for t in timestamps]
+
+
+def main() -> None:
+    app = Flask(__name__)
+    trustomer.get_trustomer_config = lambda: TRUSTOMER_CONFIG  # type: ignore
+    timestamps: List[str] = [o["measured_time"] for o in OBSERVATIONS]
+    with app.app_context():
+        message: float = time_per_call(
+            lambda: generator.generate_oru_message(
+                PATIENT, ENCOUNTER, OBS_SET, CLINICIAN
+            )
+        )
+        per_call: float = time_per_call(
+            lambda: [Hl7Wrapper.iso8601_to_hl7_datetime(t) for t in timestamps]
+        )
+        context: float = time_per_call(lambda: convert_with_context(timestamps))
+    print(f"{'message':>10}: {message * 1e6:8.1f} us/message")
+    for name, seconds in {"per call": per_call, "context": context}.items():
+        print(
+            f"{name:>10}: {seconds * 1e6:8.1f} us/{len(timestamps)} timestamps "
+            f"({per_call / seconds:.2f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Microbenchmark comparing per-message ADT processing with the indexed, memoising Hl7Wrapper
+(with and without the fast field extractor) against a wrapper that resolves every path
+through the hl7 library on each call (the original behaviour).
+
+Run with `tox -e benchmark`, or `python -m tests.benchmarks.bench_hl7_wrapper` with the tox
+environment variables set.
+"""
+import timeit
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Union
+
+import hl7
+from flask import Flask
+
+from dhos_connector_api.helpers.hl7_path import Hl7Path
+from dhos_connector_api.helpers.hl7_wrapper import Hl7Wrapper
+from dhos_connector_api.helpers.parser import (
+    ADT_FIELD_PATHS,
+    generate_encounter_action,
+    generate_location_action,
+    generate_patient_action,
+    parse_hl7_message,
+    validate_hl7_message,
+)
+
+SAMPLES_DIR = Path(__file__).parent.parent / "samples"
+ITERATIONS = 200
+
+
+class UnindexedHl7Wrapper(Hl7Wrapper):
+    def contains_segment(self, segment_id: str) -> bool:
+        try:
+            self.parsed.segment(segment_id)
+            return True
+        except KeyError:
+            return False
+
+    def get_segment(self, segment_id: str) -> hl7.Segment:
+        return self.parsed.segment(segment_id)
+
+    def get_field_by_hl7_path(
+        self, path: Union[str, Hl7Path], default: str = None
+    ) -> Optional[str]:
+        try:
+            key = path if isinstance(path, str) else hl7.Accessor(*path)
+            field = str(self.parsed[key])
+            if field == '""':
+                return default
+            return field
+        except (KeyError, IndexError, ValueError):
+            return default
+
+
+def process(wrapper: Hl7Wrapper) -> List[Dict]:
+    validate_hl7_message(wrapper)
+    actions = [generate_patient_action(wrapper)]
+    if wrapper.contains_segment("PV1") and wrapper.get_field_by_hl7_path("PV1.F44"):
+        actions.append(generate_location_action(wrapper))
+        actions.append(generate_encounter_action(wrapper))
+    return actions
+
+
+def time_per_message(
+    messages: List[str], make_wrapper: Callable[[str], Hl7Wrapper]
+) -> float:
+    def run() -> None:
+        for message in messages:
+            process(make_wrapper(message))
+
+    run_time: float = min(timeit.repeat(run, number=ITERATIONS, repeat=3))
+    return run_time / (ITERATIONS * len(messages))
+
+
+def main() -> None:
+    app = Flask(__name__)
+    app.config["SERVER_TIMEZONE"] = "Europe/London"
+    # Normalise line endings in the same way as the receive path.
+    messages: List[str] = []
+    for sample in sorted(SAMPLES_DIR.glob("*.hl7")):
+        wrapper = parse_hl7_message(sample.read_text())
+        with app.app_context():
+            try:
+                process(wrapper)
+            except Exception:
+                continue
+        messages.append(wrapper.raw_message)
+
+    timings: Dict[str, Callable[[], float]] = {
+        "unindexed": lambda: time_per_message(messages, UnindexedHl7Wrapper),
+        "indexed": lambda: time_per_message(messages, Hl7Wrapper),
+        "extracted": lambda: time_per_message(
+            messages, lambda m: Hl7Wrapper.from_extracted_fields(m, ADT_FIELD_PATHS)
+        ),
+    }
+    with app.app_context():
+        results = {name: timing() for name, timing in timings.items()}
+    for name, seconds in results.items():
+        speedup: float = results["unindexed"] / seconds
+        print(f"{name:>10}: {seconds * 1e6:8.1f} us/message ({speedup:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -12,7 +12,7 @@ from flask.ctx import AppContext
 from mock import Mock
 from pytest_mock import MockFixture
 
-from dhos_connector_api.helpers import trustomer
+from dhos_connector_api.helpers import hl7_wrapper, jwt, obx_mapping, trustomer
 from dhos_connector_api.helpers.hl7_wrapper import Hl7Wrapper
 from dhos_connector_api.helpers.parser import parse_hl7_message
 
@@ -90,6 +90,27 @@ def generate_ack() -> Callable:
     return create_ack_message
 
 
+@pytest.fixture(autouse=True)
+def clear_epr_token_cache() -> None:
+    """The EPR service adapter JWT is cached per process, so each test mints its own."""
+    jwt.clear_cache()
+
+
+@pytest.fixture(autouse=True)
+def clear_hl7_datetime_formatters() -> None:
+    """
+    HL7 timestamp formatters are cached until the trustomer config changes, which tests mock,
+    so each test compiles its own.
+    """
+    hl7_wrapper.clear_hl7_datetime_formatters()
+
+
+@pytest.fixture(autouse=True)
+def clear_obx_templates() -> None:
+    """OBX templates are also compiled from the trustomer config, so each test compiles its own."""
+    obx_mapping.clear_obx_templates()
+
+
 @pytest.fixture(autouse=True)
 def mock_create_ack(mocker: MockFixture, request: Any) -> None:
     """
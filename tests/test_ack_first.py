@@ -0,0 +1,245 @@
+import base64
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Generator, List, Tuple
+from unittest.mock import Mock
+
+import kombu_batteries_included
+import pytest
+from flask import Flask
+from flask_batteries_included.sqldb import db
+from pytest_mock import MockFixture
+
+from dhos_connector_api.blueprint_api import receive_controller
+from dhos_connector_api.helpers import parser
+from dhos_connector_api.helpers.background import PartitionedExecutor
+from dhos_connector_api.models.hl7_message import Hl7Message
+
+
+def _encode(hl7: str) -> str:
+    return base64.b64encode(hl7.encode(encoding="utf8")).decode("utf8")
+
+
+class TestPartitionedExecutor:
+    def test_same_key_runs_in_order(self) -> None:
+        executor = PartitionedExecutor(num_partitions=4, thread_name_prefix="test")
+        results: List[int] = []
+
+        def task(i: int) -> None:
+            # Earlier tasks sleep for longer, so they would finish last if run in parallel.
+            time.sleep((10 - i) / 1000)
+            results.append(i)
+
+        for i in range(10):
+            executor.submit("patient", task, i)
+        executor.shutdown(wait=True)
+        assert results == list(range(10))
+
+    def test_different_keys_run_in_parallel(self) -> None:
+        executor = PartitionedExecutor(num_partitions=2, thread_name_prefix="test")
+        barrier = threading.Barrier(2, timeout=5)
+        # "a" and "d" map to different partitions. Each task blocks until the other has
+        # started, so this only completes if they run at the same time.
+        futures = [executor.submit(key, barrier.wait) for key in ("a", "d")]
+        executor.shutdown(wait=True)
+        assert all(f.exception() is None for f in futures)
+
+    def test_requires_a_partition(self) -> None:
+        with pytest.raises(ValueError):
+            PartitionedExecutor(num_partitions=0, thread_name_prefix="test")
+
+
+class DeferredExecutor:
+    """
+    Stands in for the PartitionedExecutor, running tasks when shut down rather than in
+    background threads (the sqlite test database can't be shared between threads).
+    """
+
+    def __init__(self) -> None:
+        self.tasks: List[Tuple[str, Callable, Tuple]] = []
+
+    def submit(self, partition_key: str, fn: Callable, *args: Any) -> None:
+        self.tasks.append((partition_key, fn, args))
+
+    def shutdown(self, wait: bool = True) -> None:
+        for _, fn, args in self.tasks:
+            fn(*args)
+        self.tasks = []
+
+
+@pytest.mark.nomockack
+@pytest.mark.usefixtures("app")
+class TestAckFirstProcessing:
+    @pytest.fixture(autouse=True)
+    def executor(self, app: Flask) -> Generator[DeferredExecutor, None, None]:
+        executor = DeferredExecutor()
+        app.config["ACK_FIRST_PROCESSING"] = True
+        app.extensions[receive_controller.PROCESSING_EXECUTOR_KEY] = executor
+        yield executor
+        app.config["ACK_FIRST_PROCESSING"] = False
+        del app.extensions[receive_controller.PROCESSING_EXECUTOR_KEY]
+
+    @pytest.fixture(autouse=True)
+    def mock_publish(self, mocker: MockFixture) -> Mock:
+        return mocker.patch.object(kombu_batteries_included, "publish_message")
+
+    def test_ack_then_process(
+        self, app: Flask, executor: DeferredExecutor, mock_publish: Mock
+    ) -> None:
+        hl7: str = Path("tests/samples/A01.hl7").read_text()
+        with app.app_context():
+            actual = receive_controller.create_and_process_hl7_message(_encode(hl7))
+        assert "MSA|AA|" in base64.b64decode(actual["body"]).decode("utf8")
+
+        executor.shutdown()
+        mock_publish.assert_called_once()
+        body = mock_publish.call_args[1]["body"]
+        assert body["dhos_connector_message_uuid"] == actual["uuid"]
+        assert body["actions"][0]["name"] == "process_patient"
+        with app.app_context():
+            message = Hl7Message.query.get(actual["uuid"])
+            assert message.awaiting_processing is False
+            assert message.patient_identifiers["MRN"] is not None
+            assert message.sent_at is not None
+
+    def test_header_rejected(
+        self, app: Flask, executor: DeferredExecutor, mock_publish: Mock
+    ) -> None:
+        hl7: str = (
+            Path("tests/samples/A01.hl7").read_text().replace("ADT^A01", "ORU^R01")
+        )
+        with app.app_context():
+            actual = receive_controller.create_and_process_hl7_message(_encode(hl7))
+            message = Hl7Message.query.get(actual["uuid"])
+            assert message.awaiting_processing is False
+        assert "MSA|AR|" in base64.b64decode(actual["body"]).decode("utf8")
+        assert executor.tasks == []
+        mock_publish.assert_not_called()
+
+    def test_rejected_after_ack(
+        self, app: Flask, executor: DeferredExecutor, mock_publish: Mock
+    ) -> None:
+        hl7: str = Path("tests/samples/A01.hl7").read_text()
+        hl7 = "\n".join(s for s in hl7.splitlines() if not s.startswith("PID"))
+        with app.app_context():
+            actual = receive_controller.create_and_process_hl7_message(_encode(hl7))
+        assert "MSA|AA|" in base64.b64decode(actual["body"]).decode("utf8")
+
+        executor.shutdown()
+        mock_publish.assert_not_called()
+        with app.app_context():
+            message = Hl7Message.query.get(actual["uuid"])
+            assert message.awaiting_processing is False
+            assert message.ack_status() == "AE"
+
+    def test_duplicate(
+        self, app: Flask, executor: DeferredExecutor, mock_publish: Mock
+    ) -> None:
+        hl7: str = Path("tests/samples/A01.hl7").read_text()
+        with app.app_context():
+            receive_controller.create_and_process_hl7_message(_encode(hl7))
+            duplicate = receive_controller.create_and_process_hl7_message(_encode(hl7))
+        assert "MSA|AR|" in base64.b64decode(duplicate["body"]).decode("utf8")
+
+        executor.shutdown()
+        mock_publish.assert_called_once()
+
+    def test_batch(
+        self, app: Flask, executor: DeferredExecutor, mock_publish: Mock
+    ) -> None:
+        bodies = [
+            _encode(Path(f"tests/samples/{name}.hl7").read_text())
+            for name in ("A01", "A02", "A03")
+        ]
+        with app.app_context():
+            actual = receive_controller.create_and_process_hl7_messages(bodies)
+        executor.shutdown()
+        assert mock_publish.call_count == 3
+        published = {
+            c[1]["body"]["dhos_connector_message_uuid"]
+            for c in mock_publish.call_args_list
+        }
+        assert published == {a["uuid"] for a in actual}
+
+    def test_same_patient_same_partition(
+        self, app: Flask, executor: DeferredExecutor
+    ) -> None:
+        hl7: str = Path("tests/samples/A01.hl7").read_text()
+        bodies = [_encode(hl7), _encode(hl7.replace("Q549291682T", "Q549291683T"))]
+        with app.app_context():
+            receive_controller.create_and_process_hl7_messages(bodies)
+        keys = [key for key, _, _ in executor.tasks]
+        assert len(keys) == 2
+        assert keys[0] == keys[1]
+
+    def test_process_pending_messages_command(
+        self, app: Flask, mocker: MockFixture, mock_publish: Mock
+    ) -> None:
+        # Simulate the server stopping before the message was processed.
+        mocker.patch.object(receive_controller, "_submit_for_processing")
+        hl7: str = Path("tests/samples/A01.hl7").read_text()
+        with app.app_context():
+            actual = receive_controller.create_and_process_hl7_message(_encode(hl7))
+        mock_publish.assert_not_called()
+
+        result = app.test_cli_runner().invoke(
+            args=["process-pending-messages", "--min-age-seconds", "0"]
+        )
+        assert result.exit_code == 0
+        mock_publish.assert_called_once()
+        with app.app_context():
+            assert Hl7Message.query.get(actual["uuid"]).awaiting_processing is False
+            # Processing a second time does nothing.
+            assert (
+                receive_controller.process_pending_hl7_messages(min_age_seconds=0) == 0
+            )
+            db.session.rollback()
+        mock_publish.assert_called_once()
+
+    def test_process_pending_unparseable_message(
+        self, app: Flask, mocker: MockFixture, mock_publish: Mock
+    ) -> None:
+        mocker.patch.object(receive_controller, "_submit_for_processing")
+        hl7: str = Path("tests/samples/A01.hl7").read_text()
+        with app.app_context():
+            unparseable = receive_controller.create_and_process_hl7_message(
+                _encode(hl7)
+            )
+            actual = receive_controller.create_and_process_hl7_message(
+                _encode(hl7.replace("Q549291682T", "Q549291683T"))
+            )
+            Hl7Message.query.get(unparseable["uuid"]).content = "Not an HL7 message"
+            db.session.commit()
+
+        with app.app_context():
+            assert (
+                receive_controller.process_pending_hl7_messages(min_age_seconds=0) == 2
+            )
+            # The message isn't picked up again, and the run carries on to the next one.
+            assert (
+                Hl7Message.query.get(unparseable["uuid"]).awaiting_processing is False
+            )
+            assert Hl7Message.query.get(actual["uuid"]).awaiting_processing is False
+        mock_publish.assert_called_once()
+        assert mock_publish.call_args[1]["body"]["dhos_connector_message_uuid"] == (
+            actual["uuid"]
+        )
+
+    def test_process_pending_uses_parsed_content(
+        self, app: Flask, mocker: MockFixture, mock_publish: Mock
+    ) -> None:
+        mocker.patch.object(receive_controller, "_submit_for_processing")
+        app.config["STORE_PARSED_CONTENT"] = True
+        hl7: str = Path("tests/samples/A01.hl7").read_text()
+        with app.app_context():
+            receive_controller.create_and_process_hl7_message(_encode(hl7))
+        app.config["STORE_PARSED_CONTENT"] = False
+
+        mock_parse = mocker.spy(parser, "parse_hl7_message")
+        with app.app_context():
+            assert (
+                receive_controller.process_pending_hl7_messages(min_age_seconds=0) == 1
+            )
+        mock_parse.assert_not_called()
+        mock_publish.assert_called_once()
@@ -0,0 +1,107 @@
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import pytest
+from flask.ctx import AppContext
+from pytest_mock import MockFixture
+
+from dhos_connector_api.blueprint_api.receive_controller import process_hl7_message
+from dhos_connector_api.helpers.adt_extractor import extract_fields
+from dhos_connector_api.helpers.errors import (
+    Hl7ApplicationErrorException,
+    Hl7ApplicationRejectException,
+)
+from dhos_connector_api.helpers.hl7_path import compile_path
+from dhos_connector_api.helpers.hl7_wrapper import Hl7Wrapper
+from dhos_connector_api.helpers.parser import (
+    ADT_FIELD_PATHS,
+    parse_hl7_message,
+    validate_hl7_message,
+)
+
+SAMPLES = sorted(p.name for p in Path("tests/samples").glob("*.hl7"))
+
+# Samples the fast extractor can't handle, so fall back to the hl7 library.
+FALLBACK_SAMPLES = {"A38.hl7"}
+
+
+def _summarise(wrapper: Hl7Wrapper) -> Dict[str, Any]:
+    summary: Dict[str, Any] = {
+        "message_type": wrapper.get_message_type_field(),
+        "message_control_id": wrapper.get_message_control_id(),
+        "sent_at": wrapper.get_message_datetime_iso8601(),
+        "fields": {p: wrapper.get_field_by_hl7_path(p) for p in ADT_FIELD_PATHS},
+        "ack": wrapper.generate_ack("AE", error_code="code", error_msg="msg"),
+    }
+    try:
+        validate_hl7_message(wrapper)
+        summary["patient_identifiers"] = wrapper.get_patient_identifiers_as_dict()
+        summary["processed"] = process_hl7_message("uuid", wrapper)
+    except (Hl7ApplicationErrorException, Hl7ApplicationRejectException) as e:
+        summary["error"] = (type(e).__name__, e.reason)
+    return summary
+
+
+@pytest.mark.nomockack
+@pytest.mark.freeze_time("2021-01-01T12:00:00")
+class TestAdtExtractor:
+    @pytest.fixture(autouse=True)
+    def fixed_control_id(self, mocker: MockFixture) -> None:
+        mocker.patch("hl7.containers.generate_message_control_id", return_value="1")
+
+    @pytest.mark.parametrize("sample", SAMPLES)
+    def test_same_output_as_hl7_library(
+        self, app_context: AppContext, sample: str
+    ) -> None:
+        content: str = Path("tests/samples", sample).read_text()
+        expected = _summarise(parse_hl7_message(content))
+        fast: Hl7Wrapper = parse_hl7_message(content, fast=True)
+        assert _summarise(fast) == expected
+        # The full parse tree is only built when falling back to the hl7 library.
+        assert (fast._parsed is not None) == (sample in FALLBACK_SAMPLES)
+
+    @pytest.mark.parametrize(
+        "replace,replacement",
+        [
+            ("ZZZEDUCATION", "ZZZ\\T\\EDUCATION"),  # Escape sequence
+            ("MSH|^~\\&|", "MSH|^~\\&#|"),  # Custom encoding characters
+        ],
+    )
+    def test_falls_back_to_hl7_library(
+        self, app_context: AppContext, replace: str, replacement: str
+    ) -> None:
+        content: str = Path("tests/samples/A01.hl7").read_text()
+        assert replace in content
+        content = content.replace(replace, replacement)
+        fast: Hl7Wrapper = parse_hl7_message(content, fast=True)
+        assert fast._parsed is not None
+        assert _summarise(fast) == _summarise(parse_hl7_message(content))
+
+    def test_unextracted_paths_use_hl7_library(self, app_context: AppContext) -> None:
+        content: str = Path("tests/samples/A01.hl7").read_text()
+        fast: Hl7Wrapper = parse_hl7_message(content, fast=True)
+        assert fast._parsed is None
+        assert fast.get_field_by_hl7_path("EVN.F2") == "20170731141300"
+        assert fast._parsed is not None
+
+    @pytest.mark.parametrize(
+        "path,expected",
+        [
+            ("PID.F5", "ZZZEDUCATION"),
+            ("PID.F5.R1.C7", "CURRENT"),
+            ("PID.F5.R1.C20", ""),
+            ("PID.F5.R1.C20.S2", None),
+            ("PID.F5.R2.C1", None),
+            ("PID.F1.R1.C2", None),
+            ("PID.F99", ""),
+            ("PID.F99.R1.C2", None),
+            ("ZZZ.F1", None),
+        ],
+    )
+    def test_extract_fields(self, path: str, expected: Optional[str]) -> None:
+        content: str = Path("tests/samples/A01.hl7").read_text().replace("\n", "\r")
+        compiled = compile_path(path)
+        extracted = extract_fields(content, paths=[compiled], repeated_paths=[])
+        assert extracted is not None
+        assert extracted.fields[compiled] == expected
+        assert Hl7Wrapper(content).get_field_by_hl7_path(path) == expected
@@ -156,6 +156,38 @@ class TestApi:
         )
         assert response.status_code == 200
 
+    def test_post_v1_hl7_batch_success(
+        self, client: Client, mock_bearer_authorization: Dict
+    ) -> None:
+        response = client.post(
+            "/dhos/v1/message/batch",
+            json={
+                "messages": [
+                    {"type": "HL7v2", "body": self.B64_BODY},
+                    {"type": "HL7v2", "body": self.B64_BODY},
+                ]
+            },
+            headers=mock_bearer_authorization,
+        )
+        assert response.status_code == 200
+        assert response.json is not None
+        assert len(response.json) == 2
+        assert all(r["type"] == "HL7v2" for r in response.json)
+
+    @pytest.mark.parametrize(
+        "request_body",
+        [{"messages": []}, {"messages": [{"type": "blargh", "body": B64_BODY}]}, {}],
+    )
+    def test_post_v1_hl7_batch_invalid(
+        self, client: Client, mock_bearer_authorization: Dict, request_body: Dict
+    ) -> None:
+        response = client.post(
+            "/dhos/v1/message/batch",
+            json=request_body,
+            headers=mock_bearer_authorization,
+        )
+        assert response.status_code == 400
+
     def test_post_hl7_failure_unknown_type(
         self, client: Client, mock_bearer_authorization: Dict
     ) -> None:
@@ -1,8 +1,10 @@
 from pathlib import Path
-from typing import Any, Dict
+from typing import Any, Dict, Generator
+from xml.etree import ElementTree
 
 import flask
 import pytest
+import requests
 from flask import Flask
 from flask.testing import FlaskClient
 from mock import Mock
@@ -10,15 +12,26 @@ from pytest_mock import MockFixture
 from requests import Session
 from requests_mock import Mocker
 from zeep import Client
+from zeep.exceptions import Fault
 
+from dhos_connector_api.blueprint_api import transmit_controller
 from dhos_connector_api.blueprint_api.transmit_controller import (
     CustomTransport,
     create_and_save_cda_message,
     post_hl7_message,
 )
+from dhos_connector_api.helpers import mirth
+from dhos_connector_api.models.failed_request import FailedRequest
 from dhos_connector_api.models.hl7_message import Hl7Message
 
 
+@pytest.fixture(autouse=True)
+def clear_mirth_client() -> Generator[None, None, None]:
+    transmit_controller.clear_mirth_client()
+    yield
+    transmit_controller.clear_mirth_client()
+
+
 @pytest.fixture
 def mock_xsd(requests_mock: Mocker) -> Any:
     xsdfile = Path(__file__).parent / "xmlcda" / "Mirth.xsd"
@@ -110,6 +123,14 @@ def test_endpoint(
     assert response == "ok"
 
 
+def _soap_body(envelope: bytes) -> bytes:
+    body = ElementTree.fromstring(envelope).find(
+        "{http://schemas.xmlsoap.org/soap/envelope/}Body"
+    )
+    assert body is not None
+    return ElementTree.tostring(body)
+
+
 class TestTransmitControllerCDA:
     @pytest.mark.usefixtures("app", "mock_generate_message_control_id")
     def test_save_cda_message(self, cdaccd_xml: str) -> None:
@@ -173,3 +194,143 @@ class TestTransmitControllerCDA:
             headers=mock_bearer_authorization,
         )
         assert response.status_code == status_code
+
+    def test_cda_message_route_send_failure_queued(
+        self,
+        client: FlaskClient,
+        mocker: MockFixture,
+        mock_mirth_envs: None,
+        jwt_system: str,
+        mock_bearer_authorization: Dict,
+    ) -> None:
+        mocker.patch.object(
+            transmit_controller,
+            "_do_send_cda_message",
+            side_effect=requests.exceptions.ConnectionError("Connection refused"),
+        )
+        response = client.post(
+            flask.url_for("api.create_cda_message"),
+            json={"content": "some xml", "type": "HL7v3CDA"},
+            headers=mock_bearer_authorization,
+        )
+        assert response.status_code == 201
+        failed_request = FailedRequest.query.one()
+        message = Hl7Message.query.filter_by(dst_description="mirth").one()
+        assert failed_request.type == "cda_message"
+        assert failed_request.identifier == message.uuid
+        assert failed_request.call_args == {"hl7_message_uuid": message.uuid}
+        assert failed_request.hard_fail is False
+
+    def test_mirth_client_reused(
+        self,
+        app: Flask,
+        cdaccd_xml: str,
+        mock_mirth_post_local: Mock,
+    ) -> None:
+        post_hl7_message(create_and_save_cda_message(cdaccd_xml))
+        with app.app_context():
+            client = transmit_controller._get_mirth_client()
+        post_hl7_message(create_and_save_cda_message(cdaccd_xml))
+        with app.app_context():
+            assert transmit_controller._get_mirth_client() is client
+        assert mock_mirth_post_local.call_count == 2
+        assert mock_mirth_post_local.last_request.headers["Authorization"].startswith(
+            "Basic "
+        )
+
+    def test_wsdl_cached_on_disk(
+        self,
+        app: Flask,
+        mock_wsdl: Mock,
+        mock_xsd: Mock,
+        cdaccd_xml: str,
+        mock_mirth_post_local: Mock,
+        tmp_path: Path,
+    ) -> None:
+        app.config["MIRTH_WSDL_CACHE_PATH"] = str(tmp_path / "wsdl_cache.db")
+        post_hl7_message(create_and_save_cda_message(cdaccd_xml))
+        # As if the service had been restarted.
+        transmit_controller.clear_mirth_client()
+        post_hl7_message(create_and_save_cda_message(cdaccd_xml))
+        app.config["MIRTH_WSDL_CACHE_PATH"] = None
+        assert mock_mirth_post_local.call_count == 2
+        assert mock_wsdl.call_count == 1
+        assert mock_xsd.call_count == 1
+
+    def test_post_hl7_message_templated_soap(
+        self,
+        app: Flask,
+        mock_wsdl: Mock,
+        cdaccd_xml: str,
+        mock_mirth_post: Mock,
+        mock_mirth_post_local: Mock,
+    ) -> None:
+        post_hl7_message(create_and_save_cda_message(cdaccd_xml))
+        app.config["MIRTH_TEMPLATED_SOAP"] = True
+        message_uuid: str = create_and_save_cda_message(cdaccd_xml)
+        post_hl7_message(message_uuid)
+        app.config["MIRTH_TEMPLATED_SOAP"] = False
+        assert Hl7Message.query.get(message_uuid).is_processed is True
+        # The templated request has the same body as the one built by zeep.
+        assert mock_mirth_post.call_count == 1
+        assert mock_mirth_post.last_request.headers["Authorization"].startswith(
+            "Basic "
+        )
+        assert _soap_body(mock_mirth_post.last_request.body) == _soap_body(
+            mock_mirth_post_local.last_request.body
+        )
+
+    def test_post_hl7_message_templated_soap_fault(
+        self,
+        app: Flask,
+        mock_mirth_envs: None,
+        cdaccd_xml: str,
+        requests_mock: Mocker,
+    ) -> None:
+        requests_mock.post(
+            "http://localhost:8081/services/Mirth",
+            status_code=500,
+            text="""<?xml version="1.0"?>
+            <S:Envelope xmlns:S="http://schemas.xmlsoap.org/soap/envelope/">
+                <S:Body><S:Fault>
+                    <faultcode>S:Server</faultcode>
+                    <faultstring>Channel not deployed</faultstring>
+                </S:Fault></S:Body>
+            </S:Envelope>""",
+        )
+        app.config["MIRTH_TEMPLATED_SOAP"] = True
+        message_uuid: str = create_and_save_cda_message(cdaccd_xml)
+        with pytest.raises(Fault, match="Channel not deployed"):
+            post_hl7_message(message_uuid)
+        app.config["MIRTH_TEMPLATED_SOAP"] = False
+        assert Hl7Message.query.get(message_uuid).is_processed is False
+
+    @pytest.mark.parametrize(
+        "return_element",
+        [
+            # Mirth's return element is unqualified, as in its WSDL.
+            "<return>ok</return>",
+            '<m:return xmlns:m="http://ws.connectors.connect.mirth.com/">ok</m:return>',
+        ],
+    )
+    def test_send_accept_message_return(
+        self, requests_mock: Mocker, return_element: str
+    ) -> None:
+        requests_mock.post(
+            "http://localhost:8081/services/Mirth",
+            text=f"""<?xml version="1.0"?>
+            <S:Envelope xmlns:S="http://schemas.xmlsoap.org/soap/envelope/">
+                <S:Body>
+                    <ns2:acceptMessageResponse
+                        xmlns:ns2="http://ws.connectors.connect.mirth.com/">
+                        {return_element}
+                    </ns2:acceptMessageResponse>
+                </S:Body>
+            </S:Envelope>""",
+        )
+        response = mirth.send_accept_message(
+            requests.Session(),
+            "http://localhost:8081/services/Mirth",
+            "<ClinicalDocument/>",
+        )
+        assert response == "ok"
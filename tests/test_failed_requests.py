@@ -0,0 +1,204 @@
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import pytest
+from flask import Flask
+from flask_batteries_included.helpers.error_handler import ServiceUnavailableException
+from flask_batteries_included.sqldb import db
+from pytest_mock import MockFixture
+
+from dhos_connector_api.blueprint_api import transmit_controller
+from dhos_connector_api.helpers import failed_requests
+from dhos_connector_api.models.failed_request import FailedRequest
+from dhos_connector_api.models.hl7_message import Hl7Message
+
+# Calls made to `_send`, and whether it should fail.
+sent: List[str] = []
+send_fails: bool = False
+
+
+def _send(value: str) -> None:
+    sent.append(value)
+    if send_fails:
+        raise ConnectionError("Connection refused")
+
+
+def _make_due(identifier: str) -> None:
+    failed_request = FailedRequest.query.filter_by(identifier=identifier).one()
+    failed_request.next_retry_at = datetime.utcnow() - timedelta(seconds=1)
+    db.session.commit()
+
+
+@pytest.mark.usefixtures("app")
+class TestFailedRequests:
+    @pytest.fixture(autouse=True)
+    def reset_send(self) -> None:
+        global send_fails
+        sent.clear()
+        send_fails = False
+
+    def _add(self, identifier: str) -> None:
+        failed_requests.add_failed_request(
+            request_type="test",
+            identifier=identifier,
+            fn=_send,
+            call_args={"value": identifier},
+            reason="Connection refused",
+        )
+        db.session.commit()
+
+    def test_retried_when_due(self) -> None:
+        self._add("first")
+        self._add("second")
+        # Not due until after the retry delay.
+        assert failed_requests.retry_batch(batch_size=10) == 0
+        _make_due("first")
+        assert failed_requests.retry_batch(batch_size=10) == 1
+        assert sent == ["first"]
+        first = FailedRequest.query.filter_by(identifier="first").one()
+        assert first.succeeded is True
+        assert first.next_retry_at is None
+        # Succeeded requests aren't retried again.
+        _make_due("first")
+        assert failed_requests.retry_batch(batch_size=10) == 0
+
+    def test_backoff_then_hard_fail(self, app: Flask) -> None:
+        global send_fails
+        send_fails = True
+        app.config["MAX_REQUEST_FAILS"] = 3
+        base: float = app.config["FAILED_REQUEST_RETRY_BASE_SEC"]
+        self._add("request")
+        delays: List[float] = []
+        for _ in range(2):
+            failed_request = FailedRequest.query.filter_by(identifier="request").one()
+            delays.append(
+                (
+                    failed_request.next_retry_at - failed_request.last_fail_time
+                ).total_seconds()
+            )
+            _make_due("request")
+            assert failed_requests.retry_batch(batch_size=10) == 1
+        assert delays == [base, base * 2]
+        failed_request = FailedRequest.query.filter_by(identifier="request").one()
+        assert failed_request.fail_count == 3
+        assert failed_request.hard_fail is True
+        assert failed_request.last_fail_reason == "Connection refused"
+        assert sent == ["request"] * 2
+
+    def test_retried_concurrently(self, mocker: MockFixture) -> None:
+        # The retries themselves don't use the database here, so can run on threads even
+        # though the test database can't be shared between them.
+        for identifier in ["a", "b", "c"]:
+            self._add(identifier)
+            _make_due(identifier)
+        assert failed_requests.retry_batch(batch_size=2, workers=2) == 2
+        assert failed_requests.retry_batch(batch_size=2, workers=2) == 1
+        assert sorted(sent) == ["a", "b", "c"]
+        assert FailedRequest.query.filter_by(succeeded=True).count() == 3
+
+    def _add_pending(
+        self, app: Flask, identifier: str, partition_key: Optional[str] = None
+    ) -> Tuple[int, datetime]:
+        # Due straight away, as if the request had waited longer than the retry delay.
+        base: float = app.config["FAILED_REQUEST_RETRY_BASE_SEC"]
+        app.config["FAILED_REQUEST_RETRY_BASE_SEC"] = 0
+        pending: Tuple[int, datetime] = failed_requests.add_pending_request(
+            request_type="test",
+            identifier=identifier,
+            fn=_send,
+            call_args={"value": identifier},
+            partition_key=partition_key,
+        )
+        db.session.commit()
+        app.config["FAILED_REQUEST_RETRY_BASE_SEC"] = base
+        return pending
+
+    def test_pending_request_claimed_by_retry_worker(self, app: Flask) -> None:
+        request_id, due_at = self._add_pending(app, "request")
+        assert failed_requests.retry_batch(batch_size=10) == 1
+        # The background send finds that the retry worker has already made the request.
+        failed_requests.run_request(app, request_id, due_at)
+        assert sent == ["request"]
+        assert FailedRequest.query.one().succeeded is True
+
+    def test_pending_request_claimed_before_sending(
+        self, app: Flask, mocker: MockFixture
+    ) -> None:
+        request_id, due_at = self._add_pending(app, "request")
+        retried: List[int] = []
+        # The retry worker runs while the background send is in progress.
+        mocker.patch(
+            f"{__name__}._send",
+            side_effect=lambda value: retried.append(
+                failed_requests.retry_batch(batch_size=10)
+            ),
+        )
+        failed_requests.run_request(app, request_id, due_at)
+        assert retried == [0]
+        assert FailedRequest.query.one().succeeded is True
+
+    def test_pending_requests_made_in_partition_order(self, app: Flask) -> None:
+        global send_fails
+        first: Tuple[int, datetime] = self._add_pending(app, "first", "patient")
+        second: Tuple[int, datetime] = self._add_pending(app, "second", "patient")
+        self._add_pending(app, "other", "other patient")
+        send_fails = True
+        failed_requests.run_request(app, *first)
+        send_fails = False
+        # Held back until the first request for the patient has been made.
+        failed_requests.run_request(app, *second)
+        assert sent == ["first"]
+        _make_due("first")
+        assert failed_requests.retry_batch(batch_size=10) == 2
+        assert sorted(sent[1:]) == ["first", "other"]
+        assert failed_requests.retry_batch(batch_size=10) == 1
+        assert sent[-1] == "second"
+        assert FailedRequest.query.filter_by(succeeded=True).count() == 3
+
+    @pytest.mark.usefixtures("mock_trustomer_config")
+    def test_failed_oru_message_queued(
+        self, app: Flask, mocker: MockFixture, process_obs_set_message_body: Dict
+    ) -> None:
+        app.config["QUEUE_FAILED_ORU_MESSAGES"] = True
+        mocker.patch.object(
+            transmit_controller,
+            "get_epr_service_adapter_headers",
+            return_value={"some": "auth"},
+        )
+        mock_send = mocker.patch.object(
+            transmit_controller,
+            "_do_send_hl7_message",
+            side_effect=ServiceUnavailableException("EPR unavailable"),
+        )
+        data = process_obs_set_message_body["actions"][0]["data"]
+        transmit_controller.create_oru_message(data)
+        app.config["QUEUE_FAILED_ORU_MESSAGES"] = False
+
+        failed_request = FailedRequest.query.one()
+        assert failed_request.type == "oru_message"
+        assert failed_request.identifier == data["observation_set"]["uuid"]
+        assert failed_request.api_name == "post_hl7_message"
+
+        mock_send.side_effect = None
+        _make_due(failed_request.identifier)
+        assert failed_requests.retry_batch(batch_size=10) == 1
+        assert mock_send.call_count == 2
+        assert (
+            mock_send.call_args[1]["message_uuid"]
+            == Hl7Message.query.filter_by(dst_description="tie").one().uuid
+        )
+        assert FailedRequest.query.one().succeeded is True
+
+    @pytest.mark.usefixtures("mock_trustomer_config")
+    def test_failed_oru_message_not_queued_by_default(
+        self, mocker: MockFixture, process_obs_set_message_body: Dict
+    ) -> None:
+        mocker.patch.object(
+            transmit_controller,
+            "post_hl7_message",
+            side_effect=ServiceUnavailableException("EPR unavailable"),
+        )
+        data = process_obs_set_message_body["actions"][0]["data"]
+        with pytest.raises(ServiceUnavailableException):
+            transmit_controller.create_oru_message(data)
+        assert FailedRequest.query.count() == 0
@@ -1,13 +1,19 @@
 from typing import Dict, List, Optional
+from unittest.mock import Mock
 
 import pytest
 from pytest_mock import MockFixture
 
-from dhos_connector_api.helpers import generator, trustomer
+from dhos_connector_api.helpers import generator, obx_mapping, trustomer
 from dhos_connector_api.helpers.errors import Hl7ApplicationErrorException
+from dhos_connector_api.helpers.hl7_wrapper import Hl7Wrapper
 from dhos_connector_api.helpers.parser import generate_patient_action, parse_hl7_message
 
 
+def _template(key: str) -> obx_mapping.ObxTemplate:
+    return next(t for t in obx_mapping.compile_obx_mappings() if t.key == key)
+
+
 @pytest.mark.usefixtures(
     "app",
     "mock_generate_message_control_id",
@@ -87,6 +93,35 @@ class TestGenerator:
         expected = oru_message.replace("TRUST_TIE_ADT|TRUST", "REALLY_BAD|HL7_IS_BAD")
         assert result == expected
 
+    def test_generate_oru_message_obx_mappings(
+        self,
+        process_obs_set_message_body: Dict,
+        oru_message: str,
+        trustomer_config: Dict,
+    ) -> None:
+        trustomer_config["send_config"]["obx_mappings"] = {
+            "heart_rate": {"code": "PULSE", "score_code": None},
+            "bp_posture": None,
+        }
+        data = process_obs_set_message_body["actions"][0]["data"]
+        result = generator.generate_oru_message(
+            patient=data["patient"],
+            encounter=data["encounter"],
+            obs_set=data["observation_set"],
+            clinician=data["clinician"],
+        )
+        expected_segments: List[str] = []
+        obx_idx: int = 0
+        for segment in oru_message.split("\r"):
+            if "|HRScore|" in segment or "|BPPOS|" in segment:
+                continue
+            if segment.startswith("OBX|"):
+                # The OBX segments are renumbered.
+                obx_idx += 1
+                segment = f"OBX|{obx_idx}|{segment.split('|', 2)[2]}"
+            expected_segments.append(segment.replace("|NM|HR|", "|NM|PULSE|"))
+        assert result.split("\r") == expected_segments
+
     def test_generate_oru_message_garbage(self) -> None:
         with pytest.raises(KeyError):
             generator.generate_oru_message(
@@ -127,7 +162,10 @@ class TestGenerator:
         ] = "Normal Flexion"
         gcs_observation["observation_value"] = 13
         result: List[str] = generator._generate_obx_gcs(
-            obs_list=obs_set["observations"], collector="someone", start_idx=1
+            template=_template("consciousness_gcs"),
+            context=generator._OruContext(obs_set["observations"]),
+            collector="someone",
+            start_idx=1,
         )
         assert len(result) == 2
         assert result[0].startswith("OBX|1|CE|GCS-Motor||4^Normal Flexion|")
@@ -138,13 +176,64 @@ class TestGenerator:
             "observations"
         ][1]
         obs_set: List[Dict] = [hr_obs]
-        result: List[str] = generator._generate_obx_hr(
-            obs_list=obs_set, collector="someone", start_idx=1
+        result: List[str] = generator._generate_obx_observation(
+            template=_template("heart_rate"),
+            context=generator._OruContext(obs_set),
+            collector="someone",
+            start_idx=1,
         )
         assert len(result) == 2
         assert result[0].startswith("OBX|1|NM|HR||patient_refused|")
         assert result[1].startswith("OBX|2|NM|HRScore||0|")
 
+    def test_generate_oru_message_fetches_config_once(
+        self, process_obs_set_message_body: Dict, mock_trustomer_config: Mock
+    ) -> None:
+        data = process_obs_set_message_body["actions"][0]["data"]
+        for _ in range(2):
+            # The first message also compiles the HL7 timestamp formatter.
+            mock_trustomer_config.reset_mock()
+            generator.generate_oru_message(
+                patient=data["patient"],
+                encounter=data["encounter"],
+                obs_set=data["observation_set"],
+                clinician=data["clinician"],
+            )
+        assert mock_trustomer_config.call_count == 1
+
+    def test_context_uses_first_obs_of_each_type(
+        self, process_obs_set_message_body: Dict
+    ) -> None:
+        hr_obs: Dict = process_obs_set_message_body["actions"][0]["data"][
+            "observation_set"
+        ]["observations"][1]
+        empty_hr_obs: Dict = {
+            **hr_obs,
+            "observation_value": None,
+            "observation_string": None,
+            "patient_refused": False,
+        }
+        assert generator._OruContext([hr_obs, empty_hr_obs]).get_obs("heart_rate") is (
+            hr_obs
+        )
+        assert generator._OruContext([empty_hr_obs, hr_obs]).get_obs("heart_rate") is (
+            None
+        )
+        assert generator._OruContext([hr_obs]).get_obs("spo2") is None
+
+    @pytest.mark.parametrize(
+        "timestamp_format", ["%Y%m%d%H%M%S", "%Y%m%d%H%M%S.%L%z", "%L.%L"]
+    )
+    def test_context_hl7_datetime(
+        self, trustomer_config: Dict, timestamp_format: str
+    ) -> None:
+        trustomer_config["hl7_config"]["outgoing_timestamp_format"] = timestamp_format
+        context = generator._OruContext([])
+        for iso8601 in ["2019-10-22T01:02:03.456+0100", "2019-06-01T00:00:00.000Z"]:
+            assert context.hl7_datetime(iso8601) == Hl7Wrapper.iso8601_to_hl7_datetime(
+                iso8601
+            )
+
     @pytest.mark.parametrize(
         "input_str,output_str",
         [
@@ -179,7 +268,10 @@ class TestGenerator:
         ][3]
         obs_set: List[Dict] = [nc_obs]
         result: List[str] = generator._generate_obx_nurse_concern(
-            obs_list=obs_set, collector="someone", start_idx=1
+            template=_template("nurse_concern"),
+            context=generator._OruContext(obs_set),
+            collector="someone",
+            start_idx=1,
         )
         assert len(result) == 1
         assert result[0].startswith(
@@ -193,7 +285,10 @@ class TestGenerator:
         nc_obs["observation_string"] = "Infection?, Pallor or Cyanosis"
         obs_set: List[Dict] = [nc_obs]
         result: List[str] = generator._generate_obx_nurse_concern(
-            obs_list=obs_set, collector="someone", start_idx=1
+            template=_template("nurse_concern"),
+            context=generator._OruContext(obs_set),
+            collector="someone",
+            start_idx=1,
         )
         assert len(result) == 2
         assert result[0].startswith(
@@ -212,7 +307,10 @@ class TestGenerator:
         nc_obs["observation_string"] = "Infection?,Pallor or Cyanosis"
         obs_set: List[Dict] = [nc_obs]
         result: List[str] = generator._generate_obx_nurse_concern(
-            obs_list=obs_set, collector="someone", start_idx=1
+            template=_template("nurse_concern"),
+            context=generator._OruContext(obs_set),
+            collector="someone",
+            start_idx=1,
         )
         assert len(result) == 2
         assert result[0].startswith(
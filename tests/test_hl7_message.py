@@ -3,7 +3,9 @@ from datetime import datetime
 import pytest
 from flask_batteries_included.helpers.timestamp import parse_datetime_to_iso8601
 from flask_batteries_included.sqldb import db
+from pytest_mock import MockFixture
 
+from dhos_connector_api.helpers import parser
 from dhos_connector_api.models.hl7_message import Hl7Message
 
 
@@ -78,3 +80,20 @@ class TestHl7Message:
             "modified_by": None,
             "ack_status": "AA",
         }
+
+    def test_ack_status_set_with_ack(self, mocker: MockFixture) -> None:
+        msg = Hl7Message(
+            ack="MSH|^~\\&|A|B|C|D|20190702171301||ACK^A01|1|P|2.3\rMSA|AE|2"
+        )
+        assert msg.ack_status_ == "AE"
+        msg.ack = "MSH|^~\\&|A|B|C|D|20190702171301||ACK^A01|1|P|2.3\nMSA|AR|2\nERR|||x"
+        assert msg.ack_status_ == "AR"
+        msg.ack = None
+        assert msg.ack_status_ is None
+
+        # Reading the status doesn't parse the ACK.
+        msg.ack = "MSH|^~\\&|A|B|C|D|20190702171301||ACK^A01|1|P|2.3\rMSA|AA|2"
+        spy = mocker.spy(parser, "parse_hl7_message")
+        assert msg.to_dict()["ack_status"] == "AA"
+        assert msg.ack_status() == "AA"
+        spy.assert_not_called()
@@ -0,0 +1,71 @@
+from pathlib import Path
+
+import hl7
+import pytest
+
+from dhos_connector_api.helpers.hl7_path import Hl7Path, compile_path
+from dhos_connector_api.helpers.hl7_wrapper import Hl7Wrapper
+from dhos_connector_api.helpers.parser import parse_hl7_message
+
+SAMPLE_PATHS = [
+    "MSH.F1",
+    "MSH.F2",
+    "MSH.F9",
+    "MSH.F9.R1.C2",
+    "MSH.F10.R1.C1",
+    "PID.F3.R2.C5",
+    "PID.F5.R1.C2",
+    "PID.F5.R1.C2.S1",
+    "PID.F7",
+    "PID.F29",
+    "PV1.F3.R1.C3",
+    "PV1.F6.R1.C1",
+    "PV1.F44",
+    "PV1.F99",
+    "PV1.F99.R1.C2",
+    "PV1.F2.R1.C3",
+    "MRG.F1.R1.C1",
+]
+
+
+class TestHl7Path:
+    def test_compile_path(self) -> None:
+        path = compile_path("PV1.F6.R1.C3")
+        assert path == Hl7Path("PV1", 1, 6, 1, 3, None)
+        assert path.key == "PV1.6.1.3"
+        assert compile_path("PV1.F6.R1.C3") is path
+
+    def test_compile_path_invalid(self) -> None:
+        with pytest.raises(ValueError):
+            compile_path("PID.FX")
+
+    def test_with_repeat(self) -> None:
+        path = compile_path("PID.F3.R1.C5")
+        assert path.with_repeat(2) == compile_path("PID.F3.R2.C5")
+        assert path.with_repeat(2) is path.with_repeat(2)
+
+    @pytest.mark.parametrize(
+        "sample", sorted(p.name for p in Path("tests/samples").glob("*.hl7"))
+    )
+    def test_extract_matches_hl7_library(self, sample: str) -> None:
+        wrapper: Hl7Wrapper = parse_hl7_message(
+            Path("tests/samples", sample).read_text()
+        )
+        for key in SAMPLE_PATHS:
+            path = compile_path(key)
+            try:
+                expected = str(wrapper.parsed[key])
+            except (KeyError, IndexError):
+                expected = None
+            try:
+                actual = str(
+                    path.extract(wrapper.get_segment(path.segment), wrapper.parsed)
+                )
+            except (KeyError, IndexError):
+                actual = None
+            assert actual == expected, key
+
+    def test_extract_unescapes(self) -> None:
+        message = hl7.parse("MSH|^~\\&|A|B\rPID|1||||A\\T\\B^C")
+        path = compile_path("PID.F5.R1.C1")
+        assert path.extract(message.segment("PID"), message) == "A&B"
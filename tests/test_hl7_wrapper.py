@@ -1,10 +1,16 @@
+import copy
+import json
+from pathlib import Path
 from typing import Dict
+from unittest.mock import Mock
 
 import pytest
 from flask.ctx import AppContext
 from pytest_mock import MockFixture
+from requests_mock import Mocker
 
-from dhos_connector_api.helpers import trustomer
+from dhos_connector_api.helpers import hl7_wrapper, trustomer
+from dhos_connector_api.helpers.hl7_path import compile_path
 from dhos_connector_api.helpers.hl7_wrapper import Hl7Wrapper
 
 
@@ -19,9 +25,79 @@ class TestHl7Wrapper:
             a01_message_wrapped.get_field_by_hl7_path("PID.F5.R1.C1") == "ZZZEDUCATION"
         )
 
+    def test_get_field_by_hl7_path_memoised(
+        self, a01_message_wrapped: Hl7Wrapper, mocker: MockFixture
+    ) -> None:
+        spy = mocker.spy(a01_message_wrapped, "_resolve_field")
+        for _ in range(3):
+            assert (
+                a01_message_wrapped.get_field_by_hl7_path("PV1.F3.R1.C1")
+                == "NOC-Ward B"
+            )
+            assert a01_message_wrapped.get_field_by_hl7_path("PV1.F999.R1.C2") is None
+            assert (
+                a01_message_wrapped.get_field_by_hl7_path("PV1.F999.R1.C2", "x") == "x"
+            )
+        assert spy.call_count == 2
+
+    def test_get_segment(self, a01_message_wrapped: Hl7Wrapper) -> None:
+        assert (
+            str(a01_message_wrapped.get_segment("PID")[5])
+            == "ZZZEDUCATION^STEPHEN^^^^^CURRENT"
+        )
+        with pytest.raises(KeyError):
+            a01_message_wrapped.get_segment("ZZZ")
+
     def test_get_json_string(self, a01_message_wrapped: Hl7Wrapper) -> None:
         assert len(a01_message_wrapped.get_json_string()) == 3354
 
+    @pytest.mark.parametrize(
+        "sample", sorted(p.name for p in Path("tests/samples").glob("*.hl7"))
+    )
+    def test_from_parsed_representation(self, sample: str) -> None:
+        content = Path("tests/samples", sample).read_text().replace("\n", "\r")
+        wrapper = Hl7Wrapper(content)
+        representation = json.loads(json.dumps(wrapper.to_parsed_representation()))
+
+        rebuilt = Hl7Wrapper.from_parsed_representation(content, representation)
+        assert rebuilt.parsed == wrapper.parsed
+        assert str(rebuilt.parsed) == str(wrapper.parsed)
+        assert rebuilt.get_json_string() == wrapper.get_json_string()
+        assert (
+            rebuilt.get_patient_identifiers_as_dict()
+            == wrapper.get_patient_identifiers_as_dict()
+        )
+        assert rebuilt.get_segment("MSH")(2) == wrapper.get_segment("MSH")(2)
+
+    def test_from_parsed_representation_fields(
+        self, a01_message_wrapped: Hl7Wrapper
+    ) -> None:
+        representation = a01_message_wrapped.to_parsed_representation(
+            [compile_path("PID.F5.R1.C1"), compile_path("ZZZ.F1")]
+        )
+        assert representation["fields"] == {
+            "PID.5.1.1": "ZZZEDUCATION",
+            "ZZZ.1": None,
+        }
+
+        # Stored fields are used as they are, without being looked up in the segments.
+        representation["fields"]["PID.5.1.1"] = "STORED"
+        rebuilt = Hl7Wrapper.from_parsed_representation(
+            a01_message_wrapped.raw_message, representation
+        )
+        assert rebuilt.get_field_by_hl7_path("PID.F5.R1.C1") == "STORED"
+        assert rebuilt.get_field_by_hl7_path("PID.F5.R1.C2") == "STEPHEN"
+
+    def test_from_parsed_representation_unknown_version(
+        self, a01_message_wrapped: Hl7Wrapper
+    ) -> None:
+        representation = a01_message_wrapped.to_parsed_representation()
+        representation["version"] = 0
+        with pytest.raises(ValueError):
+            Hl7Wrapper.from_parsed_representation(
+                a01_message_wrapped.raw_message, representation
+            )
+
     def test_get_message_type_field(self, a01_message_wrapped: Hl7Wrapper) -> None:
         assert a01_message_wrapped.get_message_type_field() == "ADT^A01"
 
@@ -134,3 +210,61 @@ class TestHl7Wrapper:
         )
         assert ack_msg.startswith("MSH|^~\\&|OXON_TIE_ADT|OXON|c0481")
         assert ack_msg.endswith("ERR|||error_code|E||||this is an error")
+
+
+@pytest.mark.usefixtures("app")
+class TestHl7DatetimeFormatter:
+    @pytest.mark.parametrize(
+        "timestamp_format, expected",
+        [
+            ("%Y%m%d%H%M%S", "20191022000203"),
+            ("%Y%m%d%H%M%S.%L%z", "20191022000203.456+0000"),
+            ("%L.%L", "456.456"),
+        ],
+    )
+    def test_from_iso8601(self, timestamp_format: str, expected: str) -> None:
+        formatter = hl7_wrapper.Hl7DatetimeFormatter(timestamp_format, "UTC")
+        assert formatter.from_iso8601("2019-10-22T01:02:03.456+0100") == expected
+        assert formatter.from_iso8601("") == ""
+
+    def test_from_iso8601_list(self, mocker: MockFixture) -> None:
+        formatter = hl7_wrapper.Hl7DatetimeFormatter("%Y%m%d%H%M", "Europe/London")
+        spy = mocker.spy(formatter, "from_iso8601")
+        iso8601_list = [
+            "2019-06-01T12:00:00.000Z",
+            "2019-12-01T12:00:00.000Z",
+            "2019-06-01T12:00:00.000Z",
+        ]
+        assert formatter.from_iso8601_list(iso8601_list) == [
+            "201906011300",
+            "201912011200",
+            "201906011300",
+        ]
+        assert spy.call_count == 2
+
+    def test_formatter_cached_per_timezone(self, mock_trustomer_config: Mock) -> None:
+        formatter = hl7_wrapper.get_hl7_datetime_formatter("UTC")
+        assert hl7_wrapper.get_hl7_datetime_formatter("UTC") is formatter
+        assert hl7_wrapper.get_hl7_datetime_formatter("Europe/London") is not formatter
+        assert mock_trustomer_config.call_count == 2
+
+    def test_formatter_cleared_when_config_changes(
+        self, requests_mock: Mocker, trustomer_config: Dict
+    ) -> None:
+        trustomer._cache.clear()
+        trustomer_config["hl7_config"]["outgoing_timestamp_format"] = "%Y%m%d"
+        requests_mock.get(
+            f"{trustomer.get_trustomer_base_url()}/dhos/v1/trustomer/test",
+            json=trustomer_config,
+        )
+        iso8601 = "2019-10-22T00:02:03.456+0000"
+        assert Hl7Wrapper.iso8601_to_hl7_datetime(iso8601, "UTC") == "20191022"
+        # The same config again doesn't clear the cached formatter.
+        formatter = hl7_wrapper.get_hl7_datetime_formatter("UTC")
+        trustomer._cache._store(copy.deepcopy(trustomer_config))
+        assert hl7_wrapper.get_hl7_datetime_formatter("UTC") is formatter
+
+        trustomer_config["hl7_config"]["outgoing_timestamp_format"] = "%Y%m%d%H%M"
+        trustomer._cache._store(trustomer_config)
+        assert Hl7Wrapper.iso8601_to_hl7_datetime(iso8601, "UTC") == "201910220002"
+        trustomer._cache.clear()
@@ -0,0 +1,77 @@
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from typing import Any, Generator, List
+
+import pytest
+from flask import Flask
+from pytest_mock import MockFixture
+
+from dhos_connector_api.helpers import http_client
+
+
+class _FlakyHandler(BaseHTTPRequestHandler):
+    # Statuses to respond with, in order. Once used up, responds with 200.
+    statuses: List[int] = []
+    requests: List[str] = []
+
+    def _respond(self) -> None:
+        self.requests.append(self.command)
+        if self.headers.get("Content-Length"):
+            self.rfile.read(int(self.headers["Content-Length"]))
+        status: int = self.statuses.pop(0) if self.statuses else 200
+        self.send_response(status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    do_GET = _respond
+    do_POST = _respond
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+
+@pytest.mark.usefixtures("app_context")
+class TestHttpClient:
+    @pytest.fixture(autouse=True)
+    def sessions(self, app: Flask) -> Generator[None, None, None]:
+        app.config["HTTP_RETRY_BACKOFF_FACTOR"] = 0
+        http_client.close_sessions()
+        yield
+        http_client.close_sessions()
+
+    @pytest.fixture
+    def server_url(self) -> Generator[str, None, None]:
+        _FlakyHandler.statuses = []
+        _FlakyHandler.requests = []
+        server = HTTPServer(("127.0.0.1", 0), _FlakyHandler)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        yield f"http://127.0.0.1:{server.server_address[1]}"
+        server.shutdown()
+        server.server_close()
+
+    def test_session_per_destination(self) -> None:
+        session = http_client.get_session("trustomer")
+        assert http_client.get_session("trustomer") is session
+        assert http_client.get_session("epr_service_adapter") is not session
+
+    def test_new_sessions_after_fork(self, mocker: MockFixture) -> None:
+        session = http_client.get_session("trustomer")
+        mocker.patch.object(
+            http_client.os, "getpid", return_value=http_client.os.getpid() + 1
+        )
+        assert http_client.get_session("trustomer") is not session
+
+    def test_idempotent_request_retried(self, server_url: str) -> None:
+        _FlakyHandler.statuses = [503, 502]
+        response = http_client.get_session("trustomer").get(server_url, timeout=5)
+        assert response.status_code == 200
+        assert _FlakyHandler.requests == ["GET"] * 3
+
+    def test_post_not_retried(self, server_url: str) -> None:
+        _FlakyHandler.statuses = [503]
+        response = http_client.get_session("epr_service_adapter").post(
+            server_url, json={}, timeout=5
+        )
+        assert response.status_code == 503
+        assert _FlakyHandler.requests == ["POST"]
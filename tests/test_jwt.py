@@ -1,3 +1,4 @@
+import threading
 from datetime import datetime
 from typing import List
 
@@ -8,6 +9,7 @@ from flask_batteries_included.helpers.error_handler import ServiceUnavailableExc
 from jose import jwt
 from pytest_mock import MockFixture
 
+from dhos_connector_api.helpers import jwt as jwt_helper
 from dhos_connector_api.helpers.jwt import get_epr_service_adapter_headers, get_scope
 
 
@@ -36,3 +38,52 @@ class TestJwt:
         app.config["MOCK_EPR_SERVICE_ADAPTER_SCOPE"] = None
         with pytest.raises(ServiceUnavailableException):
             get_scope()
+
+    def test_token_cached(self, app: Flask, mocker: MockFixture) -> None:
+        mock_get_value = mocker.patch.object(
+            dhosredis, "get_value", return_value="test-scope"
+        )
+        cache = jwt_helper._token_cache
+        first = get_epr_service_adapter_headers()
+        second = get_epr_service_adapter_headers()
+        assert first["Authorization"] == second["Authorization"]
+        assert first["X-Request-ID"] != second["X-Request-ID"]
+        assert mock_get_value.call_count == 1
+        assert (cache.hits, cache.misses) == (1, 1)
+
+    def test_token_renewed_before_expiry(self, app: Flask, mocker: MockFixture) -> None:
+        mock_get_value = mocker.patch.object(
+            dhosredis, "get_value", return_value="test-scope"
+        )
+        mock_monotonic = mocker.patch.object(jwt_helper.time, "monotonic")
+        mock_monotonic.return_value = 1000.0
+        get_epr_service_adapter_headers()
+        # Still more than JWT_RENEW_BEFORE_EXPIRY_SEC from expiring.
+        mock_monotonic.return_value += (
+            app.config["JWT_EXPIRY_IN_SECONDS"]
+            - app.config["JWT_RENEW_BEFORE_EXPIRY_SEC"]
+            - 1
+        )
+        get_epr_service_adapter_headers()
+        assert mock_get_value.call_count == 1
+        mock_monotonic.return_value += 1
+        get_epr_service_adapter_headers()
+        assert mock_get_value.call_count == 2
+
+    def test_token_cache_counted_across_threads(
+        self, app: Flask, mocker: MockFixture
+    ) -> None:
+        mocker.patch.object(dhosredis, "get_value", return_value="test-scope")
+        cache = jwt_helper.EprTokenCache()
+        cache.get()
+
+        def get_tokens() -> None:
+            for _ in range(1000):
+                cache.get()
+
+        threads = [threading.Thread(target=get_tokens) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert (cache.hits, cache.misses) == (8000, 1)
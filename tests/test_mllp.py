@@ -0,0 +1,92 @@
+import socket
+from pathlib import Path
+from typing import Generator
+from unittest.mock import Mock
+
+import kombu_batteries_included
+import pytest
+from flask import Flask
+from pytest_mock import MockFixture
+
+from dhos_connector_api.helpers.mllp import (
+    END_BLOCK,
+    START_BLOCK,
+    MllpServer,
+    frame_message,
+    unframe_message,
+)
+from dhos_connector_api.models.hl7_message import Hl7Message
+
+
+def _receive_frame(sock: socket.socket) -> bytes:
+    data = b""
+    while not data.endswith(END_BLOCK):
+        chunk = sock.recv(4096)
+        if not chunk:
+            break
+        data += chunk
+    return data
+
+
+class TestMllp:
+    def test_frame_message(self) -> None:
+        assert frame_message("MSH|1\nPID|2") == b"\x0bMSH|1\rPID|2\x1c\x0d"
+
+    def test_unframe_message(self) -> None:
+        assert unframe_message(b"\x0bMSH|1\rPID|2\x1c\x0d") == "MSH|1\rPID|2"
+
+    @pytest.mark.parametrize(
+        "frame", [b"MSH|1\x1c\x0d", b"\x0bMSH|1", b"\x0b\xff\x1c\x0d"]
+    )
+    def test_unframe_message_invalid(self, frame: bytes) -> None:
+        with pytest.raises(ValueError):
+            unframe_message(frame)
+
+
+class TestMllpServer:
+    @pytest.fixture(autouse=True)
+    def mock_publish(self, mocker: MockFixture) -> Mock:
+        return mocker.patch.object(kombu_batteries_included, "publish_message")
+
+    @pytest.fixture
+    def mllp_server(self, app: Flask) -> Generator[MllpServer, None, None]:
+        server = MllpServer(app, host="127.0.0.1", port=0, max_workers=1)
+        server.start()
+        yield server
+        server.stop()
+
+    @pytest.mark.nomockack
+    def test_receive_messages(
+        self, app: Flask, mllp_server: MllpServer, mock_publish: Mock
+    ) -> None:
+        hl7: str = Path("tests/samples/A01.hl7").read_text()
+        with socket.create_connection(("127.0.0.1", mllp_server.port), timeout=5) as s:
+            # Send the same message twice on one connection, the second is a duplicate.
+            s.sendall(frame_message(hl7))
+            first_ack = unframe_message(_receive_frame(s))
+            s.sendall(frame_message(hl7))
+            second_ack = unframe_message(_receive_frame(s))
+
+        assert "MSA|AA|" in first_ack
+        assert "MSA|AR|" in second_ack
+        assert mock_publish.call_count == 1
+        with app.app_context():
+            assert Hl7Message.query.count() == 2
+
+    def test_unparseable_message_closes_connection(
+        self, mllp_server: MllpServer
+    ) -> None:
+        with socket.create_connection(("127.0.0.1", mllp_server.port), timeout=5) as s:
+            s.sendall(START_BLOCK + b"\xff\xfe" + END_BLOCK)
+            assert _receive_frame(s) == b""
+
+    def test_reuse_port(self, app: Flask) -> None:
+        first = MllpServer(app, host="127.0.0.1", port=0, reuse_port=True)
+        first.start()
+        second = MllpServer(app, host="127.0.0.1", port=first.port, reuse_port=True)
+        try:
+            second.start()
+            assert second.port == first.port
+        finally:
+            second.stop()
+            first.stop()
@@ -0,0 +1,85 @@
+import copy
+from typing import Any, Dict
+
+import pytest
+from requests_mock import Mocker
+
+from dhos_connector_api.helpers import generator, obx_mapping, trustomer
+
+
+class TestObxMapping:
+    def test_default_templates(self) -> None:
+        templates = obx_mapping.compile_obx_mappings()
+        assert [t.key for t in templates] == list(obx_mapping.DEFAULT_OBX_MAPPINGS)
+        heart_rate = templates[0]
+        assert heart_rate.observation_types == ("heart_rate",)
+        assert heart_rate.prefix == "|NM|HR||"
+        assert heart_rate.score_prefix == "|NM|HRScore||"
+        assert heart_rate.score_required is True
+
+    def test_every_renderer_is_implemented(self) -> None:
+        assert obx_mapping.RENDERERS == generator._OBX_RENDERERS.keys()
+
+    def test_overrides(self) -> None:
+        templates = obx_mapping.compile_obx_mappings(
+            {
+                "heart_rate": {"code": "PULSE", "score_code": "PULSEScore"},
+                "bp_posture": None,
+                "blood_glucose": {"code": "BG", "value": "number"},
+            }
+        )
+        by_key = {t.key: t for t in templates}
+        assert "bp_posture" not in by_key
+        assert templates[-1] is by_key["blood_glucose"]
+        assert by_key["heart_rate"].prefix == "|NM|PULSE||"
+        assert by_key["heart_rate"].score_prefix == "|NM|PULSEScore||"
+        assert by_key["blood_glucose"].score_code is None
+        assert by_key["blood_glucose"].observation_types == ("blood_glucose",)
+
+    @pytest.mark.parametrize(
+        ["key", "mapping"],
+        [
+            ("blood_glucose", {"code": "X", "renderer": "unknown"}),
+            ("blood_glucose", {"code": "X", "value": "unknown"}),
+            ("blood_glucose", {"code": "X", "colour": "blue"}),
+            ("blood_glucose", {"code": "X|Y"}),
+            ("blood_glucose", {"value": "number"}),
+            ("consciousness_gcs", {"score_code": "GCSScore"}),
+            ("nurse_concern", {"value": "coded_string"}),
+            ("bp_posture", {"unit": False}),
+            # The default score code isn't supported once the renderer is changed.
+            ("heart_rate", {"renderer": "nurse_concern"}),
+        ],
+    )
+    def test_invalid_mapping(self, key: str, mapping: Dict[str, Any]) -> None:
+        with pytest.raises(ValueError):
+            obx_mapping.compile_obx_mappings({key: mapping})
+
+    def test_unsupported_fields_left_as_defaults(self) -> None:
+        templates = obx_mapping.compile_obx_mappings(
+            {
+                "consciousness_gcs": {"code": "GCS2", "score_code": None},
+                "heart_rate": {"renderer": "nurse_concern", "score_code": None},
+            }
+        )
+        by_key = {t.key: t for t in templates}
+        assert by_key["consciousness_gcs"].code == "GCS2"
+        assert by_key["heart_rate"].renderer == "nurse_concern"
+
+    @pytest.mark.usefixtures("app")
+    def test_templates_cleared_when_config_changes(
+        self, requests_mock: Mocker, trustomer_config: Dict
+    ) -> None:
+        trustomer._cache.clear()
+        requests_mock.get(
+            f"{trustomer.get_trustomer_base_url()}/dhos/v1/trustomer/test",
+            json=trustomer_config,
+        )
+        templates = obx_mapping.get_obx_templates(trustomer.get_trustomer_config())
+        assert obx_mapping.get_obx_templates(trustomer_config) is templates
+
+        changed_config = copy.deepcopy(trustomer_config)
+        changed_config["send_config"]["obx_mappings"] = {"heart_rate": {"code": "HR2"}}
+        trustomer._cache._store(changed_config)
+        assert obx_mapping.get_obx_templates(changed_config)[0].code == "HR2"
+        trustomer._cache.clear()
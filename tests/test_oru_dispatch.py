@@ -0,0 +1,222 @@
+import copy
+import random
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, Generator, List, Tuple
+from unittest.mock import Mock
+
+import pytest
+from flask import Flask
+from flask_batteries_included.helpers.error_handler import ServiceUnavailableException
+from flask_batteries_included.sqldb import db
+from pytest_mock import MockFixture
+
+from dhos_connector_api.blueprint_api import transmit_controller
+from dhos_connector_api.helpers import failed_requests
+from dhos_connector_api.helpers.background import BoundedDispatcher
+from dhos_connector_api.models.failed_request import FailedRequest
+from dhos_connector_api.models.hl7_message import Hl7Message
+
+
+class TestBoundedDispatcher:
+    def test_limits_concurrency_per_destination(self) -> None:
+        dispatcher = BoundedDispatcher(
+            max_workers=4, max_per_destination=2, thread_name_prefix="test"
+        )
+        lock = threading.Lock()
+        running: Dict[str, int] = {"a": 0, "b": 0}
+        peak: Dict[str, int] = {"a": 0, "b": 0}
+
+        def task(destination: str) -> None:
+            with lock:
+                running[destination] += 1
+                peak[destination] = max(peak[destination], running[destination])
+            time.sleep(0.01)
+            with lock:
+                running[destination] -= 1
+
+        for _ in range(6):
+            for destination in ("a", "b"):
+                dispatcher.submit(destination, task, destination)
+        dispatcher.shutdown(wait=True)
+        assert peak == {"a": 2, "b": 2}
+
+    def test_blocked_destination_does_not_hold_workers(self) -> None:
+        dispatcher = BoundedDispatcher(
+            max_workers=2, max_per_destination=1, thread_name_prefix="test"
+        )
+        release = threading.Event()
+        done = threading.Event()
+        for _ in range(3):
+            dispatcher.submit("slow", release.wait, 5)
+        # Only one worker is used by the slow destination, so this runs straight away.
+        dispatcher.submit("fast", done.set)
+        assert done.wait(timeout=5)
+        release.set()
+        dispatcher.shutdown(wait=True)
+
+    def test_ordered_within_partition_parallel_across(self) -> None:
+        dispatcher = BoundedDispatcher(
+            max_workers=8, max_per_destination=6, thread_name_prefix="test"
+        )
+        rng = random.Random(1234)
+        lock = threading.Lock()
+        sent: Dict[str, List[int]] = {f"patient-{p}": [] for p in range(10)}
+        running: List[int] = [0]
+        peak: List[int] = [0]
+
+        def send(patient: str, seq: int, delay: float) -> None:
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            time.sleep(delay)
+            with lock:
+                running[0] -= 1
+                sent[patient].append(seq)
+
+        # Interleaved observation sets for each patient, which take varying times to send.
+        for seq in range(20):
+            for patient in rng.sample(list(sent), k=len(sent)):
+                dispatcher.submit_ordered(
+                    "epr", patient, send, patient, seq, rng.uniform(0, 0.003)
+                )
+        dispatcher.shutdown(wait=True)
+        assert sent == {patient: list(range(20)) for patient in sent}
+        assert 1 < peak[0] <= 6
+
+    def test_ordered_task_failure_does_not_block_partition(self) -> None:
+        dispatcher = BoundedDispatcher(
+            max_workers=2, max_per_destination=2, thread_name_prefix="test"
+        )
+        results: List[int] = []
+
+        def task(i: int) -> None:
+            if i == 0:
+                raise ValueError("Failed")
+            results.append(i)
+
+        for i in range(3):
+            dispatcher.submit_ordered("epr", "patient", task, i)
+        dispatcher.shutdown(wait=True)
+        assert results == [1, 2]
+
+    def test_requires_a_worker(self) -> None:
+        with pytest.raises(ValueError):
+            BoundedDispatcher(
+                max_workers=1, max_per_destination=0, thread_name_prefix="test"
+            )
+
+
+class DeferredDispatcher:
+    """
+    Stands in for the BoundedDispatcher, running tasks when shut down rather than in
+    background threads (the sqlite test database can't be shared between threads).
+    """
+
+    def __init__(self) -> None:
+        self.tasks: List[Tuple[str, str, Callable, Tuple]] = []
+
+    def submit_ordered(
+        self, destination: str, partition_key: str, fn: Callable, *args: Any
+    ) -> None:
+        self.tasks.append((destination, partition_key, fn, args))
+
+    def shutdown(self, wait: bool = True) -> None:
+        for _, _, fn, args in self.tasks:
+            fn(*args)
+        self.tasks = []
+
+
+@pytest.mark.usefixtures("app", "mock_trustomer_config")
+class TestAsyncOruSending:
+    @pytest.fixture(autouse=True)
+    def dispatcher(self, app: Flask) -> Generator[DeferredDispatcher, None, None]:
+        dispatcher = DeferredDispatcher()
+        app.config["ASYNC_ORU_SENDING"] = True
+        app.extensions[transmit_controller.ORU_DISPATCHER_KEY] = dispatcher
+        yield dispatcher
+        app.config["ASYNC_ORU_SENDING"] = False
+        del app.extensions[transmit_controller.ORU_DISPATCHER_KEY]
+
+    @pytest.fixture
+    def mock_send(self, mocker: MockFixture) -> Mock:
+        mocker.patch.object(
+            transmit_controller,
+            "get_epr_service_adapter_headers",
+            return_value={"some": "auth"},
+        )
+        return mocker.patch.object(transmit_controller, "_do_send_hl7_message")
+
+    def test_sent_in_background(
+        self,
+        dispatcher: DeferredDispatcher,
+        mock_send: Mock,
+        process_obs_set_message_body: Dict,
+    ) -> None:
+        transmit_controller.create_oru_message(
+            process_obs_set_message_body["actions"][0]["data"]
+        )
+        # The message and the request to send it are saved before it is sent.
+        mock_send.assert_not_called()
+        message_uuid: str = Hl7Message.query.filter_by(dst_description="tie").one().uuid
+        pending = FailedRequest.query.one()
+        assert pending.identifier == message_uuid
+        assert pending.fail_count == 0
+        data: Dict = process_obs_set_message_body["actions"][0]["data"]
+        assert pending.partition_key == data["patient"]["uuid"]
+        assert [task[:2] for task in dispatcher.tasks] == [
+            ("epr_service_adapter", data["patient"]["uuid"])
+        ]
+
+        dispatcher.shutdown()
+        assert mock_send.call_args[1]["message_uuid"] == message_uuid
+        assert FailedRequest.query.one().succeeded is True
+
+    def test_failed_send_retried_later(
+        self,
+        dispatcher: DeferredDispatcher,
+        mock_send: Mock,
+        process_obs_set_message_body: Dict,
+    ) -> None:
+        mock_send.side_effect = ServiceUnavailableException("EPR unavailable")
+        transmit_controller.create_oru_message(
+            process_obs_set_message_body["actions"][0]["data"]
+        )
+        dispatcher.shutdown()
+        failed_request = FailedRequest.query.one()
+        assert failed_request.fail_count == 1
+        assert failed_request.succeeded is False
+        assert failed_request.next_retry_at is not None
+
+    def test_sent_in_record_time_order(
+        self,
+        dispatcher: DeferredDispatcher,
+        mock_send: Mock,
+        process_obs_set_message_body: Dict,
+    ) -> None:
+        data: Dict = process_obs_set_message_body["actions"][0]["data"]
+        # An observation set recorded earlier (e.g. synced from an offline device) is
+        # received after a newer one for the same patient.
+        newer: Dict = copy.deepcopy(data)
+        newer["observation_set"]["uuid"] = "newer"
+        newer["observation_set"]["record_time"] = "2019-01-30T14:00:00.000Z"
+        older: Dict = copy.deepcopy(data)
+        older["observation_set"]["uuid"] = "older"
+        older["observation_set"]["record_time"] = "2019-01-30T14:30:00.000+01:00"
+        for obs_set in (newer, older):
+            transmit_controller.create_oru_message(obs_set)
+
+        # The newer message is held back until the older one has been sent.
+        dispatcher.shutdown()
+        assert mock_send.call_count == 1
+        for failed_request in FailedRequest.query.filter_by(succeeded=False):
+            failed_request.next_retry_at = datetime.utcnow()
+        db.session.commit()
+        assert failed_requests.retry_batch(batch_size=10) == 1
+        sent: List[str] = [
+            Hl7Message.query.get(c[1]["message_uuid"]).content
+            for c in mock_send.call_args_list
+        ]
+        assert ["older" in message for message in sent] == [True, False]
+        assert FailedRequest.query.filter_by(succeeded=True).count() == 2
@@ -0,0 +1,94 @@
+import base64
+from pathlib import Path
+from unittest.mock import Mock
+
+import kombu_batteries_included
+import pytest
+from flask import Flask
+from flask_batteries_included.sqldb import db
+from pytest_mock import MockFixture
+
+from dhos_connector_api.blueprint_api import receive_controller
+from dhos_connector_api.helpers import outbox
+from dhos_connector_api.models.outbox_message import OutboxMessage
+
+
+@pytest.mark.usefixtures("app")
+class TestOutbox:
+    @pytest.fixture(autouse=True)
+    def mock_publish(self, mocker: MockFixture) -> Mock:
+        return mocker.patch.object(kombu_batteries_included, "publish_message")
+
+    @pytest.fixture
+    def mock_publish_with_confirms(self, mocker: MockFixture) -> Mock:
+        return mocker.patch.object(outbox, "_publish_with_confirms")
+
+    @pytest.fixture
+    def use_outbox(self, app: Flask) -> None:
+        app.config["PUBLISH_VIA_OUTBOX"] = True
+
+    @pytest.fixture
+    def hl7_a01_encoded(self) -> str:
+        hl7: str = Path("tests/samples/A01.hl7").read_text()
+        return base64.b64encode(hl7.encode(encoding="utf8")).decode("utf8")
+
+    @pytest.mark.usefixtures("use_outbox")
+    def test_receive_writes_to_outbox(
+        self, mock_publish: Mock, hl7_a01_encoded: str
+    ) -> None:
+        actual = receive_controller.create_and_process_hl7_message(hl7_a01_encoded)
+        # Second message is a duplicate, so nothing should be added to the outbox for it.
+        receive_controller.create_and_process_hl7_message(hl7_a01_encoded)
+
+        mock_publish.assert_not_called()
+        messages = OutboxMessage.query.all()
+        assert len(messages) == 1
+        assert messages[0].routing_key == "dhos.24891000000101"
+        assert messages[0].body["dhos_connector_message_uuid"] == actual["uuid"]
+
+    @pytest.mark.usefixtures("use_outbox")
+    def test_receive_batch_writes_to_outbox(
+        self, mock_publish: Mock, hl7_a01_encoded: str
+    ) -> None:
+        actual = receive_controller.create_and_process_hl7_messages(
+            [hl7_a01_encoded, hl7_a01_encoded]
+        )
+        mock_publish.assert_not_called()
+        messages = OutboxMessage.query.all()
+        assert len(messages) == 1
+        assert messages[0].body["dhos_connector_message_uuid"] == actual[0]["uuid"]
+
+    def test_publish_batch(self, mock_publish_with_confirms: Mock) -> None:
+        for i in range(3):
+            outbox.add_message(routing_key="dhos.test", body={"i": i})
+        db.session.commit()
+        assert outbox.publish_batch(batch_size=2) == 2
+        published = mock_publish_with_confirms.call_args[0][0]
+        assert [m.body for m in published] == [{"i": 0}, {"i": 1}]
+        assert [m.body for m in OutboxMessage.query.all()] == [{"i": 2}]
+
+    def test_publish_batch_failure_keeps_messages(
+        self, mock_publish_with_confirms: Mock
+    ) -> None:
+        mock_publish_with_confirms.side_effect = OSError("broker unavailable")
+        outbox.add_message(routing_key="dhos.test", body={"i": 0})
+        db.session.commit()
+        with pytest.raises(OSError):
+            outbox.publish_batch(batch_size=10)
+        assert OutboxMessage.query.count() == 1
+
+    def test_publish_outbox_command(
+        self, app: Flask, mock_publish_with_confirms: Mock
+    ) -> None:
+        with app.app_context():
+            for i in range(5):
+                outbox.add_message(routing_key="dhos.test", body={"i": i})
+            db.session.commit()
+
+        result = app.test_cli_runner().invoke(
+            args=["publish-outbox", "--batch-size", "2", "--once"]
+        )
+        assert result.exit_code == 0
+        assert mock_publish_with_confirms.call_count == 3
+        with app.app_context():
+            assert OutboxMessage.query.count() == 0
@@ -0,0 +1,80 @@
+import os
+import signal
+import urllib.request
+from typing import Callable, Generator, List, Tuple
+from unittest.mock import Mock
+
+import pytest
+from flask import Flask
+
+from dhos_connector_api.helpers.prefork import PreforkServer, RequestCounter
+
+
+@pytest.fixture
+def pid_app() -> Flask:
+    app = Flask(__name__)
+    app.add_url_rule("/pid", "pid", lambda: str(os.getpid()))
+    return app
+
+
+def _get_pid(port: int) -> int:
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}/pid", timeout=10) as response:
+        return int(response.read())
+
+
+class TestRequestCounter:
+    def test_calls_on_limit_once(self) -> None:
+        app = Mock(return_value=[b""])
+        on_limit = Mock()
+        counter = RequestCounter(app, max_requests=2, on_limit=on_limit)
+        for _ in range(3):
+            counter({}, Mock())
+        assert app.call_count == 3
+        on_limit.assert_called_once()
+
+
+class TestPreforkServer:
+    @pytest.fixture
+    def run_server(self, pid_app: Flask) -> Generator[Callable, None, None]:
+        supervisors: List[int] = []
+
+        def _run(**kwargs: int) -> Tuple[int, int]:
+            server = PreforkServer(pid_app, host="127.0.0.1", port=0, **kwargs)
+            port: int = server.bind()
+            pid: int = os.fork()
+            if pid == 0:
+                try:
+                    server.run()
+                finally:
+                    os._exit(0)
+            supervisors.append(pid)
+            return pid, port
+
+        yield _run
+        for pid in supervisors:
+            try:
+                os.kill(pid, signal.SIGTERM)
+                os.waitpid(pid, 0)
+            except (ProcessLookupError, ChildProcessError):
+                pass
+
+    def test_serves_from_workers(self, run_server: Callable) -> None:
+        supervisor, port = run_server(workers=2)
+        worker_pids = {_get_pid(port) for _ in range(10)}
+        assert supervisor not in worker_pids
+        assert os.getpid() not in worker_pids
+
+    def test_stops_gracefully(self, run_server: Callable) -> None:
+        supervisor, port = run_server(workers=2)
+        _get_pid(port)
+        os.kill(supervisor, signal.SIGTERM)
+        _, status = os.waitpid(supervisor, 0)
+        assert os.waitstatus_to_exitcode(status) == 0
+
+    def test_recycles_workers(self, run_server: Callable) -> None:
+        _, port = run_server(workers=1, max_requests=2)
+        # Every request succeeds while workers are replaced. A connection accepted just as a
+        # worker reaches its limit is still served by it, so workers can serve more than two.
+        pids = [_get_pid(port) for _ in range(6)]
+        assert pids[0] == pids[1]
+        assert len(set(pids)) >= 2
@@ -93,6 +93,58 @@ class TestHl7ReceiveController:
         assert results[1].message_control_id is None
         assert results[1].ack_status() == "AR"
 
+    def test_create_duplicate_hl7_message_no_rollback(
+        self, mocker: MockFixture, mock_publish: Mock, hl7_a01_encoded: str
+    ) -> None:
+        receive_controller.create_and_process_hl7_message(hl7_a01_encoded)
+        mock_rollback = mocker.patch.object(db.session, "rollback")
+        receive_controller.create_and_process_hl7_message(hl7_a01_encoded)
+        mock_rollback.assert_not_called()
+        assert mock_publish.call_count == 1
+        assert Hl7Message.query.count() == 2
+
+    @pytest.mark.nomockack
+    def test_create_hl7_message_batch(
+        self, mock_publish: Mock, hl7_a01_encoded: str
+    ) -> None:
+        a02_encoded: str = base64.b64encode(
+            Path("tests/samples/A02.hl7").read_bytes()
+        ).decode("utf8")
+        actual = receive_controller.create_and_process_hl7_messages(
+            [hl7_a01_encoded, a02_encoded, hl7_a01_encoded]
+        )
+        assert len(actual) == 3
+        ack_statuses = [
+            Hl7Message.query.get(response["uuid"]).ack_status() for response in actual
+        ]
+        assert ack_statuses == ["AA", "AA", "AR"]
+        assert "MSA|AR|" in base64.b64decode(actual[2]["body"]).decode("utf8")
+
+        # Only the valid messages are published, in the order they were received.
+        assert mock_publish.call_count == 2
+        published_uuids = [
+            c.kwargs["body"]["dhos_connector_message_uuid"]
+            for c in mock_publish.call_args_list
+        ]
+        assert published_uuids == [actual[0]["uuid"], actual[1]["uuid"]]
+
+        # The duplicate is saved without its message control ID.
+        assert Hl7Message.query.get(actual[2]["uuid"]).message_control_id is None
+        assert Hl7Message.query.count() == 3
+
+    def test_create_hl7_message_batch_unparseable(
+        self, mock_publish: Mock, hl7_a01_encoded: str
+    ) -> None:
+        bad_message: str = base64.b64encode(b"not valid base64")[:-1].decode("utf8")
+        with pytest.raises(ValueError):
+            receive_controller.create_and_process_hl7_messages(
+                [hl7_a01_encoded, bad_message]
+            )
+        # Only the unparseable message is saved, so the batch can be resent.
+        assert Hl7Message.query.count() == 1
+        assert Hl7Message.query.first().content == bad_message
+        mock_publish.assert_not_called()
+
     def test_update_hl7_message(self, mock_publish: Mock) -> None:
         msg = Hl7Message(
             uuid="someuuid",
@@ -112,6 +164,45 @@ class TestHl7ReceiveController:
         device = Hl7Message.query.filter_by(uuid="someuuid").first_or_404()
         assert device.is_processed is True
 
+    @pytest.mark.parametrize("sample", ["A01.hl7", "A34.hl7", "A38.hl7"])
+    def test_create_hl7_message_fast_extraction(
+        self, app: Flask, mock_publish: Mock, sample: str
+    ) -> None:
+        content: str = Path("tests/samples", sample).read_text()
+        receive_controller.create_and_process_raw_hl7_message(content)
+        expected = mock_publish.call_args.kwargs["body"]["actions"]
+
+        app.config["FAST_ADT_EXTRACTION"] = True
+        # Change the message control ID so the message isn't a duplicate.
+        receive_controller.create_and_process_raw_hl7_message(
+            content.replace("|P|2.", "X|P|2.")
+        )
+        app.config["FAST_ADT_EXTRACTION"] = False
+        assert mock_publish.call_count == 2
+        assert mock_publish.call_args.kwargs["body"]["actions"] == expected
+
+    def test_create_hl7_message_stores_parsed_content(
+        self, app: Flask, hl7_a01_encoded: str
+    ) -> None:
+        app.config["STORE_PARSED_CONTENT"] = True
+        result = receive_controller.create_and_process_hl7_message(hl7_a01_encoded)
+        app.config["STORE_PARSED_CONTENT"] = False
+        message = Hl7Message.query.filter_by(uuid=result["uuid"]).first()
+        assert message.content_parsed["fields"]["MSH.9.1.2"] == "A01"
+        assert message.content_parsed["fields"]["PV1.3.1.1"] == "NOC-Ward B"
+
+        rebuilt = Hl7Wrapper.from_parsed_representation(
+            message.content, message.content_parsed
+        )
+        assert rebuilt.parsed == parse_hl7_message(message.content).parsed
+
+    def test_create_hl7_message_parsed_content_not_stored(
+        self, hl7_a01_encoded: str
+    ) -> None:
+        result = receive_controller.create_and_process_hl7_message(hl7_a01_encoded)
+        message = Hl7Message.query.filter_by(uuid=result["uuid"]).first()
+        assert message.content_parsed is None
+
     def test_create_hl7_success_a01(
         self,
         mock_publish: Mock,
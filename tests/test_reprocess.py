@@ -0,0 +1,130 @@
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import List
+from unittest.mock import Mock
+
+import kombu_batteries_included
+import pytest
+from flask import Flask
+from pytest_mock import MockFixture
+
+from dhos_connector_api.blueprint_api import receive_controller
+from dhos_connector_api.models.hl7_message import Hl7Message
+from dhos_connector_api.models.outbox_message import OutboxMessage
+
+
+@pytest.mark.nomockack
+@pytest.mark.usefixtures("app")
+class TestReprocessHl7Messages:
+    @pytest.fixture
+    def message_uuids(self, mocker: MockFixture) -> List[str]:
+        # Two valid messages and one that was rejected, received in that order.
+        mock_publish = mocker.patch.object(kombu_batteries_included, "publish_message")
+        uuids: List[str] = []
+        for sample in ["A01.hl7", "A02.hl7"]:
+            receive_controller.create_and_process_raw_hl7_message(
+                Path("tests/samples", sample).read_text()
+            )
+            uuids.append(
+                mock_publish.call_args[1]["body"]["dhos_connector_message_uuid"]
+            )
+        rejected: str = (
+            Path("tests/samples/A03.hl7").read_text().replace("ADT^A03", "ORU^R01")
+        )
+        receive_controller.create_and_process_raw_hl7_message(rejected)
+        return uuids
+
+    @pytest.fixture
+    def mock_publish(self, message_uuids: List[str], mocker: MockFixture) -> Mock:
+        return mocker.patch.object(kombu_batteries_included, "publish_message")
+
+    def test_reprocess_all(self, message_uuids: List[str], mock_publish: Mock) -> None:
+        assert receive_controller.reprocess_hl7_messages() == 2
+        assert [
+            call[1]["body"]["dhos_connector_message_uuid"]
+            for call in mock_publish.call_args_list
+        ] == message_uuids
+
+    def test_reprocess_skips_rejected_duplicates(
+        self, message_uuids: List[str], mock_publish: Mock
+    ) -> None:
+        receive_controller.create_and_process_raw_hl7_message(
+            Path("tests/samples/A01.hl7").read_text()
+        )
+        duplicate = Hl7Message.query.order_by(Hl7Message.created.desc()).first()
+        assert duplicate.message_control_id is None
+        assert duplicate.ack_status() == "AR"
+        mock_publish.assert_not_called()
+
+        assert receive_controller.reprocess_hl7_messages() == 2
+        assert [
+            call[1]["body"]["dhos_connector_message_uuid"]
+            for call in mock_publish.call_args_list
+        ] == message_uuids
+
+    def test_reprocess_filters(
+        self, message_uuids: List[str], mock_publish: Mock
+    ) -> None:
+        assert receive_controller.reprocess_hl7_messages(message_type="ADT^A02") == 1
+        assert (
+            mock_publish.call_args[1]["body"]["dhos_connector_message_uuid"]
+            == message_uuids[1]
+        )
+        assert receive_controller.reprocess_hl7_messages(ack_status="AR") == 0
+        assert receive_controller.reprocess_hl7_messages(is_processed=True) == 0
+        assert (
+            receive_controller.reprocess_hl7_messages(
+                received_after=datetime.utcnow() + timedelta(hours=1)
+            )
+            == 0
+        )
+        assert (
+            receive_controller.reprocess_hl7_messages(
+                received_before=datetime.utcnow() + timedelta(hours=1)
+            )
+            == 2
+        )
+
+    def test_reprocess_throttled_batches(
+        self, message_uuids: List[str], mock_publish: Mock, mocker: MockFixture
+    ) -> None:
+        mock_sleep = mocker.patch.object(receive_controller.time, "sleep")
+        assert (
+            receive_controller.reprocess_hl7_messages(batch_size=1, batch_interval=2.5)
+            == 2
+        )
+        assert mock_publish.call_count == 2
+        # Two batches are read (the rejected message has no message control ID, so isn't),
+        # with a pause after each batch but the last.
+        assert mock_sleep.call_count == 1
+        mock_sleep.assert_called_with(2.5)
+
+    def test_reprocess_via_outbox(
+        self, app: Flask, message_uuids: List[str], mock_publish: Mock
+    ) -> None:
+        app.config["PUBLISH_VIA_OUTBOX"] = True
+        assert receive_controller.reprocess_hl7_messages() == 2
+        app.config["PUBLISH_VIA_OUTBOX"] = False
+        mock_publish.assert_not_called()
+        assert OutboxMessage.query.count() == 2
+
+    def test_reprocess_messages_command(
+        self, app: Flask, message_uuids: List[str], mock_publish: Mock
+    ) -> None:
+        result = app.test_cli_runner().invoke(
+            args=[
+                "reprocess-messages",
+                "--workers",
+                "2",
+                "--not-processed",
+                "--batch-interval",
+                "0",
+            ]
+        )
+        assert result.exit_code == 0, result.output
+        assert "Republished 2 messages" in result.output
+        assert [
+            call[1]["body"]["dhos_connector_message_uuid"]
+            for call in mock_publish.call_args_list
+        ] == message_uuids
+        assert Hl7Message.query.count() == 3
@@ -1,13 +1,27 @@
-from typing import Any
+import json
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Generator, List
+from unittest.mock import Mock
 
+import dhosredis
 import pytest
 import requests
+from flask import Flask
 from flask_batteries_included.helpers.error_handler import ServiceUnavailableException
+from pytest_mock import MockFixture
 from requests_mock import Mocker
 
 from dhos_connector_api.helpers import trustomer
 
 
+def _wait_for_refresh() -> None:
+    thread = trustomer._cache._refresh_thread
+    assert thread is not None
+    thread.join()
+
+
 @pytest.mark.usefixtures("app")
 class TestTrustomer:
     def test_get_config_success(
@@ -35,3 +49,167 @@ class TestTrustomer:
         with pytest.raises(ServiceUnavailableException):
             trustomer.get_trustomer_config()
         assert mock_get.call_count == 1
+
+    def test_get_config_single_flight(
+        self, app: Flask, requests_mock: Mocker, trustomer_config: dict
+    ) -> None:
+        trustomer._cache.clear()
+
+        def slow_response(request: Any, context: Any) -> dict:
+            time.sleep(0.1)
+            return trustomer_config
+
+        mock_get: Any = requests_mock.get(
+            f"{trustomer.get_trustomer_base_url()}/dhos/v1/trustomer/test",
+            json=slow_response,
+        )
+        results: List[dict] = []
+
+        def get_config() -> None:
+            with app.app_context():
+                results.append(trustomer.get_trustomer_config())
+
+        threads = [threading.Thread(target=get_config) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert results == [trustomer_config] * 5
+        assert mock_get.call_count == 1
+
+    def test_get_config_refreshed_in_background(
+        self, requests_mock: Mocker, trustomer_config: dict
+    ) -> None:
+        trustomer._cache.clear()
+        trustomer._cache._store({"old": "config"})
+        # Close enough to expiry that the config should be refreshed.
+        trustomer._cache._fetched_at -= trustomer._cache.ttl - 1
+        mock_get: Any = requests_mock.get(
+            f"{trustomer.get_trustomer_base_url()}/dhos/v1/trustomer/test",
+            json=trustomer_config,
+        )
+        assert trustomer.get_trustomer_config() == {"old": "config"}
+        _wait_for_refresh()
+        assert trustomer.get_trustomer_config() == trustomer_config
+        assert mock_get.call_count == 1
+
+    def test_get_config_stale_when_unavailable(self, requests_mock: Mocker) -> None:
+        trustomer._cache.clear()
+        trustomer._cache._store({"old": "config"})
+        trustomer._cache._fetched_at -= trustomer._cache.ttl + 1
+        mock_get: Any = requests_mock.get(
+            f"{trustomer.get_trustomer_base_url()}/dhos/v1/trustomer/test",
+            exc=requests.exceptions.ConnectionError,
+        )
+        assert trustomer.get_trustomer_config() == {"old": "config"}
+        _wait_for_refresh()
+        # The expired config is still used, without retrying straight away.
+        assert trustomer.get_trustomer_config() == {"old": "config"}
+        assert mock_get.call_count == 1
+
+    def test_get_config_from_snapshot(
+        self,
+        app: Flask,
+        requests_mock: Mocker,
+        trustomer_config: dict,
+        tmp_path: Path,
+    ) -> None:
+        snapshot_path = tmp_path / "trustomer.json"
+        app.config["TRUSTOMER_CONFIG_SNAPSHOT_PATH"] = str(snapshot_path)
+        trustomer._cache.clear()
+        assert trustomer.load_config_snapshot(app) is False
+
+        # Fetching the config saves a snapshot.
+        mock_get: Any = requests_mock.get(
+            f"{trustomer.get_trustomer_base_url()}/dhos/v1/trustomer/test",
+            json=trustomer_config,
+        )
+        assert trustomer.get_trustomer_config() == trustomer_config
+        assert json.loads(snapshot_path.read_text()) == {
+            "customer_code": "test",
+            "config": trustomer_config,
+        }
+
+        # After a restart, the snapshot is used straight away and refreshed in the background.
+        trustomer._cache.clear()
+        snapshot_path.write_text(
+            json.dumps({"customer_code": "test", "config": {"old": "config"}})
+        )
+        assert trustomer.load_config_snapshot(app) is True
+        assert trustomer.get_trustomer_config() == {"old": "config"}
+        _wait_for_refresh()
+        assert trustomer.get_trustomer_config() == trustomer_config
+        assert mock_get.call_count == 2
+        assert json.loads(snapshot_path.read_text())["config"] == trustomer_config
+        app.config["TRUSTOMER_CONFIG_SNAPSHOT_PATH"] = None
+
+    def test_snapshot_for_other_customer_ignored(
+        self, app: Flask, tmp_path: Path
+    ) -> None:
+        snapshot_path = tmp_path / "trustomer.json"
+        snapshot_path.write_text(
+            json.dumps({"customer_code": "other", "config": {"old": "config"}})
+        )
+        app.config["TRUSTOMER_CONFIG_SNAPSHOT_PATH"] = str(snapshot_path)
+        trustomer._cache.clear()
+        assert trustomer.load_config_snapshot(app) is False
+        assert trustomer._cache._config is None
+        app.config["TRUSTOMER_CONFIG_SNAPSHOT_PATH"] = None
+
+
+@pytest.mark.usefixtures("app")
+class TestSharedTrustomerConfigCache:
+    @pytest.fixture(autouse=True)
+    def redis(self, app: Flask, mocker: MockFixture) -> Generator[Dict, None, None]:
+        values: Dict[str, str] = {}
+        mocker.patch.object(
+            dhosredis,
+            "get_value",
+            side_effect=lambda key, default=None: values.get(key, default),
+        )
+        mocker.patch.object(
+            dhosredis,
+            "set_value",
+            side_effect=lambda key, value: values.__setitem__(key, value),
+        )
+        app.config["TRUSTOMER_CONFIG_SHARED_CACHE"] = True
+        trustomer.clear_cache()
+        yield values
+        app.config["TRUSTOMER_CONFIG_SHARED_CACHE"] = False
+        trustomer.clear_cache()
+
+    def test_fetched_once_for_all_processes(
+        self, requests_mock: Mocker, trustomer_config: dict, redis: Dict
+    ) -> None:
+        mock_get: Any = requests_mock.get(
+            f"{trustomer.get_trustomer_base_url()}/dhos/v1/trustomer/test",
+            json=trustomer_config,
+        )
+        assert trustomer.get_trustomer_config() == trustomer_config
+        assert set(redis) == {"TRUSTOMER_CONFIG_test", "TRUSTOMER_CONFIG_VERSION_test"}
+
+        # Another process starts with nothing cached, and gets the config from redis.
+        trustomer.clear_cache()
+        assert trustomer.get_trustomer_config() == trustomer_config
+        assert mock_get.call_count == 1
+
+    def test_new_version_loaded(self, redis: Dict) -> None:
+        fetch = Mock(return_value={"version": 1})
+        assert trustomer._shared_cache.get(fetch) == {"version": 1}
+
+        # Another process fetches a changed config.
+        other_process = trustomer.SharedTrustomerConfigCache(ttl=60, refresh_ahead=0)
+        other_process._save("test", {"version": 2})
+
+        assert trustomer._shared_cache.get(fetch) == {"version": 2}
+        fetch.assert_called_once()
+
+    def test_stale_when_unavailable(self, redis: Dict) -> None:
+        trustomer._shared_cache.get(Mock(return_value={"version": 1}))
+        version = redis["TRUSTOMER_CONFIG_VERSION_test"].split(":")[0]
+        redis["TRUSTOMER_CONFIG_VERSION_test"] = f"{version}:0"
+        trustomer.clear_cache()
+
+        fetch = Mock(side_effect=ServiceUnavailableException)
+        assert trustomer._shared_cache.get(fetch) == {"version": 1}
+        fetch.assert_called_once()